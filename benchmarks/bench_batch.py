@@ -0,0 +1,62 @@
+"""
+Benchmark of processDirectory (nepy.frida.batch): writes a directory of synthetic .nedf recordings and processes it
+sequentially, reading the next files ahead (prefetch) and with different numbers of worker processes, printing the
+wall time and the throughput (files per second, and speedup over the sequential run). The speedup of the workers is
+bounded by the number of cores of the machine, the one of prefetch by the share of the time spent reading the files
+(use --datapath to process a directory on network storage).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_batch [--files 16] [--minutes 5] [--channels 32] [--workers 1 2 4 8] [--prefetch 2]
+                                     [--datapath DIR]
+
+2019 Neuroelectrics Barcelona
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from nepy.frida.batch import processDirectory
+from nepy.tests.synthetic_data import writeNedf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=16)
+    parser.add_argument('--minutes', type=float, default=5.)
+    parser.add_argument('--channels', type=int, default=32)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--prefetch', type=int, default=2)
+    parser.add_argument('--datapath', default=None, help='directory of recordings (default: synthetic files)')
+    args = parser.parse_args()
+
+    datapath = args.datapath
+    if datapath is None:
+        datapath = tempfile.mkdtemp()
+        for ix in range(args.files):
+            writeNedf(os.path.join(datapath, 'rec{0:04d}.nedf'.format(ix)), num_channels=args.channels,
+                      samples=int(args.minutes * 60 * 500), seed=ix)
+        print("{0} files of {1} minutes, {2} channels".format(args.files, args.minutes, args.channels))
+    files = len([fil for fil in os.listdir(datapath) if fil.endswith((".easy", ".easy.gz", ".nedf"))])
+    print("{0} files, {1} cores".format(files, os.cpu_count()))
+
+    runs = [('sequential', {}), ('prefetch={0}'.format(args.prefetch), {'prefetch': args.prefetch})]
+    runs += [('workers={0}'.format(workers), {'workers': workers}) for workers in args.workers]
+    timings = []
+    for name, options in runs:
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            processed, skipped = processDirectory(datapath, plotit=False, **options)
+        timings.append(time.perf_counter() - t0)
+        print("{0:>12}: {1:8.2f} s, {2:6.2f} files/s, speedup {3:5.2f} x ({4} processed, {5} skipped)".format(
+            name, timings[-1], files / timings[-1], timings[0] / timings[-1], len(processed), len(skipped)))
+    if args.datapath is None:
+        shutil.rmtree(datapath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark of the .easy parser of easyReader against the original pandas read_csv(delim_whitespace=True) path.
+It writes a synthetic .easy file (see nepy/tests/synthetic_data.py), reads it with both implementations, checks that
+np_eeg, np_acc, np_markers and np_time are bit-identical and prints the timings and peak memory (tracemalloc).
+With --workers N, the .easy file is also parsed by a pool of N processes (peak memory of the main process only).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_easyReader [--minutes 10] [--channels 32] [--gz] [--workers 4]
+
+2019 Neuroelectrics Barcelona
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from nepy.readers.easyReader import easyReader
+from nepy.tests.synthetic_data import writeEasy
+
+
+def legacyL0Data(filepath):
+    """ The original easyReader.__get_l0_data parsing (files with accelerometer data), kept as reference."""
+    df = pd.read_csv(filepath, delim_whitespace=True, header=None)
+    num_channels = df.shape[1] - 5
+    df = df.astype('float64')
+    df.iloc[:, 0:num_channels] = df.iloc[:, 0:num_channels] / 1000  # now in uV
+    np_eeg = np.array(df, dtype="float32")[:, 0:num_channels]
+    t = (df.iloc[:, -1] - df.iloc[0, -1]) / 1000.
+    np_time = np.array(t, dtype="float32")
+    np_acc = np.array(df, dtype="float32")[:, num_channels:num_channels + 3]
+    np_markers = np.array(df, dtype="float32")[:, num_channels + 3]
+    return np_eeg, np_acc, np_markers, np_time
+
+
+def measure(function, *args):
+    """ Wall time (s) and peak traced memory (MB) of a call, and its result."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=10.)
+    parser.add_argument('--channels', type=int, default=32)
+    parser.add_argument('--gz', action='store_true', help='compressed .easy.gz file')
+    parser.add_argument('--workers', type=int, default=None, help='also parse with a pool of processes')
+    args = parser.parse_args()
+
+    samples = int(args.minutes * 60 * 500)
+    filepath = os.path.join(tempfile.mkdtemp(), 'bench.easy' + ('.gz' if args.gz else ''))
+    writeEasy(filepath, num_channels=args.channels, samples=samples)
+    print("File: {0} ({1:.1f} MB, {2} channels, {3} samples)".format(filepath, os.path.getsize(filepath) / 1e6,
+                                                                      args.channels, samples))
+
+    t_old, m_old, legacy = measure(legacyL0Data, filepath)
+    t_new, m_new, rdr = measure(easyReader, filepath, 'anonymous', False)
+
+    for name, old in zip(['np_eeg', 'np_acc', 'np_markers', 'np_time'], legacy):
+        new = getattr(rdr, name)
+        identical = old.shape == new.shape and old.dtype == new.dtype and old.tobytes() == new.tobytes()
+        print("{0:<11} {1!s:<14} bit-identical: {2}".format(name, new.shape, identical))
+
+    print("pandas read_csv (parse only):   {0:8.3f} s  peak {1:8.1f} MB".format(t_old, m_old))
+    print("easyReader (info + parse):      {0:8.3f} s  peak {1:8.1f} MB".format(t_new, m_new))
+    print("Speedup:                        {0:8.1f} x".format(t_old / t_new))
+
+    if args.workers and not args.gz:
+        t_par, m_par, par = measure(easyReader, filepath, 'anonymous', False, False, args.workers)
+        identical = all(getattr(rdr, name).tobytes() == getattr(par, name).tobytes()
+                        for name in ['np_eeg', 'np_acc', 'np_markers', 'np_time'])
+        print("easyReader ({0} workers):        {1:8.3f} s  peak {2:8.1f} MB  bit-identical: {3}".format(
+            args.workers, t_par, m_par, identical))
+        print("Speedup:                        {0:8.1f} x".format(t_old / t_par))
+    os.remove(filepath)
+    os.remove(filepath[:-8 if args.gz else -5] + '.info')
+
+
+if __name__ == '__main__':
+    main()
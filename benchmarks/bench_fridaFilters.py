@@ -0,0 +1,64 @@
+"""
+Benchmark of the Frida filters (nepy.frida.filters) against the original per channel filtfilt(b, a) loops of
+__bandpassfilter and __remove_line_freq. It filters a synthetic float32 recording with both implementations, prints the
+timings and the maximum difference of the outputs (see the tolerance in nepy.frida.filters), and the time of the fused
+notch and bandpass pass.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_fridaFilters [--minutes 10] [--channels 32]
+
+2019 Neuroelectrics Barcelona
+"""
+
+import argparse
+import time
+
+import numpy as np
+from scipy.signal import butter, filtfilt, iirnotch
+
+from nepy.frida.filters import bandpassSOS, notchSOS, zeroPhase
+from nepy.tests.synthetic_data import syntheticEEG
+
+
+def legacyFilter(b, a, eeg):
+    """ The original loop: filtfilt(b, a) channel by channel, in place."""
+    eeg = eeg.copy()
+    for ch in range(eeg.shape[1]):
+        eeg[:, ch] = filtfilt(b, a, eeg[:, ch])
+    return eeg
+
+
+def timeit(function, *args):
+    t0 = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=10.)
+    parser.add_argument('--channels', type=int, default=32)
+    args = parser.parse_args()
+
+    fs, line_freq, Q_notch, low, high, order = 500., 50., 30., 2., 45., 5
+    eeg = syntheticEEG(int(args.minutes * 60 * fs), args.channels)
+    print("Recording: {0} minutes, {1} channels, {2} samples".format(args.minutes, args.channels, eeg.shape[0]))
+
+    b, a = butter(order, [low / (fs / 2), high / (fs / 2)], btype='bandpass')
+    old_bp, t_old_bp = timeit(legacyFilter, b, a, eeg)
+    new_bp, t_new_bp = timeit(zeroPhase, bandpassSOS(low, high, fs, order), eeg)
+    b, a = iirnotch(line_freq, Q_notch, fs)
+    old_notch, t_old_notch = timeit(legacyFilter, b, a, eeg)
+    new_notch, t_new_notch = timeit(zeroPhase, notchSOS(line_freq, Q_notch, fs), eeg)
+    _, t_fused = timeit(zeroPhase, np.vstack([notchSOS(line_freq, Q_notch, fs), bandpassSOS(low, high, fs, order)]),
+                        eeg)
+
+    print("Bandpass: filtfilt loop {0:8.3f} s, SOS {1:8.3f} s, max difference {2:.2e} uV".format(
+        t_old_bp, t_new_bp, np.max(np.abs(old_bp - new_bp))))
+    print("Notch:    filtfilt loop {0:8.3f} s, SOS {1:8.3f} s, max difference {2:.2e} uV".format(
+        t_old_notch, t_new_notch, np.max(np.abs(old_notch - new_notch))))
+    print("Notch + bandpass: two SOS passes {0:8.3f} s, fused {1:8.3f} s".format(t_new_bp + t_new_notch, t_fused))
+
+
+if __name__ == '__main__':
+    main()
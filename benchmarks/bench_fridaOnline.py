@@ -0,0 +1,50 @@
+"""
+Benchmark of FridaOnline (real-time preprocessing): pushes a synthetic recording block by block, as it would arrive
+from the device, and prints the sustained throughput (samples per second, and times real time) and the latency of the
+blocks (median, 99th percentile and maximum).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_fridaOnline [--minutes 10] [--channels 32] [--block 25]
+
+2019 Neuroelectrics Barcelona
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from nepy.frida.online import FridaOnline
+from nepy.tests.synthetic_data import syntheticEEG
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=10.)
+    parser.add_argument('--channels', type=int, default=32)
+    parser.add_argument('--block', type=int, default=25, help='samples per block (25: 50 ms at 500 Hz)')
+    args = parser.parse_args()
+
+    fs = 500.
+    eeg = syntheticEEG(int(args.minutes * 60 * fs), args.channels)
+    electrodes = ['Ch{0}'.format(ch + 1) for ch in range(args.channels - 1)] + ['Cz']
+    online = FridaOnline(electrodes, fs=fs)
+    print("Recording: {0} minutes, {1} channels, blocks of {2} samples ({3:.0f} ms)".format(
+        args.minutes, args.channels, args.block, 1000 * args.block / fs))
+
+    latencies = []
+    t0 = time.perf_counter()
+    for first in range(0, len(eeg), args.block):
+        online.push(eeg[first:first + args.block])
+        latencies.append(online.latency)
+    elapsed = time.perf_counter() - t0
+
+    latencies = np.array(latencies) * 1000
+    print("Throughput: {0:.0f} samples/s x {1} channels ({2:.0f} x real time at {3:.0f} Hz)".format(
+        len(eeg) / elapsed, args.channels, len(eeg) / elapsed / fs, fs))
+    print("Latency per block: median {0:.3f} ms, 99th percentile {1:.3f} ms, max {2:.3f} ms".format(
+        np.median(latencies), np.percentile(latencies, 99), np.max(latencies)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of Frida.QC against its original loops (offsets and stds per channel, bad epochs per epoch and channel).
+It fills a Frida object with a synthetic recording (offsets, noise, drifts and artifacts, so that there are good, bad
+and borderline epochs), runs both implementations (offsets and stds of the channels, and bad epochs), checks that
+bad_records is identical (channels, epochs and values) and prints the timings.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_fridaQC [--minutes 60] [--channels 32]
+
+2019 Neuroelectrics Barcelona
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+from scipy.signal import detrend
+
+from nepy.frida.frida import Frida
+from nepy.tests.synthetic_data import writeNedf
+
+
+def legacyQC(eeg, fs, num_channels, p):
+    """ The original offsets, stds and bad epochs loop of Frida.QC (and __check_badepochs), kept as reference."""
+    offsets = [np.mean(eeg, axis=0)[ch] / 1000 for ch in range(0, eeg.shape[1])]  # mV
+    sigmas = [np.std(eeg, axis=0)[ch] for ch in range(0, eeg.shape[1])]  # uV
+    channel_data = np.transpose(eeg)
+    max_epochs = int((np.floor(channel_data.shape[1] / fs) - p['epoch_length']) / p['epoch_length'])
+    bad_records = []
+    for timeskip in range(0, max_epochs):
+        for channel in range(num_channels):
+            segment = np.array(np.arange(timeskip * p['epoch_length'] * fs,
+                                         timeskip * p['epoch_length'] * fs + p['epoch_length'] * fs), dtype="int32")
+            signal = channel_data[channel, segment].flatten()
+            w = np.max(np.abs(detrend(signal)))
+            std = np.std(detrend(signal))
+            if (w > p['epoch_amp_threshold']) or (std > p['epoch_std_threshold']):
+                bad_records.append([channel, timeskip, w, std])
+    return offsets, sigmas, bad_records
+
+
+def syntheticEEG(samples, channels, fs=500., seed=0):
+    """ EEG-like float32 data (uV): offsets, 10 Hz rhythm, noise, slow drifts and a few artifacts."""
+    rng = np.random.RandomState(seed)
+    t = np.arange(samples) / fs
+    eeg = rng.uniform(-5e4, 5e4, size=channels) + rng.normal(0, 1, size=(samples, channels)) * \
+        rng.uniform(3, 15, size=channels)
+    eeg += 10 * np.sin(2 * np.pi * 10 * t)[:, None] + 100 * np.sin(2 * np.pi * 0.01 * t)[:, None]
+    for start in rng.randint(0, samples - 500, size=samples // 10000):
+        eeg[start:start + 500, rng.randint(channels)] += rng.uniform(20, 150)
+    return eeg.astype("float32")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=60.)
+    parser.add_argument('--channels', type=int, default=32)
+    args = parser.parse_args()
+
+    filepath = os.path.join(tempfile.mkdtemp(), 'bench.nedf')
+    writeNedf(filepath, num_channels=args.channels, samples=15000)
+    with contextlib.redirect_stdout(io.StringIO()):
+        f = Frida(filepath)
+    f.eeg = syntheticEEG(int(args.minutes * 60 * f.c.fs), args.channels, f.c.fs)
+    print("Recording: {0} minutes, {1} channels, {2} samples".format(args.minutes, args.channels, f.eeg.shape[0]))
+
+    t0 = time.perf_counter()
+    offsets, sigmas, legacy = legacyQC(f.eeg, f.c.fs, f.c.num_channels, f.param)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        f.QC(plotit=False)
+    t_new = time.perf_counter() - t0
+
+    identical = len(legacy) == len(f.bad_records) and all(
+        old[0] == new[0] and old[1] == new[1] and old[2] == new[2] and old[3] == new[3]
+        for old, new in zip(legacy, f.bad_records))
+    print("Bad channel-epochs: {0} of {1}, identical: {2}".format(len(f.bad_records), f.c.num_channels * (
+        f.eeg.shape[0] // int(f.param['epoch_length'] * f.c.fs) - 1), identical))
+    eeg64 = f.eeg.astype(np.float64)
+    offsets64, sigmas64 = np.mean(eeg64, axis=0) / 1000, np.std(eeg64, axis=0)
+    for name, (off, sig) in [('original', (offsets, sigmas)), ('new', (f.offsets, f.sigmas))]:
+        print("Max offset/std error of the {0} QC (vs float64): {1:.2e} mV / {2:.2e} uV".format(
+            name, np.max(np.abs(np.subtract(off, offsets64))), np.max(np.abs(np.subtract(sig, sigmas64)))))
+    print("Original QC loops:  {0:8.3f} s".format(t_old))
+    print("Frida.QC:           {0:8.3f} s".format(t_new))
+    print("Speedup:            {0:8.1f} x".format(t_old / t_new))
+    os.remove(filepath)
+
+
+if __name__ == '__main__':
+    main()
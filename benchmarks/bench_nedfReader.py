@@ -0,0 +1,114 @@
+"""
+Benchmark of the .nedf record decoder of nedfReader against the original per byte loop.
+It writes a synthetic .nedf file (see nepy/tests/synthetic_data.py), decodes it with both implementations, checks that
+np_eeg, np_stim, np_acc and np_markers are bit-identical and prints the timings.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_nedfReader [--minutes 2] [--channels 32] [--stim]
+
+2019 Neuroelectrics Barcelona
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from nepy.readers.nedfReader import nedfReader
+from nepy.tests.synthetic_data import writeNedf
+
+
+def legacyProcessBytes(nedfbytes, samples, num_channels, isaccon, iseegon, isstimon):
+    """ The original nedfReader.__processBytes loop (one python call per byte), kept as reference."""
+    pos = [-1]
+
+    def getByte():
+        pos[0] += 1
+        return nedfbytes[pos[0]]
+
+    counteracc = 5
+    supereeg, superacc, superstim, supermarkers = [], [], [], []
+    for i in range(samples):
+        if isaccon:
+            if counteracc == 5:
+                counteracc = 1
+                accsample = []
+                for j in range(3):
+                    byte1 = getByte()
+                    byte2 = getByte()
+                    accvar = byte1 * 256 + byte2
+                    if byte1 >= 128:
+                        accvar = accvar - 65536
+                    accsample.append(accvar)
+                superacc.append(accsample)
+            else:
+                counteracc += 1
+        if iseegon:
+            eegsample = []
+            for j in range(num_channels):
+                byte1 = getByte()
+                byte2 = getByte()
+                byte3 = getByte()
+                eegvar = byte1 * 65536 + byte2 * 256 + byte3
+                if byte1 >= 128:
+                    eegvar = (16777216 * 255) + eegvar - (16777216 * 256)
+                eegvar = (eegvar * 2.4 * 1000000000) / 6.0 / 8388607.0
+                eegsample.append(eegvar)
+            supereeg.append(eegsample)
+        if isstimon:
+            for s in range(2):
+                stimsample = []
+                for j in range(num_channels):
+                    byte1 = getByte()
+                    byte2 = getByte()
+                    byte3 = getByte()
+                    stimvar = byte1 * 65536 + byte2 * 256 + byte3
+                    if byte1 >= 128:
+                        stimvar = (16777216 * 255) + stimvar - (16777216 * 256)
+                    stimsample.append(stimvar)
+                superstim.append(stimsample)
+        marker = getByte() * 16777216 + getByte() * 65536 + getByte() * 256 + getByte()
+        supermarkers.append(marker)
+    return (np.array(supereeg, dtype="float32") / 1000., np.array(superstim, dtype="float32"),
+            np.array(superacc, dtype="float32"), np.array(supermarkers, dtype="float32"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=2.)
+    parser.add_argument('--channels', type=int, default=32)
+    parser.add_argument('--stim', action='store_true', help='add stimulation records (Starstim file)')
+    args = parser.parse_args()
+
+    samples = int(args.minutes * 60 * 500)
+    filepath = os.path.join(tempfile.mkdtemp(), 'bench.nedf')
+    writeNedf(filepath, num_channels=args.channels, samples=samples, stim=args.stim)
+    print("File: {0} ({1:.1f} MB, {2} channels, {3} samples)".format(filepath, os.path.getsize(filepath) / 1e6,
+                                                                      args.channels, samples))
+
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        rdr = nedfReader(filepath)
+    t_new = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    legacy = legacyProcessBytes(rdr.nedfbytes, rdr.samples, rdr.num_channels, rdr.isaccon, rdr.iseegon, rdr.isstimon)
+    t_old = time.perf_counter() - t0
+
+    for name, old, new in zip(['np_eeg', 'np_stim', 'np_acc', 'np_markers'], legacy,
+                              [rdr.np_eeg, rdr.np_stim, rdr.np_acc, rdr.np_markers]):
+        identical = old.shape == new.shape and old.dtype == new.dtype and old.tobytes() == new.tobytes()
+        print("{0:<11} {1!s:<12} bit-identical: {2}".format(name, new.shape, identical))
+
+    print("Per byte loop (decode only):  {0:8.3f} s".format(t_old))
+    print("nedfReader (open + decode):   {0:8.3f} s".format(t_new))
+    print("Speedup:                      {0:8.1f} x".format(t_old / t_new))
+    os.remove(filepath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Cache of the decoded recordings of Capsule, so that a file that has already been read is not parsed (.easy) or decoded
+(.nedf) again. Every recording is kept in a directory of the cache with one numpy .npy file per array (np_eeg,
+np_acc, np_markers, np_stim, np_time), that are memory mapped when the recording is opened again, and a meta.json file
+with the Capsule metadata and the key of the entry: path, size and modification time of the file, and VERSION.
+
+An entry is valid while the key matches the file; a stale entry is removed when it is found. The total size of the
+cache can be limited, the least recently used entries are removed first.
+
+    >>> cache = CapsuleCache("/data/nepy_cache", max_bytes=20 * 2 ** 30)
+    >>> c = Capsule("easydata/20180213122712_Patient01.easy", cache=cache)
+
+The default cache directory of Capsule is taken from the NEPY_CACHE_DIR environment variable (no cache if it is not
+set).
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+# Bump when the readers change the arrays or the metadata they return, so that older entries are not used.
+VERSION = 1
+
+arrays = ['np_eeg', 'np_acc', 'np_markers', 'np_stim', 'np_time']
+metadata = ['eegstartdate', 'basename', 'fs', 'num_channels', 'electrodes', 'filenameroot']
+
+
+class CapsuleCache(object):
+    """
+    Description:
+    Directory of decoded recordings (see the module docstring).
+
+    Attributes:
+        cachedir:        directory of the cache (created if needed).
+        max_bytes:       size limit of the cache (bytes). None: no limit.
+    """
+    def __init__(self, cachedir, max_bytes=None):
+        self.cachedir = cachedir
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+    def __entry(self, filepath):
+        """ Directory of the entry of a file (one entry per absolute path)."""
+        path = os.path.abspath(filepath)
+        return os.path.join(self.cachedir, hashlib.sha1(path.encode('utf-8')).hexdigest()[:20])
+
+    @staticmethod
+    def key(filepath):
+        """ Key of the cache entry of a file: absolute path, size, modification time (ns) and VERSION."""
+        stat = os.stat(filepath)
+        return {'path': os.path.abspath(filepath), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'version': VERSION}
+
+    def get(self, filepath):
+        """
+        Returns the cached data of a file, or None if the file is not in the cache or the entry is stale (then it is
+        removed). The arrays are read-only memory maps of the cache files.
+        :return: dictionary with the np_ arrays and the metadata fields.
+        """
+        entry = self.__entry(filepath)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as fil:
+                meta = json.load(fil)
+        except (IOError, OSError, ValueError):
+            return None
+        if meta.get('key') != self.key(filepath):
+            self.invalidate(filepath)
+            return None
+
+        data = dict(meta['metadata'])
+        try:
+            for name in arrays:
+                arraypath = os.path.join(entry, name + '.npy')
+                data[name] = np.load(arraypath, mmap_mode='r' if os.path.getsize(arraypath) > 128 else None)
+        except (IOError, OSError, ValueError):
+            self.invalidate(filepath)
+            return None
+        try:
+            os.utime(os.path.join(entry, 'meta.json'))  # last use, for the LRU eviction (best effort)
+        except OSError:  # a read-only cache, or an entry evicted by another process
+            pass
+        return data
+
+    def put(self, filepath, capsule):
+        """
+        Saves the arrays and metadata of a Capsule of the file 'filepath'. The entry is written to a temporary
+        directory that is renamed when complete, so that other processes never see an incomplete entry. Then the
+        least recently used entries are removed until the cache fits in max_bytes.
+        """
+        entry = self.__entry(filepath)
+        tempentry = entry + '.tmp{0}'.format(os.getpid())
+        try:
+            os.makedirs(tempentry)
+            for name in arrays:
+                np.save(os.path.join(tempentry, name + '.npy'), np.asarray(getattr(capsule, name), dtype="float32"))
+            meta = {'key': self.key(filepath),
+                    'metadata': {name: getattr(capsule, name) for name in metadata},
+                    'created': time.strftime("%Y-%m-%d %H:%M")}
+            with open(os.path.join(tempentry, 'meta.json'), 'w') as fil:
+                json.dump(meta, fil, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+            self.invalidate(filepath)
+            os.rename(tempentry, entry)
+        except (IOError, OSError) as error:
+            print("\033[93m Warning! The recording could not be cached ({0}). \033[0m".format(error))
+            shutil.rmtree(tempentry, ignore_errors=True)
+            return
+        self.evict()
+
+    def invalidate(self, filepath=None):
+        """ Removes the entry of a file, or all the entries if filepath is None."""
+        if filepath is not None:
+            shutil.rmtree(self.__entry(filepath), ignore_errors=True)
+            return
+        for name in os.listdir(self.cachedir):
+            shutil.rmtree(os.path.join(self.cachedir, name), ignore_errors=True)
+
+    def entries(self):
+        """ List of (last use, bytes, entry directory) of the cache entries, least recently used first."""
+        entries = []
+        for name in os.listdir(self.cachedir):
+            entry = os.path.join(self.cachedir, name)
+            metapath = os.path.join(entry, 'meta.json')
+            if not os.path.isfile(metapath):
+                continue
+            nbytes = sum(os.path.getsize(os.path.join(entry, fil)) for fil in os.listdir(entry))
+            entries.append((os.path.getmtime(metapath), nbytes, entry))
+        return sorted(entries)
+
+    def size(self):
+        """ Total size of the cache entries (bytes)."""
+        return sum(nbytes for _, nbytes, _ in self.entries())
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache fits in max_bytes."""
+        if self.max_bytes is None:
+            return
+        entries = self.entries()
+        total = sum(nbytes for _, nbytes, _ in entries)
+        for _, nbytes, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= nbytes
+
+
+def defaultCache():
+    """ CapsuleCache of the NEPY_CACHE_DIR environment variable (size limit: NEPY_CACHE_MAX_BYTES), or None."""
+    cachedir = os.environ.get('NEPY_CACHE_DIR')
+    if not cachedir:
+        return None
+    max_bytes = os.environ.get('NEPY_CACHE_MAX_BYTES')
+    return CapsuleCache(cachedir, int(max_bytes) if max_bytes else None)
@@ -11,16 +11,23 @@ Created on Mon Nov 5 9:45:59 2018
 
 import time
 import os
+import weakref
 
+import numpy as np
+
+from nepy.capsule.cache import CapsuleCache, arrays, defaultCache
+from nepy.capsule.shared import attachArrays, releaseBlock, shareArrays
+from nepy.capsule.store import saveStore, storeReader
 from nepy.readers.easyReader import easyReader
-from nepy.readers.nedfReader import nedfReader
+from nepy.readers.nedfReader import nedfReader, nedfStream
 
 
 class Capsule(object):
     """
     Description:
     Capsule is a python Object that stores all information extracted from an .easy, .easy.gz, .info
-    (if available) or .nedf file. It uses 'easyReader' and 'nedfReader' functions from readers module to read the files.
+    (if available) or .nedf file, or from a NEPy store (.nestore, see save_store). It uses 'easyReader' and
+    'nedfReader' functions from readers module to read the files.
 
     Attributes:
         good_init        Flag to say that the file has been read correctly by the readers.
@@ -39,12 +46,38 @@ class Capsule(object):
         np_markers:      markers (if any)
         np_stim:         stim file, just if .nedf file.
         filenameroot:    root of the file / path
+        reader:          nedfReader or easyReader of the .nedf and .easy.gz files opened with lazy=True (None
+                         otherwise). Its readWindow and readRecords methods read a time window of the file without
+                         decoding the rest (.easy.gz files are indexed on their first lazy opening, see gzipIndex).
+                         The np_ arrays of lazy .easy.gz capsules are left empty. The reader of a store is always a
+                         storeReader, and its np_ arrays are storeStream objects (see store.py).
+        on_demand:       True if the np_ arrays are decoded on their first access (see release). The metadata is
+                         read from the header of the file (and the .info file), and every stream (np_eeg, np_stim, ...)
+                         is decoded when it is used: just that stream for .nedf files, all the streams of the text for
+                         .easy and .easy.gz files.
+        cached:          True if the data has been loaded from the cache (see cache.py). The np_ arrays are then
+                         read-only memory maps of the cache files.
         offsets:         from Frida check_offset_std() in QC()
         sigmas:          from Frida check_offset_std() in QC()
         PSD:             from Frida plotPSD()
         bad_records:     from Frida check_badepochs in QC()
+        shared:          SharedMemory block of the np_ arrays, after to_shared or attach (see shared.py), or None.
     """
-    def __init__(self, filepath, author="anonymous", verbose=True):
+    def __init__(self, filepath, author="anonymous", verbose=True, lazy=False, cache=None, on_demand=False):
+        """
+        :param filepath: .easy, .easy.gz or .nedf file, or a store (.nestore).
+        :param author: ("anonymous") user.
+        :param verbose: flag to print or not the information of the readers.
+        :param lazy: .nedf and .easy.gz files are not decoded, see the reader attribute.
+        :param cache: CapsuleCache or cache directory where the decoded data is kept, to be reused by the next
+                      openings of the file (see cache.py). None: cache of the NEPY_CACHE_DIR environment variable, if
+                      any. False: no cache.
+        :param on_demand: the np_ arrays are decoded on their first access, see the on_demand attribute. A recording
+                          in the cache is loaded from it, but a recording opened on demand is not added to the cache.
+        """
+        self.shared = None
+        self.on_demand = False
+        self.__source = None
 
         # 1. Does the file exist? If not, provide help.
         if os.path.isfile(filepath):
@@ -61,15 +94,42 @@ class Capsule(object):
             self.good_init = False
             return 
         
-        # 2. Find extension, and read file with help of readers.
+        # 2. Load the file from the cache, or find extension, and read file with help of readers.
+        if cache is None:
+            cache = defaultCache()
+        elif cache and not isinstance(cache, CapsuleCache):
+            cache = CapsuleCache(cache)
+        cached = cache.get(filepath) if cache else None
+        if cached is not None:
+            print("Loaded from the cache:", filepath)
+            self.good_init = True
+            self.author = author
+            self.capsuledate = time.strftime("%Y-%m-%d %H:%M")
+            self.filepath = filepath
+            for name in cached:
+                setattr(self, name, cached[name])
+            self.reader = None
+            self.cached = True
+            return
+
         if filepath.endswith(".easy.gz") or filepath.endswith(".easy"):
-            rdr = easyReader(filepath=filepath, author=author, verbose=verbose)
+            rdr = easyReader(filepath=filepath, author=author, verbose=verbose,
+                             header_only=on_demand or (lazy and filepath.endswith(".easy.gz")))
             self.good_init = True
         elif filepath.endswith(".nedf"):
-            rdr = nedfReader(filepath=filepath, author=author)
+            rdr = nedfReader(filepath=filepath, author=author, lazy=lazy or on_demand)
+            self.good_init = True
+        elif filepath.endswith(".nestore"):
+            try:
+                rdr = storeReader(filepath)
+            except (IOError, OSError, ValueError) as error:
+                print("\n\033[91mERROR @capsule __init__: {0}. Exiting.\033[0m \n".format(error))
+                self.good_init = False
+                return
+            on_demand = False  # the streams of a store are read by parts
             self.good_init = True
         else:
-            print("\nWrong extension! Make sure the file is one of these types: .easy, .easy.gz, .nedf")
+            print("\nWrong extension! Make sure the file is one of these types: .easy, .easy.gz, .nedf, .nestore")
             print("\n\033[91mERROR @capsule __init__: proposed file has wrong extension. Exiting.\033[0m \n")
             self.good_init = False
             return
@@ -86,13 +146,152 @@ class Capsule(object):
         self.fs = rdr.fs
         self.num_channels = rdr.num_channels
         self.electrodes = rdr.electrodes
-        self.np_time = rdr.np_time
-        self.np_eeg = rdr.np_eeg
-        self.np_acc = rdr.np_acc
-        self.np_markers = rdr.np_markers
-        self.np_stim = rdr.np_stim
+        if on_demand:
+            self.on_demand = True
+            self.__source = rdr
+        else:
+            self.np_time = rdr.np_time
+            self.np_eeg = rdr.np_eeg
+            self.np_acc = rdr.np_acc
+            self.np_markers = rdr.np_markers
+            self.np_stim = rdr.np_stim
         self.filenameroot = rdr.filenameroot
+        self.reader = rdr if ((lazy and filepath.endswith((".nedf", ".easy.gz"))) or
+                              filepath.endswith(".nestore")) else None
+        self.cached = False
+        if cache and self.reader is None and not on_demand and len(self.np_eeg):
+            cache.put(filepath, self)
+
+    def __getattr__(self, name):
+        """ Decodes the np_ arrays of on-demand Capsules on their first access."""
+        source = self.__dict__.get('_Capsule__source')
+        if name not in arrays or source is None:
+            raise AttributeError("'Capsule' object has no attribute '{0}'".format(name))
+        if isinstance(source, nedfReader):  # just this stream
+            values = getattr(source, name)
+            streams = {name: np.asarray(values) if isinstance(values, nedfStream) else values}
+        else:  # the text of .easy files has all the streams
+            streams = source.readRecords(0, None)
+        for stream in streams:
+            self.__dict__.setdefault(stream, streams[stream])
+        return self.__dict__[name]
+
+    def release(self, *names):
+        """
+        Releases np_ arrays of an on-demand Capsule, that are decoded again on their next access, e.g.,
+
+            >>> c = Capsule("nedfdata/20180213122712_Patient01.nedf", on_demand=True)
+            >>> c.np_eeg  # decodes just the EEG
+            >>> c.release('np_eeg')
+
+        :param names: names of the np_ arrays. Default: all of them.
+        """
+        if self.__source is None:
+            print("\033[93m Warning! The Capsule is not on demand, its arrays can not be released. \033[0m")
+            return
+        for name in names or arrays:
+            self.__dict__.pop(name, None)
     
+    def metadata_copy(self):
+        """
+        Copy of the Capsule without the recording: the metadata (and the Frida results, e.g. PSD), but not the np_
+        arrays, the reader or the shared memory block.
+        :return: Capsule.
+        """
+        capsule = type(self).__new__(type(self))
+        capsule.__dict__.update((name, value) for name, value in vars(self).items()
+                                if name not in arrays and not name.startswith('_Capsule__'))
+        capsule.reader = None
+        capsule.shared = None
+        capsule.on_demand = False
+        capsule.__source = None
+        return capsule
+
+    def save_store(self, storepath, chunk_seconds=10., compression=None):
+        """
+        Writes the recording to a NEPy store, that is opened without parsing the file again (see open_store and
+        store.py).
+        :param storepath: path of the store (.nestore).
+        :param chunk_seconds: length of the chunks of the streams (seconds).
+        :param compression: None or 'zlib' (every chunk and channel is compressed by itself).
+        :return: storepath.
+        """
+        return saveStore(self, storepath, chunk_seconds, compression)
+
+    @classmethod
+    def open_store(cls, storepath, author="anonymous"):
+        """
+        Capsule of a NEPy store (see save_store). The store is memory mapped, and the np_ arrays read just the chunks
+        and channels that are sliced.
+        :param storepath: path of the store (.nestore).
+        :param author: ("anonymous") user.
+        :return: Capsule.
+        """
+        return cls(storepath, author, cache=False)
+
+    def to_shared(self):
+        """
+        Moves the np_ arrays to a shared memory block that other processes can attach to (see shared.py). This Capsule
+        owns the block: it is freed by detach, or when the Capsule is deleted.
+        :return: name of the block.
+        """
+        if self.shared is None:
+            self.shared, data = shareArrays(self)
+            for name in arrays:
+                setattr(self, name, data[name])
+            self.on_demand = False
+            self.__source = None
+            self.__release = weakref.finalize(self, releaseBlock, self.shared, os.getpid())
+        return self.shared.name
+
+    @classmethod
+    def attach(cls, name, writeable=False):
+        """
+        Capsule of the shared memory block of another Capsule (see to_shared), whose np_ arrays are views of the block.
+        :param name: name of the block.
+        :param writeable: if False (default), the np_ arrays are read-only.
+        :return: Capsule.
+        """
+        capsule = cls.__new__(cls)
+        capsule.__setstate__({'shared': name, 'writeable': writeable})
+        return capsule
+
+    def detach(self, keep=False):
+        """
+        Releases the shared memory block of the np_ arrays in this process (the owner also frees the block).
+        :param keep: if True, the np_ arrays are copied to the memory of the process. Otherwise they are set to None.
+        """
+        if self.shared is None:
+            return
+        for name in arrays:
+            setattr(self, name, getattr(self, name).copy() if keep else None)
+        self.shared = None
+        self.__release()
+
+    def __getstate__(self):
+        """ Shared Capsules are pickled as the name of their block."""
+        state = dict(self.__dict__)
+        if self.shared is not None:
+            for name in arrays + ['_Capsule__release', '_Capsule__source', 'reader']:
+                state.pop(name, None)
+            state['shared'] = self.shared.name
+        return state
+
+    def __setstate__(self, state):
+        if state.get('shared') is None:
+            self.__dict__.update(state)
+            return
+        shm, data = attachArrays(state['shared'], state.pop('writeable', False))
+        self.__dict__.update(state)
+        self.__dict__.update(data)
+        self.good_init = True
+        self.reader = None
+        self.on_demand = False
+        self.__source = None
+        self.cached = self.__dict__.get('cached', False)
+        self.shared = shm
+        self.__release = weakref.finalize(self, releaseBlock, shm)
+
     def listAttributes(self):
         """Convenience function, prints list of attributes."""
         for attr in sorted(self.__dict__.keys()):
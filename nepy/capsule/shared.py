@@ -0,0 +1,138 @@
+"""
+Shared memory Capsules, so that worker processes read the same decoded recording without pickling its arrays: the np_
+arrays of a Capsule (np_eeg, np_acc, np_markers, np_stim, np_time) are moved to one multiprocessing.shared_memory block,
+after a JSON header with the Capsule metadata and the layout of the arrays (dtype, shape and offset). Any process can
+attach to the block by its name, and its np_ arrays are then views of the block (a single resident copy):
+
+    >>> c = Capsule("nedfdata/20180213122712_Patient01.nedf")
+    >>> name = c.to_shared()
+    >>> # in a worker process:
+    >>> w = Capsule.attach(name)  # w.np_eeg is a read-only view of the block
+    >>> w.detach()
+    >>> # when the workers are done:
+    >>> c.detach()  # the owner (the Capsule that called to_shared) also frees the block
+
+A shared Capsule is pickled as just the name of its block (e.g., as an argument of a multiprocessing.Process), and it
+is attached again when it is unpickled. The block lives until its owner calls detach, or until the owner is garbage
+collected or its process exits, whatever the processes that are still attached (their views stay valid, but no new
+process can attach). The blocks are not registered to the multiprocessing resource tracker, so that no other process
+frees them: a block whose owner is killed is left in the system until it is restarted. In every process, the mapping
+of the block is closed when its last array is deleted.
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import struct
+import sys
+import weakref
+
+import numpy as np
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from nepy.capsule.cache import arrays
+
+metadata = ['author', 'capsuledate', 'eegstartdate', 'filepath', 'basename', 'fs', 'num_channels', 'electrodes',
+            'filenameroot']
+align = 64  # bytes, alignment of the arrays in the block
+
+
+def shareArrays(capsule):
+    """
+    Copies the arrays and the metadata of a Capsule to a new shared memory block.
+    :return: (SharedMemory, data), where data is a dictionary with the np_ arrays (writable views of the block) and
+             the metadata fields.
+    """
+    values = {name: np.asarray(getattr(capsule, name)) for name in arrays}
+    layout = {}
+    offset = 0
+    for name in arrays:
+        layout[name] = [values[name].dtype.str, list(values[name].shape), offset]
+        offset += -(-values[name].nbytes // align) * align
+    header = json.dumps({'metadata': {name: getattr(capsule, name) for name in metadata}, 'arrays': layout},
+                        default=lambda value: value.item() if hasattr(value, 'item') else str(value)).encode('utf-8')
+    start = -(-(8 + len(header)) // align) * align
+
+    shm = _create(max(start + offset, 1))
+    shm.buf[:8] = struct.pack('<Q', len(header))
+    shm.buf[8:8 + len(header)] = header
+    data = _views(shm, start, json.loads(header.decode('utf-8')), writeable=True)
+    for name in arrays:
+        data[name][...] = values[name]
+    return shm, data
+
+
+def attachArrays(name, writeable=False):
+    """
+    Attaches to the shared memory block of a Capsule (see shareArrays).
+    :param name: name of the block.
+    :param writeable: if False (default), the np_ arrays are read-only. Writing to a writable view changes the
+                      recording of every process attached to the block.
+    :return: (SharedMemory, data), see shareArrays.
+    """
+    shm = _open(name)
+    length = struct.unpack('<Q', bytes(shm.buf[:8]))[0]
+    header = json.loads(bytes(shm.buf[8:8 + length]).decode('utf-8'))
+    return shm, _views(shm, -(-(8 + length) // align) * align, header, writeable)
+
+
+def releaseBlock(shm, owner=None):
+    """
+    Frees a shared memory block, if this is the owner process. The mapping of the block in this process is closed
+    when its arrays are deleted (see _views), e.g., np_eeg arrays kept by the user stay valid.
+    :param owner: pid of the process that frees the block (forked children of the owner inherit its Capsule, but do
+                  not free the block). None: the block is not freed.
+    """
+    if owner != os.getpid():
+        return
+    if sys.version_info < (3, 13):  # unlink unregisters the block from the tracker (see _create)
+        resource_tracker.register(shm._name, 'shared_memory')
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+
+def _views(shm, start, header, writeable):
+    """
+    np_ arrays and metadata fields of a block header. The arrays are views of one array of the whole block: when none
+    of them is left, the buffer of that array (its base) is released, and then the mapping of the block is closed.
+    """
+    block = np.frombuffer(shm.buf, dtype=np.uint8)
+    weakref.finalize(block.base, shm.close).atexit = False
+    data = dict(header['metadata'])
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        view = block[start + offset:start + offset + nbytes].view(np.dtype(dtype)).reshape(shape)
+        view.flags.writeable = writeable
+        data[name] = view
+    return data
+
+
+def _create(size):
+    """
+    Creates a block that is not registered to the resource tracker, as the attached ones (see _open): the processes
+    started by this one share its tracker, so their attaching would drop the registration of the owner anyway.
+    """
+    try:
+        return SharedMemory(create=True, size=size, track=False)
+    except TypeError:  # Python < 3.13
+        shm = SharedMemory(create=True, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _open(name):
+    """
+    Opens an existing block without leaving it registered to the resource tracker of this process: only the owner of
+    a block frees it (before Python 3.13 the tracker of an attached process would unlink the block when it exits).
+    """
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
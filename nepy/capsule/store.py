@@ -0,0 +1,346 @@
+"""
+NEPy store: a binary file (.nestore) with the decoded streams of a recording, so that the .easy text or the .nedf
+records do not have to be parsed again. Every stream (np_eeg, np_stim, np_acc, np_markers, np_time) is split in chunks
+of 'chunk_seconds' of samples, and every chunk is stored by columns (one block per channel), optionally compressed with
+zlib (after a byte shuffle, that groups the bytes of the same significance of the float32 values). The file ends with a
+JSON footer with the metadata of the recording and the layout of the streams, and the chunk index of every stream
+(offset and size of every block):
+
+    [blocks of the streams][chunk indices (int64)][footer (JSON)][footer size (uint64)][MAGIC]
+
+A store is memory mapped when it is opened, and a window of samples and channels is read from just the blocks of the
+window (uncompressed blocks are views of the memory map, compressed blocks are inflated one at a time):
+
+    >>> c = Capsule("nedfdata/20180213122712_Patient01.nedf", lazy=True)
+    >>> c.save_store("stores/20180213122712_Patient01.nestore", compression='zlib')
+    >>> s = Capsule.open_store("stores/20180213122712_Patient01.nestore")
+    >>> s.np_eeg[5000:10000, [0, 3]]  # numpy array with 5000 samples of 2 channels
+    >>> f = Frida("stores/20180213122712_Patient01.nestore", capsule=s, time_span=[60, 90])
+
+Whole directories of recordings are converted with convertDirectory.
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import struct
+import time
+import traceback
+import zlib
+from fractions import Fraction
+
+import numpy as np
+
+from nepy.capsule.cache import arrays
+from nepy.readers.easyReader import easyReader
+from nepy.readers.nedfReader import nedfStream
+
+MAGIC = b'NESTORE1'
+VERSION = 1
+
+extensions = (".easy", ".easy.gz", ".nedf")
+metadata = ['eegstartdate', 'basename', 'fs', 'num_channels', 'electrodes', 'filepath']
+
+
+def saveStore(capsule, storepath, chunk_seconds=10., compression=None, level=6):
+    """
+    Writes the streams and the metadata of a Capsule to a store (see the module docstring). The streams are read by
+    chunks, so the np_ arrays of lazy Capsules (see Capsule) are decoded one chunk at a time, and the empty np_ arrays
+    of lazy .easy.gz Capsules are read from the file by chunks (see recordStreams). The store is written to a
+    temporary file that is renamed when complete.
+    :param capsule: Capsule.
+    :param storepath: path of the store (.nestore).
+    :param chunk_seconds: length of the chunks (seconds).
+    :param compression: None or 'zlib'.
+    :param level: zlib compression level.
+    :return: storepath.
+    """
+    if compression not in (None, 'zlib'):
+        raise ValueError("Unknown compression '{0}', use None or 'zlib'".format(compression))
+    if isinstance(capsule.reader, easyReader) and not len(capsule.np_eeg):
+        # Lazy .easy.gz Capsule: its np_ arrays are empty, the rows are read from the file by chunks.
+        streams = recordStreams(capsule.reader).streams
+    else:
+        streams = {}
+        for name in arrays:
+            values = getattr(capsule, name)
+            streams[name] = values if hasattr(values, 'shape') else np.asarray(values, dtype="float32")
+    samples = len(streams['np_time'])
+    if not samples and getattr(capsule.reader, 'samples', 0):
+        raise ValueError("The streams of {0} could not be read, the store would be empty".format(capsule.filepath))
+    chunk_samples = max(1, int(round(chunk_seconds * capsule.fs)))
+
+    footer = {'version': VERSION, 'samples': samples, 'chunk_samples': chunk_samples, 'compression': compression,
+              'metadata': {name: getattr(capsule, name) for name in metadata}, 'streams': {}}
+    chunk_rows, columns, indices = {}, {}, {}
+    for name in arrays:
+        values = streams[name]
+        rate = rowsPerSample(len(values), samples)
+        chunk_rows[name] = max(1, int(chunk_samples * rate))
+        columns[name] = values.shape[1] if len(values.shape) > 1 else 1
+        indices[name] = np.zeros((-(-len(values) // chunk_rows[name]), columns[name], 2), dtype=np.int64)
+        footer['streams'][name] = {'dtype': np.dtype(values.dtype).str, 'shape': list(values.shape),
+                                   'rate': [rate.numerator, rate.denominator], 'chunk_rows': chunk_rows[name]}
+    temppath = storepath + '.tmp{0}'.format(os.getpid())
+    try:
+        with open(temppath, 'wb') as fil:
+            for chunk in range(max(len(index) for index in indices.values())):  # all the streams of every chunk
+                for name in arrays:
+                    if chunk >= len(indices[name]):
+                        continue
+                    first = chunk * chunk_rows[name]
+                    block = np.asarray(streams[name][first:first + chunk_rows[name]]).reshape(-1, columns[name])
+                    for column in range(columns[name]):
+                        data = _encode(np.ascontiguousarray(block[:, column]), compression, level)
+                        indices[name][chunk, column] = fil.tell(), len(data)
+                        fil.write(data)
+            for name in arrays:
+                footer['streams'][name]['index'] = fil.tell()
+                fil.write(indices[name].tobytes())
+            text = json.dumps(footer, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+            text = text.encode('utf-8')
+            fil.write(text + struct.pack('<Q', len(text)) + MAGIC)
+    except BaseException:
+        if os.path.exists(temppath):
+            os.remove(temppath)
+        raise
+    os.replace(temppath, storepath)
+    return storepath
+
+
+def rowsPerSample(rows, samples):
+    """
+    Rows of a stream per EEG sample, as a fraction (e.g., 2 for the .nedf stim, 1/5 for the .nedf accelerometer),
+    such that the rows of the samples first..last-1 are ceil(first * rate)..ceil(last * rate)-1.
+    """
+    if not samples or not rows:
+        return Fraction(0 if not rows else 1)
+    rate = Fraction(rows, samples).limit_denominator(16)
+    return rate if -(-samples * rate.numerator // rate.denominator) == rows else Fraction(rows, samples)
+
+
+def convertDirectory(datapath, storepath, chunk_seconds=10., compression=None, overwrite=False):
+    """
+    Converts all the .easy, .easy.gz and .nedf files of a directory to stores (storepath/basename.nestore). The .nedf
+    files are converted chunk by chunk from their memory map.
+    :param datapath: directory of the recordings.
+    :param storepath: output directory (created if needed).
+    :param chunk_seconds: see saveStore.
+    :param compression: see saveStore.
+    :param overwrite: if False, the recordings whose store is newer than the file are not converted again.
+    :return: lists of the stores written (or up to date) and of the files that could not be converted.
+    """
+    from nepy.capsule.capsule import Capsule  # Capsule uses this module
+
+    if not os.path.isdir(storepath):
+        os.makedirs(storepath)
+    converted, skipped = [], []
+    for filename in sorted(os.listdir(datapath)):
+        filepath = os.path.join(datapath, filename)
+        if not filename.endswith(extensions):
+            continue
+        basename = filename[:-len(next(ext for ext in extensions[::-1] if filename.endswith(ext)))]
+        target = os.path.join(storepath, basename + ".nestore")
+        if target in converted:
+            print("\033[93m Warning! {0} is not converted, {1} has already been written. \033[0m".format(
+                filepath, target))
+            skipped.append(filepath)
+            continue
+        if not overwrite and os.path.isfile(target) and os.path.getmtime(target) >= os.path.getmtime(filepath):
+            print("Up to date:", target)
+            converted.append(target)
+            continue
+
+        start = time.time()
+        try:
+            capsule = Capsule(filepath, verbose=False, cache=False, lazy=filename.endswith(".nedf"))
+            if not capsule.good_init:
+                raise IOError("the file could not be read")
+            saveStore(capsule, target, chunk_seconds, compression)
+        except Exception:
+            print("\033[91m ERROR @convertDirectory: {0} could not be converted. \033[0m".format(filepath))
+            print(traceback.format_exc())
+            skipped.append(filepath)
+            continue
+        print("Converted {0} to {1} in {2:.1f} s".format(filepath, target, time.time() - start))
+        converted.append(target)
+    return converted, skipped
+
+
+class storeReader(object):
+    """
+    Reader of a store (see the module docstring), with the metadata and the streams of the recording as the other
+    readers: np_eeg, np_stim, np_acc, np_markers and np_time are storeStream objects, that read just the chunks and
+    channels that are sliced.
+
+        >>> s = storeReader("stores/20180213122712_Patient01.nestore")
+        >>> window = s.readWindow(60, 90, channels=['Cz', 'Pz'])
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.filenameroot = filepath[:-8] if filepath.endswith(".nestore") else filepath
+        size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as fil:
+            fil.seek(max(size - 16, 0))
+            tail = fil.read(16)
+            if len(tail) < 16 or tail[8:] != MAGIC:
+                raise IOError("{0} is not a NEPy store".format(filepath))
+            length = struct.unpack('<Q', tail[:8])[0]
+            fil.seek(size - 16 - length)
+            footer = json.loads(fil.read(length).decode('utf-8'))
+        if footer['version'] != VERSION:
+            raise IOError("{0} is a NEPy store of version {1}, not {2}".format(filepath, footer['version'], VERSION))
+
+        self.footer = footer
+        self.compression = footer['compression']
+        self.samples = footer['samples']
+        self.chunk_samples = footer['chunk_samples']
+        for name in metadata:
+            setattr(self, name, footer['metadata'][name])
+        self.source = self.filepath  # the recording that was converted
+        self.filepath = filepath
+        self.buf = np.memmap(filepath, dtype="uint8", mode="r") if size else np.zeros(0, dtype="uint8")
+
+        self.layout = {}
+        for name in arrays:
+            stream = footer['streams'][name]
+            shape = stream['shape']
+            columns = shape[1] if len(shape) > 1 else 1
+            chunks = -(-shape[0] // stream['chunk_rows'])
+            index = np.frombuffer(self.buf, dtype=np.int64, count=chunks * columns * 2, offset=stream['index'])
+            self.layout[name] = dict(stream, index=index.reshape(chunks, columns, 2),
+                                     rate=Fraction(*stream['rate']), dtype=np.dtype(stream['dtype']))
+            setattr(self, name, storeStream(self, name))
+
+    def readBlock(self, name, chunk, column):
+        """ Values of a column of a chunk of a stream (a view of the memory map if the store is not compressed)."""
+        layout = self.layout[name]
+        offset, nbytes = layout['index'][chunk, column]
+        data = self.buf[offset:offset + nbytes]
+        return _decode(data, layout['dtype'], self.compression)
+
+    def readRows(self, name, first, last, channels=slice(None)):
+        """
+        Reads the rows first..last-1 of a stream from the chunks that contain them.
+        :param channels: channel indices (list) or slice of the channels of 2-D streams.
+        :return: numpy array, (rows,) or (rows, channels).
+        """
+        layout = self.layout[name]
+        shape = layout['shape']
+        columns = np.atleast_1d(np.arange(shape[1])[channels]) if len(shape) > 1 else [0]
+        last = max(first, last)
+        out = np.empty((last - first, len(columns)), dtype=layout['dtype'])
+        rows = layout['chunk_rows']
+        for chunk in range(first // rows, -(-last // rows)):
+            start, stop = max(first, chunk * rows), min(last, (chunk + 1) * rows)
+            for j, column in enumerate(columns):
+                out[start - first:stop - first, j] = self.readBlock(name, chunk, column)[start - chunk * rows:
+                                                                                        stop - chunk * rows]
+        return out if len(shape) > 1 else out[:, 0]
+
+    def readWindow(self, start_s, stop_s, channels=None):
+        """
+        Reads the data between start_s and stop_s seconds from the beginning of the recording.
+        :param start_s: first second of the window.
+        :param stop_s: last second of the window (not included). None reads until the end of the recording.
+        :param channels: list of electrode names or channel indices. Default: all channels.
+        :return: dictionary with the np_eeg, np_stim, np_acc, np_markers and np_time arrays of the window.
+        """
+        last = self.samples if stop_s is None else int(stop_s * self.fs)
+        return self.readRecords(int(start_s * self.fs), last, channels)
+
+    def readRecords(self, first, last, channels=None):
+        """ Same as readWindow, but the window is given in samples: first..last-1 (None: until the end)."""
+        first = min(max(first, 0), self.samples)
+        last = self.samples if last is None else min(max(last, first), self.samples)
+        if channels is None:
+            channels = slice(None)
+        else:
+            channels = [self.electrodes.index(ch) if isinstance(ch, str) else ch for ch in channels]
+        window = {}
+        for name in arrays:
+            layout = self.layout[name]
+            rate = layout['rate']
+            rows = -(-first * rate.numerator // rate.denominator), -(-last * rate.numerator // rate.denominator)
+            window[name] = self.readRows(name, rows[0], min(rows[1], layout['shape'][0]),
+                                         channels if name in ['np_eeg', 'np_stim'] else slice(None))
+        return window
+
+
+class storeStream(nedfStream):
+    """
+    Stream of a store, as nedfStream: it behaves as the numpy array it stands for regarding shape, len and slicing,
+    but it only reads the chunks and channels that are sliced.
+    """
+    def __init__(self, reader, name):
+        self.reader = reader
+        self.stream = name
+        self.shape = tuple(reader.layout[name]['shape'])
+        self.dtype = reader.layout[name]['dtype']
+
+    def readRows(self, first, last, channels):
+        return self.reader.readRows(self.stream, first, last, channels)
+
+
+class recordStreams(object):
+    """
+    Streams of an easyReader opened with header_only (lazy .easy.gz Capsules), whose np_ arrays are empty: the streams
+    attribute has objects that stand for np_eeg, np_stim, np_acc, np_markers and np_time (shape, dtype, len and slices
+    of rows), read from the file with readRecords. Every row of the .easy streams is a sample, and the window of the
+    last slice is kept for the other streams, so that every chunk of a store is read once. Without the index of the
+    file (see gzipIndex), the whole file is parsed once.
+    """
+    def __init__(self, reader):
+        self.reader = reader
+        self.window = None
+        self.bounds = None
+        if reader.index is None:
+            self.window = reader.readRecords(0, None)
+            self.bounds = (0, len(self.window['np_time']))
+        probe = reader.readRecords(0, 1) if self.window is None else self.window
+        samples = reader.samples if self.window is None else self.bounds[1]
+        self.streams = {}
+        for name in arrays:
+            values = np.asarray(probe[name])
+            shape = ((samples if len(values) else 0),) + values.shape[1:]
+            self.streams[name] = recordStream(self, name, shape, values.dtype)
+
+    def readRows(self, name, first, last):
+        if self.bounds is None or not (self.bounds[0] <= first and last <= self.bounds[1]):
+            self.window = self.reader.readRecords(first, last)
+            self.bounds = (first, last)
+        return self.window[name][first - self.bounds[0]:last - self.bounds[0]]
+
+
+class recordStream(object):
+    """ A stream of recordStreams: its rows (samples) are read when they are sliced."""
+    def __init__(self, source, name, shape, dtype):
+        self.source = source
+        self.stream = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        first, last, step = rows.indices(self.shape[0])
+        return self.source.readRows(self.stream, first, last)[::step]
+
+
+def _encode(values, compression, level):
+    """ Bytes of a block: the raw values, or the zlib compressed bytes after a byte shuffle."""
+    if compression is None:
+        return values.tobytes()
+    shuffled = values.view(np.uint8).reshape(-1, values.dtype.itemsize).T.tobytes()
+    return zlib.compress(shuffled, level)
+
+
+def _decode(data, dtype, compression):
+    """ Values of a block (see _encode)."""
+    if compression is None:
+        return np.frombuffer(data, dtype=dtype)
+    shuffled = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    return shuffled.reshape(dtype.itemsize, -1).T.copy().view(dtype).reshape(-1)
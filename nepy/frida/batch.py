@@ -1,6 +1,15 @@
 """
 Batch processor tools, will apply pipelines properly  to files in a dir.
 Creates a Frida object for each of the files in the data directory.
+The files can be processed by a pool of worker processes (workers=N), each file with a timeout after which its worker
+is killed. The results are reported in the order of the files, whatever the order in which they finish.
+Processing the files one after the other, the next files can be read ahead on background threads (prefetch=K), so that
+reading them (e.g., from network storage) overlaps with the processing of the current one.
+The worker processes are scheduled by size: the peak memory of every file is estimated from its header (estimateMemory,
+scheduleHeader), the largest files are started first, and no file is started while it does not fit in the memory budget
+(memory_budget) with the ones that are running.
+With an output directory (outpath), the runs are recorded in a manifest (see manifest.py) and they can be resumed: the
+files already processed with the same content and configuration are skipped.
 Created on Sat Feb  3 09:20:00 2018 (giulio)
 Modified on Tue Nov 6 07:49:55 2018 (roser)
 
@@ -9,23 +18,130 @@ Modified on Tue Nov 6 07:49:55 2018 (roser)
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import collections
+import contextlib
+import io
+import itertools
+import multiprocessing
+import multiprocessing.connection
 import time
+import traceback
 import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
-from nepy.frida.frida import Frida
+import numpy as np
 
+from nepy.capsule.capsule import Capsule
+from nepy.readers.catalog import readHeader
+from nepy.readers.easyReader import easyColumns, easyEstimateRows, easyFirstRow
+from nepy.frida.frida import Frida, defaultParameters
+from nepy.frida.manifest import Manifest, configuration, fileHash
 
-def processDirectory(datapath, author='anonymous', pipeline=None, parameters=None, plotit=True):
+extensions = (".easy", ".easy.gz", ".nedf")
+
+# Memory model of processFile (see estimateMemory), measured on synthetic .nedf and .easy files (32 and 8 channels).
+eeg_copies = 4  # float32 copies of the EEG alive at the peak: capsule, eeg, output of a step and QC/PSD temporaries
+filter_copies = 2  # float64 copies of the channels filtered at a time (zeroPhase, 8 channels), if the pipeline filters
+stim_copies = 4  # float32 copies of the EEG size per stimulation channel sample pair (.nedf stim data, decoding)
+process_bytes = 2 ** 26  # reader blocks and other allocations of the worker that do not grow with the recording
+
+
+def processFile(filepath, author='anonymous', pipeline=None, parameters=None, plotit=True, capsule=None):
+    """ Process a file using Frida: QC, preprocessing and QC of the preprocessed data.
+    :param filepath: .easy, .easy.gz or .nedf file.
+    :param author: ('anonymous') user.
+    :param pipeline: see Frida.preprocess.
+    :param parameters: check Frida docstring for more information.
+    :param plotit: flag to plot or not the data.
+    :param capsule: Capsule of the file, if it has already been read.
+    :return: summary of the file: ChannelStats summary of the preprocessed EEG, and number of bad epochs (None if the
+             recording is too short to be checked by epochs).
+             It raises the exceptions of Frida (e.g., a file that can not be read).
+    """
+    f = Frida(filepath, author=author, parameters=parameters, capsule=capsule)
+    if not f.good_init:
+        raise IOError("Frida could not be created for " + filepath)
+    if plotit:
+        f.plotEEG()
+        f.plotPSD()
+    f.QC(plotit=plotit)
+    f.preprocess(pipeline)
+    f.QC(plotit=plotit)
+    print("Summary: {n} samples, median STD = {std:.1f} uV, maximum peak-to-peak = {ptp:.1f} uV".format(
+        n=f.stats.count, std=np.median(f.stats.std), ptp=np.max(f.stats.ptp)))
+    if plotit:
+        f.plotEEG()
+        f.plotPSD()
+    summary = f.stats.summary(f.c.electrodes)
+    summary['bad_epochs'] = None if f.bad_records is None else len(f.bad_records)
+    return summary
+
+
+def estimateMemory(header, pipeline=None):
+    """
+    Estimated peak memory (bytes) of processing a recording with processFile, from its header (see
+    nepy.readers.catalog.readHeader): channels x samples x the copies of the EEG made by Frida and by the pipeline.
+    :param header: dictionary with num_channels, samples and stim_data, or None (0 is returned).
+    :param pipeline: see Frida.preprocess.
+    :return: bytes.
+    """
+    if header is None:
+        return 0
+    if pipeline is None:
+        pipeline = ['reset', 'rereference', 'detrend', 'remove_line_freq', 'bandpassfilter']
+    channels, samples = header['num_channels'], header['samples']
+    nbytes = samples * channels * 4 * eeg_copies
+    if any(action in ['remove_line_freq', 'bandpassfilter', 'notch_bandpassfilter'] for action in pipeline):
+        nbytes += samples * min(channels, 8) * 8 * filter_copies
+    if header['stim_data']:
+        nbytes += samples * channels * 4 * stim_copies
+    return nbytes + process_bytes
+
+
+def scheduleHeader(filepath):
+    """
+    Header of a recording for estimateMemory, without reading its data: readHeader for .nedf files (xml header), and
+    for .easy and .easy.gz files the channels of the first row and the samples estimated from the first block of the
+    file (see easyEstimateRows). readHeader counts the rows of .easy files, and inflates the whole .easy.gz files.
+    :return: dictionary with num_channels, samples and stim_data, or None if the file can not be read.
+    """
+    if not filepath.endswith((".easy", ".easy.gz")):
+        return readHeader(filepath)
+    try:
+        num_channels = easyColumns(len(easyFirstRow(filepath)))[0]
+        if num_channels is None:
+            return None
+        return {'num_channels': num_channels, 'samples': easyEstimateRows(filepath), 'stim_data': False}
+    except (IOError, EOFError, ValueError, zlib.error):
+        return None
+
+
+def processDirectory(datapath, author='anonymous', pipeline=None, parameters=None, plotit=True, workers=None,
+                     timeout=None, prefetch=0, outpath=None, memory_budget=None):
     """ Process all .easy or .easy.gz files in data's directory using Frida.
     :param datapath: directory of the folder containing the data.
     :param author: ('anonymous') user.
     :param pipeline: (['referenceData', 'detrendData', 'notch', 'filterDataA2B'])
     :param parameters: check Frida docstring for more information.
-    :param plotit: flag to plot or not the data.
-    :return: list of processed and skipped files.
+    :param plotit: flag to plot or not the data (not with workers).
+    :param workers: number of worker processes. Default: None, the files are processed one after the other in this
+                    process.
+    :param timeout: maximum time to process a file (seconds); its worker is killed after it and the file is skipped.
+                    Default: None, no limit. With a timeout the files are always processed in worker processes.
+    :param prefetch: number of files read ahead on background threads when the files are processed in this process
+                     (at most prefetch + 1 recordings in memory). Default: 0, every file is read when it is processed.
+    :param memory_budget: maximum memory (bytes) of the files processed at the same time by the worker processes, as
+                          estimated by estimateMemory (see scheduleHeader). A file larger than the budget is processed
+                          alone. Default: None, no limit. With worker processes, the largest files are started first in
+                          any case.
+    :param outpath: output directory of the manifest of the runs (see manifest.py). The files recorded as done with
+                    the same content, parameters and pipeline are not processed again (they are returned as
+                    processed); new, changed and failed files are. Default: None, no manifest.
+    :return: list of processed and skipped files, in the order of the files (sorted by name).
 
     Example of use:
-    >>> [processed, skipped] = processDirectory(datapath)
+    >>> [processed, skipped] = processDirectory(datapath, workers=8, timeout=3600)
     """
 
     saved_args = locals()
@@ -36,31 +152,41 @@ def processDirectory(datapath, author='anonymous', pipeline=None, parameters=Non
     processed = []
     skipped = []
 
-    for fil in os.listdir(datapath):
-        if fil.endswith((".easy", ".easy.gz", ".nedf")):
-            print("\n\n##########################################################################\n")
-            filepath = datapath + "/" + fil
-            print("         Processing", filepath, )
-            print("##########################################################################\n\n")
-            try:
-                f = Frida(filepath, author=author, parameters=parameters)
-                if plotit:
-                    f.plotEEG()
-                    f.plotPSD()
-                f.QC(plotit=plotit)
-                f.preprocess(pipeline)
-                f.QC(plotit=plotit)
-                if plotit:
-                    f.plotEEG()
-                    f.plotPSD()
-            except:
-                print("Something is wrong with this file, skipping...")
-                f = 0
-
-            if f != 0:
-                processed.append(filepath)
-            else:
-                skipped.append(filepath)
+    filepaths = [datapath + "/" + fil for fil in sorted(os.listdir(datapath)) if fil.endswith(extensions)]
+    manifest = None
+    if outpath is not None:
+        manifest = Manifest(outpath)
+        config = configuration(defaultParameters() if parameters is None else parameters, pipeline)
+        done = [filepath for filepath in filepaths if manifest.isDone(filepath, config)]
+        if done:
+            print("Already processed (manifest {0}): {1} files".format(manifest.dbpath, len(done)))
+        filepaths = [filepath for filepath in filepaths if filepath not in done]
+    hashit = manifest is not None
+
+    options = dict(author=author, pipeline=pipeline, parameters=parameters, plotit=plotit)
+    if workers is None and timeout is None and prefetch:
+        results = _processPrefetched(filepaths, options, prefetch, author, hashit)
+    elif workers is None and timeout is None:
+        results = (_processHere(filepath, options, hashit=hashit) for filepath in filepaths)
+    else:
+        if plotit:
+            print("\033[93m Warning! The files processed by worker processes are not plotted. \033[0m")
+            options['plotit'] = False
+        estimates = [estimateMemory(scheduleHeader(filepath), pipeline) for filepath in filepaths]
+        results = _processPool(filepaths, options, workers or 1, timeout, hashit, estimates, memory_budget)
+
+    for filepath, result in zip(filepaths, results):
+        if result['error'] is None:
+            processed.append(filepath)
+        else:
+            print("\033[91m Something is wrong with this file, skipping: \033[0m")
+            print(result['error'])
+            skipped.append(filepath)
+        if manifest is not None:
+            manifest.record(filepath, config, result['hash'], result['started'], result['seconds'],
+                            result['summary'], result['error'])
+    if manifest is not None:
+        processed = sorted(processed + done)
     elapsed_time = time.time() - start_time
 
     print("\n\nBatch job complete.")
@@ -69,3 +195,134 @@ def processDirectory(datapath, author='anonymous', pipeline=None, parameters=Non
     print("\nElapsed time (seconds):", elapsed_time)
 
     return processed, skipped
+
+
+def prefetchCapsules(filepaths, ahead=2, author='anonymous'):
+    """
+    Reads the Capsules of the files ahead, on 'ahead' background threads: while a file is processed, the next 'ahead'
+    files are read. Reading is mostly waiting for the storage and decompressing, which do not hold the interpreter.
+    :param filepaths: list of files.
+    :param ahead: number of files read ahead (at most ahead + 1 Capsules at a time, with the one being processed).
+    :param author: ('anonymous') user.
+    :return: generator of (filepath, future of its Capsule), in the order of filepaths. future.result() waits for the
+             Capsule, or raises the exception of the reader.
+    """
+    filepaths = iter(filepaths)
+    with ThreadPoolExecutor(max_workers=ahead) as executor:
+        futures = collections.deque((filepath, executor.submit(Capsule, filepath, author, verbose=False))
+                                    for filepath in itertools.islice(filepaths, ahead + 1))
+        while futures:
+            yield futures.popleft()
+            # The previous file has been processed: read one more.
+            for filepath in itertools.islice(filepaths, 1):
+                futures.append((filepath, executor.submit(Capsule, filepath, author, verbose=False)))
+
+
+def _banner(filepath):
+    print("\n\n##########################################################################\n")
+    print("         Processing", filepath, )
+    print("##########################################################################\n\n")
+
+
+def _processHere(filepath, options, capsule=None, hashit=False):
+    """ Processes a file in this process (capsule: future of its Capsule, read ahead). Returns its result (see _run)."""
+    _banner(filepath)
+    return _run(filepath, options, capsule, hashit)
+
+
+def _processPrefetched(filepaths, options, ahead, author, hashit=False):
+    """ Processes the files in this process, reading them ahead (see prefetchCapsules)."""
+    for filepath, capsule in prefetchCapsules(filepaths, ahead, author):
+        result = _processHere(filepath, options, capsule, hashit)
+        del capsule  # not kept while the next file is read
+        yield result
+
+
+def _run(filepath, options, capsule=None, hashit=False):
+    """
+    Processes a file. Returns its result: dictionary with the summary (None if it fails), the error (traceback, None if
+    it is processed), the start time, the processing time (seconds) and the content hash of the file (if hashit).
+    """
+    result = {'summary': None, 'error': None, 'started': time.time(), 'hash': None}
+    try:
+        if hashit:
+            result['hash'] = fileHash(filepath)
+        if capsule is not None:
+            options = dict(options, capsule=capsule.result())
+        result['summary'] = processFile(filepath, **options)
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.time() - result['started']
+    return result
+
+
+def _worker(conn, filepath, options, hashit):
+    """ Worker process of a file: sends its result (see _run) and printed output through the connection."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = _run(filepath, options, hashit=hashit)
+    conn.send((result, output.getvalue()))
+    conn.close()
+
+
+def _processPool(filepaths, options, workers, timeout, hashit=False, estimates=None, memory_budget=None):
+    """
+    Processes the files in up to 'workers' processes at a time, one process per file so that a stuck file can be
+    killed. The output of every file is printed, and its result (see _run) yielded, in the order of the files.
+    The files are started from the largest estimate of memory to the smallest, as long as they fit in memory_budget
+    with the running ones (a smaller file that fits is started before a larger one that does not).
+    """
+    if estimates is None:
+        estimates = [0] * len(filepaths)
+    results = {}
+    running = {}  # file index: (process, connection, start time)
+    pending = sorted(range(len(filepaths)), key=lambda ix: -estimates[ix])
+    reported = 0
+    while reported < len(filepaths):
+        while pending and len(running) < workers:
+            used = sum(estimates[ix] for ix in running)
+            fits = [ix for ix in pending if memory_budget is None or used + estimates[ix] <= memory_budget]
+            if not fits and running:
+                break
+            ix = fits[0] if fits else pending[0]
+            if not fits:
+                print("\033[93m Warning! {0} needs about {1:.0f} MB, more than the memory budget. It is processed "
+                      "alone. \033[0m".format(filepaths[ix], estimates[ix] / 2 ** 20))
+            pending.remove(ix)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_worker, args=(sender, filepaths[ix], options, hashit),
+                                              daemon=True)
+            process.start()
+            sender.close()
+            running[ix] = (process, receiver, time.time())
+
+        wait = None
+        if timeout is not None and running:
+            wait = max(0., min(start + timeout for _, _, start in running.values()) - time.time())
+        ready = multiprocessing.connection.wait([conn for _, conn, _ in running.values()], timeout=wait)
+        for ix in list(running):
+            process, conn, start = running[ix]
+            failed = {'summary': None, 'started': start, 'seconds': time.time() - start, 'hash': None}
+            if conn in ready:
+                try:
+                    results[ix] = conn.recv()
+                except EOFError:  # the worker died without a result (e.g. killed by the system)
+                    process.join()
+                    failed['error'] = "Worker process exited with code {0}".format(process.exitcode)
+                    results[ix] = (failed, "")
+            elif timeout is not None and time.time() - start >= timeout:
+                process.terminate()
+                failed['error'] = "Timeout: the file took more than {0} s, its worker was killed".format(timeout)
+                results[ix] = (failed, "")
+            else:
+                continue
+            process.join()
+            conn.close()
+            del running[ix]
+
+        while reported in results:
+            result, output = results.pop(reported)
+            _banner(filepaths[reported])
+            print(output, end="")
+            yield result
+            reported += 1
@@ -0,0 +1,64 @@
+"""
+Blockwise execution of the Frida preprocessing steps (rereference, detrend, remove_line_freq and bandpassfilter), so
+that recordings that do not fit in memory can be preprocessed with a fixed memory budget. The recording is processed by
+blocks of samples, every block extended on both sides by an overlap, and just the central part of every block is kept
+(overlap-and-discard) and written to the output array, e.g. a memory mapped .npy file:
+
+    >>> f = Frida("nedfdata/20180213122712_Patient01.nedf")
+    >>> f.preprocess(out="/data/20180213122712_Patient01_preprocessed.npy", block_seconds=60)
+    >>> f.eeg  # memory map of the preprocessed EEG
+
+The overlap is the sum of the impulse response lengths of the filters of the pipeline (nepy.frida.filters.impulseLength),
+so that the zero-phase filters give the same result as in memory. The blocks start and end at the breakpoints of the
+piecewise linear detrend, so that every detrend segment is fitted to the same samples as in memory (plus one more
+detrend segment of overlap if the detrend comes after a filter).
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+
+
+def blockSpans(samples, block, overlap, breakpoints=None):
+    """
+    Blocks of a recording for the overlap-and-discard processing.
+    :param samples: number of samples of the recording.
+    :param block: number of samples kept from every block.
+    :param overlap: number of samples read before and after the samples that are kept.
+    :param breakpoints: optional sorted array of samples where the blocks that are read may start (and end).
+    :return: generator of (first, last, keep_first, keep_last) samples: [first, last) is read and processed, and
+             [keep_first, keep_last) is kept.
+    """
+    for keep_first in range(0, samples, block):
+        keep_last = min(samples, keep_first + block)
+        first = max(0, keep_first - overlap)
+        last = min(samples, keep_last + overlap)
+        if breakpoints is not None and len(breakpoints):
+            first = breakpoints[max(0, np.searchsorted(breakpoints, first, side='right') - 1)]
+            ix = np.searchsorted(breakpoints, last, side='left')
+            last = breakpoints[ix] if ix < len(breakpoints) else samples
+        yield int(first), int(last), keep_first, keep_last
+
+
+def processBlocks(source, out, kernels, block, overlap, breakpoints=None):
+    """
+    Applies a sequence of preprocessing functions to a recording block by block.
+    :param source: (samples, channels) array, e.g. a memory map. Just one block is in memory at a time.
+    :param out: output array of the same shape (e.g. np.lib.format.open_memmap of a .npy file). The blocks are
+                processed with its dtype.
+    :param kernels: list of functions kernel(block, first), where first is the sample of the recording where the block
+                    starts, that return the processed block.
+    :param block: number of samples kept from every block.
+    :param overlap: samples of overlap (see blockSpans).
+    :param breakpoints: detrend breakpoints (see blockSpans).
+    :return: out.
+    """
+    for first, last, keep_first, keep_last in blockSpans(source.shape[0], block, overlap, breakpoints):
+        data = np.array(source[first:last], dtype=out.dtype)
+        for kernel in kernels:
+            data = kernel(data, first)
+        out[keep_first:keep_last] = data[keep_first - first:keep_last - first]
+    if hasattr(out, 'flush'):
+        out.flush()
+    return out
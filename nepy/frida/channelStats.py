@@ -0,0 +1,109 @@
+"""
+ChannelStats, per channel statistics of EEG data (mean, std, min, max and peak-to-peak) computed in a single pass.
+The data is consumed by chunks of samples and the statistics of every chunk are merged into running accumulators
+(Welford / Chan et al. update of the mean and the sum of squared deviations, in float64), so the same object works for
+an array in memory, that is read chunk by chunk while it is in the cache, and for a recording streamed from the file:
+
+    >>> from nepy.readers.chunkReader import iterChunks
+    >>> stats = ChannelStats()
+    >>> for chunk in iterChunks("nedfdata/20180213122712_Patient01.nedf"):
+    >>>     stats.update(chunk['np_eeg'])
+    >>> stats.std  # uV, one value per channel
+
+It is used by Frida (QC offsets and stds, plotEEG spacing, plotPSD) and by the batch summaries.
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+
+
+class ChannelStats(object):
+    """
+    Description:
+    Running statistics of (samples, channels) data.
+
+    Attributes:
+        count:           number of samples seen.
+        mean:            mean of every channel.
+        m2:              sum of squared deviations from the mean of every channel.
+        min:             minimum of every channel.
+        max:             maximum of every channel.
+        std, var, ptp:   standard deviation (population, as np.std), variance and peak-to-peak (max - min).
+    """
+    def __init__(self, data=None, chunk=2 ** 16):
+        """
+        :param data: optional (samples, channels) array (or a 1 channel array) to start with.
+        :param chunk: number of samples processed at a time.
+        """
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+        self.chunk = chunk
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        """ Adds the samples of a (samples, channels) array. Returns self, so calls can be chained."""
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data[:, None]
+        for first in range(0, data.shape[0], self.chunk):
+            block = data[first:first + self.chunk]
+            values = block.astype(np.float64)
+            mean = np.mean(values, axis=0)
+            values -= mean
+            self.__merge(block.shape[0], mean, np.einsum('ij,ij->j', values, values), np.min(block, axis=0),
+                         np.max(block, axis=0))
+        return self
+
+    def merge(self, other):
+        """ Adds the samples summarized by another ChannelStats (e.g., of another part of the recording)."""
+        if other.count:
+            self.__merge(other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    def __merge(self, count, mean, m2, minimum, maximum):
+        """ Chan et al. update of the accumulators with the statistics of 'count' more samples."""
+        if count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = count, mean.copy(), m2.copy()
+            self.min, self.max = minimum.astype(np.float64), maximum.astype(np.float64)
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.min = np.minimum(self.min, minimum)
+        self.max = np.maximum(self.max, maximum)
+        self.count = total
+
+    @property
+    def var(self):
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def ptp(self):
+        return self.max - self.min
+
+    def summary(self, channels=None):
+        """
+        Summary of the statistics, e.g. for reports or batch logs.
+        :param channels: optional list of channel names.
+        :return: dictionary with the number of samples, and lists with the mean, std, min, max and ptp of every channel
+                 (and the channel names).
+        """
+        summary = {'samples': int(self.count)}
+        if channels is not None:
+            summary['channels'] = list(channels)
+        for name in ['mean', 'std', 'min', 'max', 'ptp']:
+            summary[name] = [float(value) for value in getattr(self, name)] if self.count else []
+        return summary
@@ -0,0 +1,70 @@
+"""
+Piecewise linear detrend of (samples, channels) EEG, used by Frida (detrend step, plotEEG spacing and QC epochs) instead
+of scipy.signal.detrend with breakpoints, which solves a least squares problem for every segment. Here the recording is
+reshaped into (segments, samples, channels) and the line of every segment and channel is removed in closed form (mean
+and slope from sums over the samples), by batches of segments. The last segment, shorter when the recording is not a
+whole number of segments, and irregular breakpoints are detrended segment by segment with the same closed form.
+
+The fits are computed in float64 just for a batch of segments at a time, and the output keeps the dtype of the input
+(float32 EEG stays float32, without a float64 copy of the whole recording):
+
+    >>> eeg = piecewiseDetrend(eeg, np.arange(0, eeg.shape[0], 5000))  # a line every 10 s at 500 Hz
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+
+
+def detrendSegments(segments, dtype=None):
+    """
+    Removes the least squares line of every segment and channel.
+    :param segments: (segments, samples, channels) array.
+    :param dtype: dtype of the output. Default: the dtype of segments.
+    :return: detrended (segments, samples, channels) array (computed in float64).
+    """
+    n = segments.shape[1]
+    t = np.arange(n) - (n - 1) / 2.
+    tt = max(np.dot(t, t), 1.)
+    x = segments.astype(np.float64)
+    mean = np.matmul(np.full(n, 1. / n), x)  # (segments, channels)
+    slope = np.matmul(t, x) / tt
+    x -= mean[:, None, :]
+    x -= slope[:, None, :] * t[None, :, None]
+    return x.astype(segments.dtype if dtype is None else dtype, copy=False)
+
+
+def piecewiseDetrend(data, breakpoints, out=None, batch=4):
+    """
+    Piecewise linear detrend, as scipy.signal.detrend(data, axis=0, bp=breakpoints).
+    :param data: (samples, channels) array.
+    :param breakpoints: samples where the segments start (a segment also starts at 0).
+    :param out: optional output array (it can be data). Default: a new array with the dtype of data.
+    :param batch: number of segments detrended at a time.
+    :return: detrended (samples, channels) array.
+    """
+    samples = data.shape[0]
+    edges = np.unique(np.r_[0, np.asarray(breakpoints, dtype=np.int64), samples])
+    edges = edges[(edges >= 0) & (edges <= samples)]
+    if out is None:
+        out = np.empty_like(data)
+
+    lengths = np.diff(edges)
+    length = int(lengths[0]) if len(lengths) else 0
+    # Regular segments: every breakpoint but the last one spaced 'length' samples.
+    whole = 1
+    while whole < len(lengths) and lengths[whole] == length:
+        whole += 1
+    if whole < len(lengths) - 1:  # irregular breakpoints, segment by segment
+        whole = 0
+
+    if whole:
+        segments = data[:whole * length].reshape(whole, length, data.shape[1])
+        for first in range(0, whole, batch):
+            last = min(first + batch, whole)
+            out[first * length:last * length] = detrendSegments(segments[first:last], out.dtype).reshape(
+                -1, data.shape[1])
+    for first, last in zip(edges[whole:-1], edges[whole + 1:]):
+        out[first:last] = detrendSegments(data[None, first:last], out.dtype)[0]
+    return out
@@ -0,0 +1,90 @@
+"""
+Filtering engine of Frida: the filters are designed once as second-order sections (SOS) and applied with zero-phase
+filtering (forward and backward, scipy's sosfiltfilt) to the whole (samples, channels) EEG matrix along axis 0, instead
+of calling filtfilt(b, a, ...) channel by channel. Second-order sections are also numerically robust at low cutoff
+frequencies, where the transfer function (b, a) of a high order bandpass filter loses precision.
+
+Cascaded filters (e.g., the power line notch and the bandpass filter) can be fused into a single pass, stacking their
+sections:
+
+    >>> sos = np.vstack([notchSOS(50., 30., 500.), bandpassSOS(2., 45., 500., 5)])
+    >>> eeg = zeroPhase(sos, eeg)
+
+Tolerance compared to the per channel filtfilt(b, a) of older versions (float32 EEG): the notch output is the same, the
+bandpass output differs by less than 1e-4 times the amplitude of the input (the (b, a) error at 2 Hz). A fused notch
+and bandpass pass equals the two passes within 1e-3 uV, except for the first and last seconds of the recording, where
+the edge transients of the two passes are not the same (they decay in a few seconds, depending on the DC offsets).
+
+The length of the impulse response of the filters (impulseLength) is the overlap needed to filter a recording by blocks
+(nepy.frida.blockwise) with the same result as filtering it at once.
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, iirnotch, sosfilt, sosfiltfilt, tf2sos
+
+
+@lru_cache(maxsize=32)
+def bandpassSOS(low_cutoff_freq, high_cutoff_freq, fs, order):
+    """ Butterworth bandpass filter (second-order sections, designed once for every set of parameters)."""
+    nyq = 0.5 * fs
+    sos = butter(order, [low_cutoff_freq / nyq, high_cutoff_freq / nyq], btype='bandpass', analog=False, output='sos')
+    sos.flags.writeable = False  # shared by all the callers
+    return sos
+
+
+@lru_cache(maxsize=32)
+def notchSOS(line_freq, Q_notch, fs):
+    """ Notch filter at the power line frequency (second-order sections, designed once for every set of parameters)."""
+    b, a = iirnotch(line_freq, Q_notch, fs)
+    sos = tf2sos(b, a)
+    sos.flags.writeable = False  # shared by all the callers
+    return sos
+
+
+def zeroPhase(sos, data, axis=0, chunk=8):
+    """
+    Zero-phase filtering of all the channels at once.
+    :param sos: second-order sections, (sections, 6) array. Several filters can be stacked (np.vstack) to be applied
+                in a single pass.
+    :param data: (samples, channels) array.
+    :param axis: time axis of data.
+    :param chunk: number of channels filtered at a time when data is not float64 (2-D, axis 0): the filter is computed
+                  in float64, which is numerically stable at low cutoff frequencies, without a float64 copy of the
+                  whole data.
+    :return: filtered data, with the dtype of data (e.g. float32 EEG stays float32).
+    """
+    data = np.asarray(data)
+    sos = np.array(sos, dtype=np.float64)  # writable copy (scipy's sosfilt does not take read-only sections)
+    if data.dtype == np.float64 or data.ndim != 2 or axis not in (0, -2):
+        return sosfiltfilt(sos, data, axis=axis).astype(data.dtype, copy=False)
+    out = np.empty(data.shape, dtype=data.dtype)
+    for first in range(0, data.shape[1], chunk):
+        out[:, first:first + chunk] = sosfiltfilt(sos, data[:, first:first + chunk], axis=0)
+    return out
+
+
+def impulseLength(sos, tol=1e-6, max_samples=2 ** 22):
+    """
+    Length of the impulse response of a filter: number of samples after which the response stays below tol times its
+    peak. Zero-phase filtering a block of samples extended by impulseLength samples on both sides gives the same result
+    as filtering the whole signal (within tol times the amplitude of the signal), away from the ends of the extension.
+    :param sos: second-order sections, (sections, 6) array.
+    :param tol: relative amplitude of the neglected tail of the response.
+    :param max_samples: limit of the length (filters that do not decay).
+    :return: length (samples).
+    """
+    sos = np.array(sos, dtype=np.float64)
+    samples = 2 ** 10
+    while True:
+        impulse = np.zeros(samples)
+        impulse[0] = 1.
+        response = np.abs(sosfilt(sos, impulse))
+        length = int(np.nonzero(response >= tol * np.max(response))[0][-1]) + 1
+        if length < samples // 2 or samples >= max_samples:
+            return length
+        samples *= 4
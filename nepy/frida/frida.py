@@ -16,9 +16,31 @@ import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 
-from scipy.signal import detrend, filtfilt, butter, iirnotch, welch
+from scipy.signal import detrend, welch
 
 from nepy.capsule.capsule import Capsule
+from nepy.frida.channelStats import ChannelStats
+from nepy.frida.blockwise import processBlocks
+from nepy.frida.detrending import detrendSegments, piecewiseDetrend
+from nepy.frida.filters import bandpassSOS, impulseLength, notchSOS, zeroPhase
+
+
+def defaultParameters():
+    """ Default parameters of Frida (see help(Frida))."""
+    return {
+        'signal_offset_limit': 1.,
+        'signal_std_limit': 15.,
+        'epoch_length': 10.,
+        'epoch_amp_threshold': 75.,
+        'epoch_std_threshold': 30.,
+        'detrend_time': 10.,
+        'line_freq': 50.,
+        'Q_notch': 30.,
+        'low_cutoff_freq': 2.,
+        'high_cutoff_freq': 45.,
+        'order': 5,
+        'reference_electrodes': ['Cz']
+    }
 
 
 class Frida(object):
@@ -33,11 +55,21 @@ class Frida(object):
     Attributes:
           c:     Capsule object (for more information check the Capsule Docstring
           log: log containing all the preprocessing steps
-          eeg: processed eeg
-          eeg_original: original capsule eeg
+          eeg: processed eeg. Before the first preprocessing step (and after a reset) Frida works on a read-only view
+               of eeg_original (if they have the same dtype), and the steps write their output to new arrays, so the
+               working buffer is allocated by the first step. Reading eeg from outside Frida while it is that view
+               copies it (copy-on-read, once: any read, e.g. f.eeg.shape, allocates the working buffer), so that eeg
+               can always be modified in place. Read eeg_original to look at the raw data without copying it.
+          eeg_original: original capsule eeg (a view of the time span of the Capsule eeg, see releaseRaw)
+          time, markers, stim: np_time, np_markers and np_stim of the time span (views of the Capsule streams, taken
+               on their first use). The Capsule is not modified, so several Frida objects can share it.
+          dtype: dtype of eeg through all the preprocessing steps (see precisionReport)
+          reference_electrodes: reference electrodes of eeg, once rereferenced (see preprocess)
           offsets: offset array of the signal
           sigmas: stds of the signals
-          PSD: dictionary with PSD info
+          stats: ChannelStats of the eeg computed by QC (mean, std, min, max and peak-to-peak of every channel)
+          PSD: dictionary with PSD info. It is computed when it is read for the first time after eeg changes (a new
+               array assigned to eeg); call updatePSD() after modifying eeg in place.
           bad_chan: channel flags related to channel threshold
           bad_records: bad epochs informaition dictionary
           param: Directory with all necessary parameters to perform the quality check (QC).
@@ -102,7 +134,8 @@ class Frida(object):
     >>>f.plotPSD()  # Plot the resulting PSDs
     """
 
-    def __init__(self, filepath, author="anonymous", parameters=None, time_span=None, verbose=True):
+    def __init__(self, filepath, author="anonymous", parameters=None, time_span=None, verbose=True, dtype='float32',
+                 capsule=None):
         """
         Initialization of a Frida object. What do we need:
         :param filepath: datapath + filename + extension of the file that we want to preprocess
@@ -111,10 +144,19 @@ class Frida(object):
         :param time_span: time span that we want to study. It can be either an integer/float, or a list of two numbers,
                             the initial and final seconds. Units: seconds. Default: the original lenght of the file.
         :param verbose: flag to plot or not what is read by the easyReader. By default, it is on.
+        :param dtype: dtype of the processed eeg. Default: 'float32', as read from the files. Every preprocessing step
+                      keeps it (the filters and the detrend are computed in float64 by parts), so that the working set
+                      is half the size of a float64 one. Use 'float64' for the float64 path.
+        :param capsule: Capsule of the file, if it has already been created (e.g., read ahead by processDirectory).
         """
 
-        # Creating a Capsule object with the filepath provided by the user.
-        c = Capsule(filepath, author, verbose=verbose)
+        # Creating a Capsule object with the filepath provided by the user. If we just want a time span of a .nedf
+        # or .easy.gz file, the file is opened lazily so that only the records of the span are decoded.
+        self.dtype = np.dtype(dtype)
+        if capsule is None:
+            capsule = Capsule(filepath, author, verbose=verbose,
+                              lazy=time_span is not None and type(time_span) is not str)
+        c = capsule
         self.c = c
         self.log = ["Object created: " + self.c.capsuledate]
         self.good_init = True
@@ -123,20 +165,7 @@ class Frida(object):
             return
 
         if parameters is None:  # Default parameters if there is no parameter input.
-            self.param = {
-                'signal_offset_limit': 1.,
-                'signal_std_limit': 15.,
-                'epoch_length': 10.,
-                'epoch_amp_threshold': 75.,
-                'epoch_std_threshold': 30.,
-                'detrend_time': 10.,
-                'line_freq': 50.,
-                'Q_notch': 30.,
-                'low_cutoff_freq': 2.,
-                'high_cutoff_freq': 45.,
-                'order': 5,
-                'reference_electrodes': ['Cz']
-            }
+            self.param = defaultParameters()
         else:
             if len(parameters) is not 12:  # If there's some parameter missing...
                 print('\033[0;31;48m \nThere are parameters missing to perform a Frida test. Expected parameters:')
@@ -165,27 +194,29 @@ class Frida(object):
 
         # Now that we have saved the parameters we can check the time_span.
         if (time_span is None) or type(time_span) is str:  # Default time_span. The original shape of the file.
-            span = [0, self.c.np_eeg.shape[0]]
+            span = [0, self.c.reader.samples if self.c.reader is not None else self.c.np_eeg.shape[0]]
             good_span = 1
         else:  # Check what the user has input and return it in the right format
             span, good_span = self.__check_timespan(time_span)
 
         if good_span:
-            self.eeg_original = self.c.np_eeg[span[0]:span[1], :]
-            self.eeg = self.eeg_original.copy()
-            self.c.np_time = self.c.np_time[span[0]:span[1]]
-            self.c.np_markers = self.c.np_markers[span[0]:span[1]]
-            if len(self.c.np_stim) > 0:
-                self.c.np_stim = self.c.np_stim[span[0]:span[1], :]
+            self.__span = span
+            if self.c.reader is not None:  # Read just the records of the span from the file.
+                window = self.c.reader.readRecords(span[0], span[1])
+                self.eeg_original = window['np_eeg']
+                self.__streams = {name: window[name] for name in ['np_time', 'np_markers', 'np_stim']}
+            else:
+                self.eeg_original = self.c.np_eeg[span[0]:span[1], :]
+                self.__streams = {}  # sliced on their first use (see __stream)
+            self.__use_raw()
             self.detrend_flag = False
-            self.updatePSD()
         else:
             self.good_init = False
             return
         # Initialize extra attributes where we are going to save the output of the Frida test:
         self.offsets = None
         self.sigmas = None
-        self.PSD = None
+        self.stats = None
         self.bad_chan = {}
         self.bad_records = None
 
@@ -262,7 +293,7 @@ class Frida(object):
 
         # 2. Finding the maximum epochs per channel and printing info.
         #    If data is too small, don't do QC()
-        channel_data = np.transpose(self.eeg)
+        channel_data = np.transpose(self.__eeg)
         print("Minutes of data: {minu:3.1f}".format(minu=channel_data.shape[1] / self.c.fs / 60.))
         max_epochs = int((np.floor(channel_data.shape[1] / self.c.fs) - p['epoch_length']) / p['epoch_length'])
         if max_epochs == 0:
@@ -271,22 +302,21 @@ class Frida(object):
             return
         print("Max epochs per channel: ", max_epochs)
 
-        # 3. Identify bad epochs:
+        # 3. Identify bad epochs: the amplitude and std of the detrended epochs of all channels are computed at once
+        #    on an (epochs, samples, channels) array. The channel-epochs that are bad or close to a threshold are
+        #    checked again one by one with __check_badepochs, so that bad_records is the same as checking every
+        #    channel-epoch independently.
         bad_records = []
         print('\n-Epoch Amplitude threshold: ', p['epoch_amp_threshold'])
         print('-Epoch STD threshold: ', p['epoch_std_threshold'], '\n')
-        for timeskip in range(0, max_epochs):
-            try:
-                for channel in range(self.c.num_channels):
-                    segment = np.array(np.arange(timeskip * p['epoch_length'] * self.c.fs,
-                                                 timeskip * p['epoch_length'] * self.c.fs + p[
-                                                     'epoch_length'] * self.c.fs), dtype="int32")
-                    signal = channel_data[channel, segment].flatten()
-                    fl, maxAmp, STD = self.__check_badepochs(signal)
-                    if fl is True:
-                        bad_records.append([channel, timeskip, maxAmp, STD])
-            except:
-                break
+        epochs = self.__epochs(max_epochs)
+        maxamps, stds, peaks = self.__epoch_stats(epochs)
+        candidates = (maxamps > p['epoch_amp_threshold'] - 1e-4 * (peaks + p['epoch_amp_threshold'])) | \
+                     (stds > p['epoch_std_threshold'] - 1e-4 * (peaks + p['epoch_std_threshold']))
+        for timeskip, channel in np.argwhere(candidates):
+            fl, maxAmp, STD = self.__check_badepochs(epochs[timeskip, :, channel].flatten())
+            if fl is True:
+                bad_records.append([int(channel), int(timeskip), maxAmp, STD])
         self.bad_records = bad_records
 
         print("""Found {Nbad} bad channel-epochs out of {total}, or {pc:2.1f}%.
@@ -300,7 +330,7 @@ class Frida(object):
                 ch=ch, name=self.c.electrodes[ch], ll=len(lista), pc=pc))
         print("\n---------QC COMPLETE---------")
 
-    def preprocess(self, pipeline=None):
+    def preprocess(self, pipeline=None, fuse_filters=False, out=None, block_seconds=60.):
         """ Preprocess the data
         for a specific input pipeline.
         :param pipeline: list of strings with the name of the functions to preprocess in a specific order.
@@ -316,27 +346,47 @@ class Frida(object):
                                                using a quality factor 'Q_notch'.
 
                          Default: ['reset', 'rereference', 'detrend', 'remove_line_freq', 'bandpassfilter']
+        :param fuse_filters: if True, consecutive 'remove_line_freq' and 'bandpassfilter' steps are applied as a single
+                             zero-phase pass of the cascaded filters (see nepy.frida.filters for the tolerance).
+        :param out: if given, the pipeline is run by blocks of 'block_seconds' (recordings that do not fit in memory,
+                    see nepy.frida.blockwise) and the result is written to 'out', a .npy filepath (memory mapped
+                    afterwards as eeg) or a (samples, channels) array. Then 'reset' can just be the first step.
+        :param block_seconds: length of the blocks (seconds) when 'out' is given.
         """
 
         if pipeline is None:
             pipeline = ['reset', 'rereference', 'detrend', 'remove_line_freq', 'bandpassfilter']
+        if fuse_filters:
+            pipeline = self.__fuse(pipeline)
 
         print('---------PREPROCESSING---------')
         print("Pipeline:")
         print(pipeline)
         print("-------------------------------")
+        if out is not None and not self.__preprocess_blocks(pipeline, out, block_seconds):
+            return
 
         step = 1
         for action in pipeline:
             print("Step", step, ": ", action, " ...")
-            exec("self._Frida__" + action + "()")
-            self.updatePSD()
+            getattr(self, "_Frida__" + action)(apply=out is None)
             step += 1
             print("-------------------------------")
             print(" ")
         print("Done: Updated Log: ", self.log)
         print(" ")
 
+    @staticmethod
+    def __fuse(pipeline):
+        """ Pipeline with the consecutive 'remove_line_freq' and 'bandpassfilter' steps fused."""
+        fused = []
+        for action in pipeline:
+            if fused and {fused[-1], action} == {'remove_line_freq', 'bandpassfilter'}:
+                fused[-1] = 'notch_bandpassfilter'
+            else:
+                fused.append(action)
+        return fused
+
     def plotEEG(self, spacing=None, fixlim=True, xlim=False):
         """ Plot EEG
         Function to visualize the EEG data
@@ -348,10 +398,10 @@ class Frida(object):
         c = self.c
         if spacing is None:
             if not self.detrend_flag:
-                df_eeg = detrend(self.eeg, axis=0, bp=np.arange(0, self.eeg.shape[0], self.param['detrend_time'] * c.fs, dtype="int32"))
+                df_eeg = piecewiseDetrend(self.__eeg, self.__breakpoints(self.__eeg.shape[0]))
             else:
-                df_eeg = self.eeg
-            spacing = int(np.max(df_eeg))
+                df_eeg = self.__eeg
+            spacing = int(np.max(ChannelStats(df_eeg).max))
 
         print("\033[1mPlotting EEG channels after this pipeline:\033[0m")
         for n in range(0, len(self.log)):
@@ -361,9 +411,9 @@ class Frida(object):
         _, ax = plt.subplots(1, 1, figsize=[12.0, c.num_channels * 0.75])
         for ch in range(1, c.num_channels+1):
             if ch % 2 == 0:
-                plt.plot(c.np_time, self.eeg[:, ch-1] + spacing * ch, color='r')
+                plt.plot(self.time, self.__eeg[:, ch-1] + spacing * ch, color='r')
             else:
-                plt.plot(c.np_time, self.eeg[:, ch-1] + spacing * ch, color='b')
+                plt.plot(self.time, self.__eeg[:, ch-1] + spacing * ch, color='b')
 
         plt.grid(which='major')
         plt.grid(which='minor')
@@ -394,7 +444,6 @@ class Frida(object):
         function that computes (and plots) the PSD of the eeg channels.
         """
         c = self.c
-        self.updatePSD()  # Check if necessary.
         print("\033[1mPlotting PSDs after this pipeline:\033[0m")
         for n in range(0, len(self.log)):
             print(n + 1, ".", self.log[n])
@@ -402,9 +451,10 @@ class Frida(object):
 
         f = self.PSD['frequencies']
         PSDs = self.PSD['PSDs']
+        stds = ChannelStats(self.__eeg).std
         for ix in range(c.num_channels):
             print("\nChannel {chix}: {chname}, STD={stdv:6.1f} uV".format(chix=str(ix + 1), chname=c.electrodes[ix],
-                                                                          stdv=np.std(self.eeg[:, ix])))
+                                                                          stdv=stds[ix]))
 
             PSD = PSDs[ix]
             _, ax = plt.subplots(1, 1, figsize=[12.0, 2.5])
@@ -447,8 +497,9 @@ class Frida(object):
         """
 
         flag = False
-        w = np.max(np.abs(detrend(signal)))
-        std = np.std(detrend(signal))
+        detrended = detrend(signal)
+        w = np.max(np.abs(detrended))
+        std = np.std(detrended)
 
         if w > self.param['epoch_amp_threshold']:
             flag = True
@@ -462,13 +513,76 @@ class Frida(object):
 
         return flag, w, std
 
-    def __reset(self):
+    def __epochs(self, max_epochs):
+        """
+        Epochs of the QC as an (epochs, samples, channels) array: a view of the EEG if the epochs have a whole number
+        of samples, else a copy with the samples of every epoch taken as in the original per epoch indexing.
+        """
+        length = self.param['epoch_length'] * self.c.fs
+        if float(length).is_integer():
+            n = int(length)
+            return self.__eeg[:max_epochs * n, :self.c.num_channels].reshape(max_epochs, n, self.c.num_channels)
+        segments = np.array([np.arange(timeskip * self.param['epoch_length'] * self.c.fs,
+                                       timeskip * self.param['epoch_length'] * self.c.fs + length)
+                             for timeskip in range(max_epochs)], dtype="int32")
+        return self.__eeg[:, :self.c.num_channels][segments]
+
+    def __epoch_stats(self, epochs, batch=16):
+        """
+        Maximum absolute amplitude and std of the linearly detrended epochs, for all epochs and channels at once.
+        The least squares line of every epoch is removed in closed form (detrendSegments, float64), by batches of epochs
+        to bound the memory used. The float32 detrend of __check_badepochs differs from these values by less than 1e-4 times the
+        peak absolute value of the epoch.
+        :param epochs: (epochs, samples, channels) array.
+        :return: maximum amplitudes, stds and peak absolute values (before detrending), (epochs, channels) arrays.
+        """
+        maxamps = np.zeros((epochs.shape[0], epochs.shape[2]))
+        stds = np.zeros_like(maxamps)
+        peaks = np.zeros_like(maxamps)
+        for first in range(0, epochs.shape[0], batch):
+            peaks[first:first + batch] = np.max(np.abs(epochs[first:first + batch]), axis=1)
+            x = detrendSegments(epochs[first:first + batch], np.float64)
+            maxamps[first:first + batch] = np.max(np.abs(x), axis=1)
+            stds[first:first + batch] = np.std(x, axis=1)
+        return maxamps, stds, peaks
+
+    def __reset(self, apply=True):
         """Resets the attribute self.eeg to the original, unprocessed/raw data."""
 
-        self.eeg = self.eeg_original.copy()
+        if apply:
+            self.__use_raw()
         self.detrend_flag = False
         self.log.append("EEG reset on " + time.strftime("%Y-%m-%d %H:%M"))
 
+    def __use_raw(self):
+        """
+        Sets eeg to eeg_original, with the dtype of Frida: a read-only view if it has that dtype already (copied on the
+        first read from outside Frida, see the eeg property), or else a copy.
+        """
+        if self.eeg_original.dtype != self.dtype:
+            self.eeg = self.eeg_original.astype(self.dtype)
+            return
+        self.eeg = self.eeg_original.view()
+        self.__eeg.flags.writeable = False
+        self.__raw = True
+
+    def releaseRaw(self):
+        """
+        Keeps just the time span of the recording: eeg_original, time, markers and stim are replaced by copies of the
+        span, and c by a copy of the Capsule without its arrays (see Capsule.metadata_copy). Frida then holds no array
+        of the whole recording, that is freed once no one else uses it (the Capsule itself is not modified), so that
+        windowed analyses take memory in proportion to the window. Nothing is copied for the whole recording.
+        """
+        if self.eeg_original.shape != getattr(vars(self.c).get('np_eeg'), 'shape', None):  # a part of the recording
+            for name in ['np_time', 'np_markers', 'np_stim']:
+                self.__streams[name] = np.array(self.__stream(name))
+            if self.eeg_original.base is not None:
+                self.eeg_original = np.array(self.eeg_original)
+                if self.__raw:
+                    self.__use_raw()
+            self.c = self.c.metadata_copy()
+        self.log.append("Raw recording released on " + time.strftime("%Y-%m-%d %H:%M"))
+
     def __check_offset_std(self, plotit=True):
         """
         Check the offsets for every EEG channel (np_eeg) and mark it with an (*) if the thresholds are exceeded.
@@ -478,9 +592,10 @@ class Frida(object):
         print("Offset limit: ", p['signal_offset_limit'])
         print("STD limit: ", p['signal_std_limit'])
 
-        offsets = [np.mean(self.eeg, axis=0)[ch] / 1000 for ch in range(0, self.eeg.shape[1])]  # mV
+        stats = ChannelStats(self.__eeg)  # a single pass over the data
+        offsets = list(stats.mean / 1000)  # mV
         offset_flag = np.ones(len(offsets))
-        sigmas = [np.std(self.eeg, axis=0)[ch] for ch in range(0, self.eeg.shape[1])]  # uV
+        sigmas = list(stats.std)  # uV
         sigma_flag = np.ones(len(sigmas))
 
         for ch in range(self.c.num_channels):
@@ -521,110 +636,257 @@ class Frida(object):
 
         self.offsets = offsets
         self.sigmas = sigmas
+        self.stats = stats
 
         self.bad_chan = {
             'offset': offset_flag,
             'sigma': sigma_flag
         }
 
-    def __rereference(self):
+    def __rereference(self, apply=True):
         """Rereference the data to a channel, a collection of channels or the average ref."""
         p = self.param
         print("Reference electrodes: ", p['reference_electrodes'])
-        self.c.reference_electrodes = p['reference_electrodes']
-
-        try:
-            sorted_electrode_index = [self.c.electrodes.index(element) for element in p['reference_electrodes']]
-            if len(p['reference_electrodes']) == 1:
-                ref = self.eeg[:, sorted_electrode_index[0]]
-            else:
-                print("Computing mean of: ", p['reference_electrodes'])
-                ref = np.mean(self.eeg[:, sorted_electrode_index], axis=1)
-        except:
-            print("Using average reference")
-            ref = np.mean(self.eeg, axis=1)
-
-        df_eeg_ref = self.eeg.copy()
+        self.reference_electrodes = p['reference_electrodes']
 
-        for ch in range(self.eeg.shape[1]):
-            df_eeg_ref[:, ch] = self.eeg[:, ch] - ref
-
-        self.eeg = df_eeg_ref
+        if apply:  # False: already applied by blocks
+            self.eeg = self.__kernel('rereference', self.__eeg.shape[0])(self.__eeg, 0)
         self.log.append(
             'Reference to: ' + " ".join(p['reference_electrodes']) + " on " + time.strftime("%Y-%m-%d %H:%M"))
 
-    def __detrend(self):
+    def __detrend(self, apply=True):
         """ Detrend data linearly in a specific time window, 'detrend_time'."""
         p = self.param
         print("Every ", p['detrend_time'], " seconds")
-        df_eeg_det = detrend(self.eeg, axis=0,
-                             bp=np.arange(0, self.eeg.shape[0], p['detrend_time'] * self.c.fs, dtype="int32"))
-
-        self.eeg = df_eeg_det
+        if apply:  # False: already applied by blocks
+            self.eeg = self.__kernel('detrend', self.__eeg.shape[0])(self.__eeg, 0)
         self.log.append('Detrend data every ' + str(p['detrend_time']) + " s on " + time.strftime("%Y-%m-%d %H:%M"))
         self.detrend_flag = True
 
-    def __bandpassfilter(self):
+    def __bandpassfilter(self, apply=True):
         """ Band pass filter the data with a butterworth filter with a specific cutoff frequencies"""
         p = self.param
-        c = self.c
         print("Cutoff frequencies: ", p['low_cutoff_freq'], "-", p['high_cutoff_freq'])
 
-        nyq = 0.5 * self.c.fs
-        normal_cutoff1 = self.param['low_cutoff_freq'] / nyq
-        normal_cutoff2 = self.param['high_cutoff_freq'] / nyq
-        [b, a] = butter(self.param['order'], [normal_cutoff1, normal_cutoff2], btype='bandpass', analog=False)
-
-        for ch in range(c.num_channels):
-            filtered = filtfilt(b, a, self.eeg[:, ch])
-            self.eeg[:, ch] = filtered
+        if apply:  # False: already applied by blocks
+            self.eeg = self.__kernel('bandpassfilter', self.__eeg.shape[0])(self.__eeg, 0)
 
         self.log.append('Filter at low_cutoff_freq= ' + str(p['low_cutoff_freq']) + " and high_cutoff_freq=" + str(
             p['high_cutoff_freq']) + " on " + time.strftime("%Y-%m-%d %H:%M"))
 
-    def __remove_line_freq(self):
+    def __remove_line_freq(self, apply=True):
         """Notch filter the data to remove the power line frequency component."""
-        c = self.c
         p = self.param
         print("Power line frequency: ", p['line_freq'])
         print("Notch Q-factor: ", p['Q_notch'])
 
-        # w0 = 1.0 * p['line_freq'] / (c.fs / 2.) older version of scipy
-        b, a = iirnotch(p['line_freq'], p['Q_notch'], self.c.fs)  # scipy 1.2.0
+        if apply:  # False: already applied by blocks
+            self.eeg = self.__kernel('remove_line_freq', self.__eeg.shape[0])(self.__eeg, 0)
+        self.log.append('Notch at ' + str(p['line_freq']) + " with Q=" + str(p['Q_notch']) + " on " + time.strftime(
+            "%Y-%m-%d %H:%M"))
+
+    def __notch_bandpassfilter(self, apply=True):
+        """ Notch and band pass filter the data in a single pass (fuse_filters option of preprocess)."""
+        p = self.param
+        print("Power line frequency: ", p['line_freq'], ", Notch Q-factor: ", p['Q_notch'])
+        print("Cutoff frequencies: ", p['low_cutoff_freq'], "-", p['high_cutoff_freq'])
 
-        for ch in range(c.num_channels):
-            filtered = filtfilt(b, a, self.eeg[:, ch])
-            self.eeg[:, ch] = filtered
+        if apply:  # False: already applied by blocks
+            self.eeg = self.__kernel('notch_bandpassfilter', self.__eeg.shape[0])(self.__eeg, 0)
         self.log.append('Notch at ' + str(p['line_freq']) + " with Q=" + str(p['Q_notch']) + " on " + time.strftime(
             "%Y-%m-%d %H:%M"))
+        self.log.append('Filter at low_cutoff_freq= ' + str(p['low_cutoff_freq']) + " and high_cutoff_freq=" + str(
+            p['high_cutoff_freq']) + " on " + time.strftime("%Y-%m-%d %H:%M"))
+
+    def __sos(self, action):
+        """ Second-order sections of the filter of a preprocessing step."""
+        p = self.param
+        notch = notchSOS(p['line_freq'], p['Q_notch'], self.c.fs)
+        bandpass = bandpassSOS(p['low_cutoff_freq'], p['high_cutoff_freq'], self.c.fs, p['order'])
+        return {'remove_line_freq': notch, 'bandpassfilter': bandpass,
+                'notch_bandpassfilter': np.vstack([notch, bandpass])}[action]
+
+    def __kernel(self, action, samples):
+        """
+        Array function of a preprocessing step, shared by preprocess in memory and by blocks.
+        :param action: 'rereference', 'detrend', 'remove_line_freq', 'bandpassfilter' or 'notch_bandpassfilter'.
+        :param samples: number of samples of the whole eeg (detrend breakpoints).
+        :return: function kernel(eeg, first) of an eeg block that starts at the sample 'first' of the whole eeg.
+        """
+        p = self.param
+        if action == 'rereference':
+            try:
+                sorted_electrode_index = [self.c.electrodes.index(element) for element in p['reference_electrodes']]
+                if len(p['reference_electrodes']) > 1:
+                    print("Computing mean of: ", p['reference_electrodes'])
+            except ValueError:
+                print("Using average reference")
+                sorted_electrode_index = None
+
+            def kernel(eeg, first):
+                if sorted_electrode_index is None:
+                    ref = np.mean(eeg, axis=1)
+                elif len(sorted_electrode_index) == 1:
+                    ref = eeg[:, sorted_electrode_index[0]]
+                else:
+                    ref = np.mean(eeg[:, sorted_electrode_index], axis=1)
+                return eeg - ref[:, None]
+
+        elif action == 'detrend':
+            breakpoints = self.__breakpoints(samples)
+
+            def kernel(eeg, first):
+                bp = breakpoints[(breakpoints >= first) & (breakpoints < first + eeg.shape[0])] - first
+                return piecewiseDetrend(eeg, bp)
+
+        else:
+            sos = self.__sos(action)
+
+            def kernel(eeg, first):
+                return zeroPhase(sos, eeg)
+
+        return kernel
+
+    def __breakpoints(self, samples):
+        """ Breakpoints of the piecewise linear detrend (every 'detrend_time' seconds)."""
+        return np.arange(0, samples, self.param['detrend_time'] * self.c.fs, dtype="int32")
+
+    def __preprocess_blocks(self, pipeline, out, block_seconds):
+        """
+        Runs the pipeline by blocks (see nepy.frida.blockwise) and writes the result to 'out'. Returns False if the
+        pipeline has steps that cannot be run by blocks.
+        """
+        blockwise = ['rereference', 'detrend', 'remove_line_freq', 'bandpassfilter', 'notch_bandpassfilter']
+        source = self.__eeg
+        if pipeline and pipeline[0] == 'reset':
+            source = self.eeg_original
+            pipeline = pipeline[1:]
+        if any(action not in blockwise for action in pipeline):
+            print("\033[91m ERROR @preprocess: just 'reset' (first) and the steps", blockwise,
+                  "can be run by blocks. \033[0m")
+            return False
+
+        samples = source.shape[0]
+        kernels = [self.__kernel(action, samples) for action in pipeline]
+        overlap = 0
+        for action in pipeline:
+            if action == 'detrend' and overlap:  # the filtered edges spread to the whole detrend segment
+                overlap += int(np.ceil(self.param['detrend_time'] * self.c.fs))
+            elif action not in ['rereference', 'detrend']:
+                overlap += impulseLength(self.__sos(action))
+        breakpoints = self.__breakpoints(samples) if 'detrend' in pipeline else None
+        print("Blocks of ", block_seconds, " s, overlap of ", overlap / self.c.fs, " s")
+
+        if isinstance(out, str):
+            out = np.lib.format.open_memmap(out, mode='w+', dtype=self.dtype, shape=source.shape)
+        self.eeg = processBlocks(source, out, kernels, int(block_seconds * self.c.fs), overlap, breakpoints)
+        return True
+
+    def precisionReport(self, pipeline=None, fuse_filters=False):
+        """
+        Validation of the dtype of Frida against the float64 path: it runs the pipeline on the original eeg with both
+        dtypes (eeg is not modified) and reports the maximum deviation after every step.
+        :param pipeline: preprocessing steps (see preprocess), just 'reset' and the steps that preprocess can run by
+                         blocks. Default: the default pipeline of preprocess.
+        :param fuse_filters: see preprocess.
+        :return: list of dictionaries with the step, the maximum absolute deviation (uV) and the maximum deviation
+                 relative to the peak absolute value of the float64 eeg after the step.
+        """
+        if pipeline is None:
+            pipeline = ['reset', 'rereference', 'detrend', 'remove_line_freq', 'bandpassfilter']
+        if fuse_filters:
+            pipeline = self.__fuse(pipeline)
+        samples = self.eeg_original.shape[0]
+        eeg = np.asarray(self.eeg_original, dtype=self.dtype)  # the kernels do not modify their input
+        eeg64 = self.eeg_original.astype(np.float64)
+        report = []
+        print("Deviation of the {0} path from the float64 path:".format(self.dtype))
+        for action in pipeline:
+            if action != 'reset':
+                kernel = self.__kernel(action, samples)
+                eeg, eeg64 = kernel(eeg, 0), kernel(eeg64, 0)
+            deviation = float(np.max(np.abs(eeg - eeg64))) if eeg.size else 0.
+            peak = float(np.max(np.abs(eeg64))) if eeg.size else 0.
+            report.append({'step': action, 'max_deviation': deviation,
+                           'relative_deviation': deviation / peak if peak else 0.})
+            print("{0:<22}: max {1:.3e} uV, relative {2:.3e}".format(action, deviation, report[-1]['relative_deviation']))
+        return report
+
+    @property
+    def eeg(self):
+        """ Processed eeg. The read-only view of eeg_original is copied on its first read (copy-on-read, see Frida)."""
+        if self.__raw:  # the raw view is copied to a private working buffer, that the caller can modify in place
+            self.__eeg = np.array(self.__eeg)
+            self.__raw = False
+        return self.__eeg
+
+    @eeg.setter
+    def eeg(self, eeg):
+        self.__eeg = eeg
+        self.__raw = False
+        self.__psd = None  # computed again when it is read
+
+    @property
+    def time(self):
+        """ Time stamps of the time span (seconds)."""
+        return self.__stream('np_time')
+
+    @property
+    def markers(self):
+        """ Markers of the time span."""
+        return self.__stream('np_markers')
+
+    @property
+    def stim(self):
+        """ Stimulation data of the time span (two samples per EEG sample, .nedf files with stimulation only)."""
+        return self.__stream('np_stim')
+
+    def __stream(self, name):
+        """
+        Time span of a stream of the Capsule, sliced on its first use, so that the streams of an on-demand Capsule that
+        are not used are not decoded.
+        """
+        if name not in self.__streams:
+            first, last = self.__span
+            values = getattr(self.c, name)
+            if name == 'np_stim':  # two stim samples per EEG sample
+                self.__streams[name] = values[2 * first:2 * last] if len(values) > 0 else values
+            else:
+                self.__streams[name] = values[first:last]
+        return self.__streams[name]
+
+    @property
+    def PSD(self):
+        """ PSDs of the eeg (see updatePSD), computed the first time they are read after eeg changes."""
+        if self.__psd is None:
+            self.updatePSD()
+        return self.__psd
 
     def updatePSD(self):
         """
-        it computes the PSDs of the eeg and saves them in the self.PSD dictionary attribute.
+        it computes the PSDs of the eeg and saves them in the self.PSD dictionary attribute. It is called when PSD is
+        read after eeg changes; call it directly after modifying eeg in place.
         """
 
         # Welch parameters:
-        window = 'hanning'
-        nperseg = 10 * self.c.fs
-        noverlap = nperseg / 2.
+        window = 'hann'
+        nperseg = int(10 * self.c.fs)
         nfft = None
         detrendit = 'constant'  # or linear
         return_onesided = True
         scaling = 'density'
 
-        PSDs = []
-        f = []
-        for ix in range(self.c.num_channels):
-            # Welch parameters:
-            if self.eeg[:, ix].shape[0] < nperseg:
-                nperseg = 500  # Default
-                noverlap = nperseg / 2.
-            f, Pxx_den = welch(self.eeg[:, ix], fs=self.c.fs, window=window, nperseg=nperseg, noverlap=noverlap,
-                               nfft=nfft, detrend=detrendit, return_onesided=return_onesided, scaling=scaling, axis=-1)
-            PSDs.append(Pxx_den)
-        self.PSD = {
+        if self.__eeg.shape[0] < nperseg:
+            nperseg = 500  # Default
+        noverlap = nperseg // 2
+        # All the channels at once, along the time axis: PSDs[ch] is the PSD of channel ch.
+        f, PSDs = welch(self.__eeg[:, :self.c.num_channels].T, fs=self.c.fs, window=window, nperseg=nperseg,
+                        noverlap=noverlap, nfft=nfft, detrend=detrendit, return_onesided=return_onesided,
+                        scaling=scaling, axis=-1)
+        self.__psd = {
             "frequencies": f,
             "PSDs": PSDs,
             "Channels": self.c.electrodes,
             "Log:": self.log}
+        return self.__psd
 
@@ -0,0 +1,126 @@
+"""
+Manifest of the batch runs of processDirectory: a SQLite database in the output directory with one row per recording,
+that records the content hash of the file, the configuration (parameters and pipeline), the status of the last run
+('done' or 'failed', with the traceback), its timings and the QC summary. Every file is recorded as soon as it has been
+processed, so when a run dies halfway, the next run skips the files that are done with the same content and
+configuration, and processes the rest (new, changed and failed files) again:
+
+    >>> processDirectory(datapath, outpath="/data/nightly", workers=8)  # /data/nightly/nepy_manifest.sqlite
+    >>> Manifest("/data/nightly").query("status = ?", ("failed",))
+
+The content hash of a file is computed when it is processed; on the next runs it is just computed again if the size or
+the modification time of the file have changed.
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import hashlib
+import json
+import os
+import time
+
+from nepy.readers.catalog import sqliteConnect, sqliteCount, sqliteQuery
+
+# Manifest fields (name, SQLite type).
+fields = [
+    ('filename', 'TEXT PRIMARY KEY'),
+    ('hash', 'TEXT'),
+    ('size', 'INTEGER'),
+    ('mtime_ns', 'INTEGER'),
+    ('config', 'TEXT'),
+    ('status', 'TEXT'),
+    ('error', 'TEXT'),
+    ('started', 'TEXT'),
+    ('seconds', 'REAL'),
+    ('qc', 'TEXT')
+]
+
+
+def fileHash(filepath, blocksize=2 ** 20):
+    """ SHA-256 of the content of a file (hex string)."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as fil:
+        for block in iter(lambda: fil.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def configuration(parameters, pipeline):
+    """ Configuration of a run as a canonical JSON string (runs with the same configuration give the same string)."""
+    return json.dumps({'parameters': parameters, 'pipeline': pipeline}, sort_keys=True)
+
+
+class Manifest(object):
+    """
+    Manifest of the recordings processed into an output directory (see the module docstring).
+
+    Attributes:
+        outpath:    output directory (created if needed).
+        dbpath:     path of the SQLite database. Default: outpath/nepy_manifest.sqlite
+    """
+    def __init__(self, outpath, dbpath=None):
+        self.outpath = outpath
+        if not os.path.isdir(outpath):
+            os.makedirs(outpath)
+        self.dbpath = dbpath if dbpath is not None else os.path.join(outpath, "nepy_manifest.sqlite")
+        with sqliteConnect(self.dbpath, fields):
+            pass
+
+    def get(self, filename):
+        """ Row of a file name (dictionary of the manifest fields, with the decoded QC summary), or None."""
+        rows = self.query("filename = ?", (filename,))
+        return rows[0] if rows else None
+
+    def isDone(self, filepath, config):
+        """
+        True if the file has been processed with this configuration and its content has not changed since then (the
+        hash is just computed again if the size or the modification time of the file are not the recorded ones).
+        """
+        row = self.get(os.path.basename(filepath))
+        if row is None or row['status'] != 'done' or row['config'] != config:
+            return False
+        stat = os.stat(filepath)
+        if (row['size'], row['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+            return True
+        if fileHash(filepath) != row['hash']:
+            return False
+        with sqliteConnect(self.dbpath) as db:  # same content: remember the new size and modification time
+            db.execute("UPDATE recordings SET size = ?, mtime_ns = ? WHERE filename = ?",
+                       (stat.st_size, stat.st_mtime_ns, row['filename']))
+        return True
+
+    def record(self, filepath, config, filehash, started, seconds, summary=None, error=None):
+        """
+        Records the run of a file.
+        :param filepath: processed file.
+        :param config: configuration (see configuration).
+        :param filehash: content hash of the file (see fileHash).
+        :param started: unix time when the file started to be processed.
+        :param seconds: processing time.
+        :param summary: QC summary (JSON serializable), if the file has been processed.
+        :param error: traceback of the error, if the file failed.
+        """
+        stat = os.stat(filepath)
+        values = [os.path.basename(filepath), filehash, stat.st_size, stat.st_mtime_ns, config,
+                  'done' if error is None else 'failed', error, time.strftime("%Y-%m-%d %H:%M:%S",
+                                                                              time.localtime(started)),
+                  seconds, json.dumps(summary)]
+        with sqliteConnect(self.dbpath) as db:
+            db.execute("INSERT OR REPLACE INTO recordings VALUES ({0})".format(", ".join("?" * len(fields))), values)
+
+    def query(self, where=None, params=(), order_by="filename"):
+        """
+        Returns the rows of the manifest that fulfill a SQL condition on its fields.
+        :param where: SQL condition, e.g. "status = ?". Default: all rows.
+        :param params: values of the ? placeholders of the condition.
+        :param order_by: field(s) to sort the result (see sqliteQuery).
+        :return: list of dictionaries, one per file, with the manifest fields (qc decoded).
+        """
+        entries = sqliteQuery(self.dbpath, fields, where, params, order_by)
+        for entry in entries:
+            entry['qc'] = json.loads(entry['qc']) if entry['qc'] else None
+        return entries
+
+    def __len__(self):
+        return sqliteCount(self.dbpath)
@@ -0,0 +1,130 @@
+"""
+FridaOnline, the real-time counterpart of Frida for closed-loop experiments: the EEG is pushed by blocks of samples as
+they arrive from the device, and every block is returned preprocessed right away. The preprocessing is causal:
+rereference, and the notch and bandpass filters of Frida applied forward only (sosfilt), carrying the state of the
+filters from one block to the next, so that pushing a recording by blocks gives the same result as filtering it at
+once. The offsets and stds of the channels are updated with every block (running QC).
+
+    >>> online = FridaOnline(electrodes, fs=500.)
+    >>> for block in device:  # (samples, channels) arrays, uV
+    >>>     processed = online.push(block)
+    >>> online.offsets, online.sigmas, online.bad_chan, online.latency
+
+Unlike Frida.preprocess (zero-phase filters), the causal filters delay the signal (phase response of the filters).
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import time
+
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi
+
+from nepy.frida.channelStats import ChannelStats
+from nepy.frida.filters import bandpassSOS, notchSOS
+from nepy.frida.frida import defaultParameters
+
+
+class FridaOnline(object):
+    """
+    Description:
+    Causal preprocessing and QC of EEG blocks (see the module docstring).
+
+    Attributes:
+        electrodes:      list of electrode names (columns of the blocks).
+        fs:              sampling rate (Hz).
+        param:           parameters, as in Frida (line_freq, Q_notch, low_cutoff_freq, high_cutoff_freq, order,
+                         reference_electrodes, signal_offset_limit and signal_std_limit are used).
+        pipeline:        preprocessing steps: 'rereference', 'remove_line_freq' and/or 'bandpassfilter'.
+        stats:           ChannelStats of the raw EEG pushed so far.
+        offsets, sigmas: offsets (mV) and stds (uV) of the raw EEG pushed so far, as in Frida.QC.
+        bad_chan:        channel flags of the offset and std limits ({'offset': flags, 'sigma': flags}, 0: bad).
+        samples:         number of samples pushed.
+        latency:         processing time of the last block (seconds); max_latency: the longest one.
+    """
+    def __init__(self, electrodes, fs=500., parameters=None, pipeline=None):
+        """
+        :param electrodes: list of electrode names.
+        :param fs: sampling rate (Hz).
+        :param parameters: parameter dictionary (see help(Frida)). Default: the parameters of Frida.
+        :param pipeline: list of steps. Default: ['rereference', 'remove_line_freq', 'bandpassfilter'].
+        """
+        self.electrodes = list(electrodes)
+        self.fs = fs
+        self.param = defaultParameters() if parameters is None else parameters
+        self.pipeline = ['rereference', 'remove_line_freq', 'bandpassfilter'] if pipeline is None else pipeline
+        p = self.param
+
+        try:
+            self.reference = [self.electrodes.index(element) for element in p['reference_electrodes']]
+        except ValueError:
+            print("Using average reference")
+            self.reference = None
+
+        # All the filters of the pipeline as a single cascade of second-order sections (the same result as
+        # filtering step by step).
+        sections = []
+        for action in self.pipeline:
+            if action == 'remove_line_freq':
+                sections.append(notchSOS(p['line_freq'], p['Q_notch'], fs))
+            elif action == 'bandpassfilter':
+                sections.append(bandpassSOS(p['low_cutoff_freq'], p['high_cutoff_freq'], fs, p['order']))
+            elif action != 'rereference':
+                print("\033[93m Warning! '{0}' is not a causal step, it is ignored. \033[0m".format(action))
+        self.sos = np.vstack(sections) if sections else None
+        self.reset()
+
+    def reset(self):
+        """ Clears the state of the filters and the QC (e.g., before a new recording)."""
+        self.zi = None
+        self.stats = ChannelStats()
+        self.samples = 0
+        self.latency = 0.
+        self.max_latency = 0.
+
+    def push(self, block):
+        """
+        Preprocesses the next block of samples.
+        :param block: (samples, channels) array of EEG (uV).
+        :return: preprocessed block, with the dtype of block.
+        """
+        start = time.perf_counter()
+        block = np.asarray(block)
+        self.stats.update(block)
+
+        data = block
+        if 'rereference' in self.pipeline:
+            if self.reference is None:
+                ref = np.mean(block, axis=1)
+            elif len(self.reference) == 1:
+                ref = block[:, self.reference[0]]
+            else:
+                ref = np.mean(block[:, self.reference], axis=1)
+            data = block - ref[:, None]
+
+        if self.sos is not None and len(data):
+            if self.zi is None:  # steady state for the first sample, so that the offsets do not ring
+                self.zi = sosfilt_zi(self.sos)[:, :, None] * data[0].astype(np.float64)[None, None, :]
+            data, self.zi = sosfilt(self.sos, data, axis=0, zi=self.zi)
+        data = data.astype(block.dtype, copy=False)
+
+        self.samples += block.shape[0]
+        self.latency = time.perf_counter() - start
+        self.max_latency = max(self.max_latency, self.latency)
+        return data
+
+    @property
+    def offsets(self):
+        return list(self.stats.mean / 1000) if self.stats.count else []  # mV
+
+    @property
+    def sigmas(self):
+        return list(self.stats.std) if self.stats.count else []  # uV
+
+    @property
+    def bad_chan(self):
+        if not self.stats.count:
+            return {}
+        return {'offset': np.where(np.abs(self.stats.mean / 1000) > self.param['signal_offset_limit'], 0., 1.),
+                'sigma': np.where(self.stats.std > self.param['signal_std_limit'], 0., 1.)}
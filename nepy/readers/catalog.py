@@ -0,0 +1,208 @@
+"""
+Catalog of the recordings of a data directory, built just from the file headers (see readHeader): the .nedf xml header,
+and the .info file, first row and row count of the .easy files. The metadata is stored in a SQLite database in the data
+directory, so it can be queried without opening the recordings, and it is refreshed incrementally: only new files, or
+files with a different size or modification time, are read again.
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import sys
+
+from nepy.readers.easyReader import easyReader
+from nepy.readers.nedfReader import nedfReader
+
+extensions = (".easy", ".easy.gz", ".nedf")
+
+# Catalog fields (name, SQLite type), as returned by readHeader.
+fields = [
+    ('filename', 'TEXT PRIMARY KEY'),
+    ('basename', 'TEXT'),
+    ('extension', 'TEXT'),
+    ('size', 'INTEGER'),
+    ('mtime', 'REAL'),
+    ('num_channels', 'INTEGER'),
+    ('electrodes', 'TEXT'),
+    ('fs', 'REAL'),
+    ('samples', 'INTEGER'),
+    ('duration', 'REAL'),
+    ('eegstartdate', 'TEXT'),
+    ('eegstartdate_unixtime', 'INTEGER'),
+    ('acc_data', 'INTEGER'),
+    ('stim_data', 'INTEGER')
+]
+
+
+@contextlib.contextmanager
+def sqliteConnect(dbpath, fields=None):
+    """
+    Connection to a SQLite database, that commits (or rolls back, if there is an error) and closes at the end.
+    :param fields: list of (name, SQLite type) of the recordings table, that is created if it does not exist.
+    """
+    db = sqlite3.connect(dbpath)
+    try:
+        with db:
+            if fields is not None:
+                db.execute("CREATE TABLE IF NOT EXISTS recordings ({0})".format(
+                    ", ".join(name + " " + sqltype for name, sqltype in fields)))
+            yield db
+    finally:
+        db.close()
+
+
+def sqliteQuery(dbpath, fields, where=None, params=(), order_by="filename"):
+    """
+    Returns the rows of the recordings table of a SQLite database (see sqliteConnect) that fulfill a SQL condition.
+    :param fields: list of (name, SQLite type) of the table.
+    :param where: SQL condition, e.g. "num_channels = ?". Default: all rows.
+    :param params: values of the ? placeholders of the condition.
+    :param order_by: field(s) to sort the result, separated by commas and optionally followed by ASC or DESC, e.g.
+                     "duration DESC, filename". ValueError if they are not fields of the table.
+    :return: list of dictionaries, one per row, with the fields.
+    """
+    names = [name for name, _ in fields]
+    for term in order_by.split(","):
+        words = term.split()
+        if not 1 <= len(words) <= 2 or words[0] not in names or words[1:] and words[1].upper() not in ('ASC', 'DESC'):
+            raise ValueError("Can not sort by '{0}', use the fields {1}".format(term.strip(), names))
+    sql = "SELECT * FROM recordings"
+    if where:
+        sql += " WHERE " + where
+    sql += " ORDER BY " + order_by
+    with sqliteConnect(dbpath) as db:
+        rows = db.execute(sql, params).fetchall()
+    return [dict(zip(names, row)) for row in rows]
+
+
+def sqliteCount(dbpath):
+    """ Number of rows of the recordings table of a SQLite database (see sqliteConnect)."""
+    with sqliteConnect(dbpath) as db:
+        return db.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+
+
+def readHeader(filepath, verbose=False):
+    """
+    Reads the metadata of a recording without reading its data.
+    :param filepath: .easy, .easy.gz or .nedf file.
+    :param verbose: flag to print or not what the readers print.
+    :return: dictionary with the catalog fields: filename, basename, extension, size (bytes), mtime, num_channels,
+             electrodes (list), fs (Hz), samples, duration (s), eegstartdate, eegstartdate_unixtime (ms), acc_data and
+             stim_data. None if the file can not be read.
+    """
+    with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+        if filepath.endswith(".nedf"):
+            rdr = nedfReader(filepath, header_only=True)
+            if not hasattr(rdr, 'layout'):  # the header could not be read
+                return None
+            samples = rdr.samplesread + 1
+            extension = "nedf"
+            acc_data, stim_data = rdr.layout.isaccon, rdr.layout.isstimon
+        elif filepath.endswith(".easy") or filepath.endswith(".easy.gz"):
+            rdr = easyReader(filepath, verbose=verbose, header_only=True)
+            if not rdr.samples:
+                return None
+            samples = rdr.samples
+            extension = rdr.extension
+            acc_data, stim_data = rdr.acc_data, False
+        else:
+            return None
+
+    stat = os.stat(filepath)
+    return {
+        'filename': os.path.basename(filepath),
+        'basename': rdr.basename,
+        'extension': extension,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'num_channels': rdr.num_channels,
+        'electrodes': rdr.electrodes,
+        'fs': float(rdr.fs),
+        'samples': samples,
+        'duration': samples / float(rdr.fs),
+        'eegstartdate': getattr(rdr, 'eegstartdate', None),
+        'eegstartdate_unixtime': rdr.eegstartdate_unixtime,
+        'acc_data': bool(acc_data),
+        'stim_data': bool(stim_data)
+    }
+
+
+class Catalog(object):
+    """
+    Catalog of the recordings of a data directory. Example of use:
+
+        >>> cat = Catalog(datapath)  # creates (or opens) datapath/nepy_catalog.sqlite and refreshes it
+        >>> cat.query("num_channels = ? AND duration > ?", (32, 3600))  # list of dictionaries (see readHeader)
+        >>> cat.query(order_by="eegstartdate")
+
+    Attributes:
+        datapath:   directory of the recordings.
+        dbpath:     path of the SQLite database. Default: datapath/nepy_catalog.sqlite
+    """
+    def __init__(self, datapath, dbpath=None, refresh=True, verbose=True):
+        self.datapath = datapath
+        self.dbpath = dbpath if dbpath is not None else os.path.join(datapath, "nepy_catalog.sqlite")
+        self.verbose = verbose
+        with sqliteConnect(self.dbpath, fields):
+            pass
+        if refresh:
+            self.refresh()
+
+    def refresh(self):
+        """
+        Updates the catalog with the files of the data directory: new files and files whose size or modification time
+        have changed are read (just their headers), and the files that do not exist anymore are removed.
+        :return: lists of the added/updated and removed file names.
+        """
+        with sqliteConnect(self.dbpath) as db:
+            known = {row[0]: (row[1], row[2]) for row in db.execute("SELECT filename, size, mtime FROM recordings")}
+            present = [fil for fil in sorted(os.listdir(self.datapath)) if fil.endswith(extensions)]
+
+            updated = []
+            for fil in present:
+                stat = os.stat(os.path.join(self.datapath, fil))
+                if known.get(fil) == (stat.st_size, stat.st_mtime):
+                    continue
+                header = readHeader(os.path.join(self.datapath, fil))
+                if header is None:
+                    if self.verbose:
+                        print("Header of {0} could not be read, skipping...".format(fil))
+                    continue
+                values = [json.dumps(header[name]) if name == 'electrodes' else header[name] for name, _ in fields]
+                db.execute("INSERT OR REPLACE INTO recordings VALUES ({0})".format(", ".join("?" * len(fields))),
+                           values)
+                updated.append(fil)
+
+            removed = [fil for fil in known if fil not in present]
+            db.executemany("DELETE FROM recordings WHERE filename = ?", [(fil,) for fil in removed])
+
+        if self.verbose:
+            print("Catalog {0}: {1} files added or updated, {2} removed.".format(self.dbpath, len(updated),
+                                                                                  len(removed)))
+        return updated, removed
+
+    def query(self, where=None, params=(), order_by="filename"):
+        """
+        Returns the recordings that fulfill a SQL condition on the catalog fields (see readHeader), without opening
+        the files.
+        :param where: SQL condition, e.g. "num_channels = ? AND eegstartdate >= ?". Default: all recordings.
+        :param params: values of the ? placeholders of the condition.
+        :param order_by: field(s) to sort the result (see sqliteQuery).
+        :return: list of dictionaries, one per recording, with the filepath and the catalog fields.
+        """
+        recordings = sqliteQuery(self.dbpath, fields, where, params, order_by)
+        for recording in recordings:
+            recording['electrodes'] = json.loads(recording['electrodes'])
+            recording['acc_data'] = bool(recording['acc_data'])
+            recording['stim_data'] = bool(recording['stim_data'])
+            recording['filepath'] = os.path.join(self.datapath, recording['filename'])
+        return recordings
+
+    def __len__(self):
+        return sqliteCount(self.dbpath)
+
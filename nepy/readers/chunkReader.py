@@ -0,0 +1,67 @@
+"""
+This is chunkReader, a generator to read ".easy", ".easy.gz" and ".nedf" files by consecutive chunks of time, so that
+recordings larger than the memory can be processed (e.g., offsets, sigmas, PSDs or epochs computed chunk by chunk).
+It is built on nedfReader (windows read from the file) and on the .easy layout of easyReader (rows parsed by
+blocks of text).
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+
+from nepy.readers.easyReader import easyArrays, easyColumns, easyFirstRow, easyTables
+from nepy.readers.nedfReader import nedfReader
+
+
+def iterChunks(filepath, chunk_seconds=10, channels=None):
+    """
+    Yields consecutive chunks of a recording, reading just one chunk of the file at a time. Example of use:
+
+        >>> for chunk in iterChunks("nedfdata/20180213122712_Patient01.nedf", chunk_seconds=10):
+        >>>     chunk['np_eeg'].shape = (5000, 32)
+
+    :param filepath: .easy, .easy.gz or .nedf file.
+    :param chunk_seconds: length of the chunks (seconds). The last chunk may be shorter.
+    :param channels: list of channel indices, or electrode names for .nedf files. Default: all channels.
+    :return: generator of dictionaries with the np_eeg (uV), np_stim (uA, just .nedf), np_acc, np_markers and np_time
+             (seconds from the beginning of the file) arrays of every chunk, as in the readers.
+    """
+    if filepath.endswith(".nedf"):
+        rdr = nedfReader(filepath, lazy=True)
+        step = int(chunk_seconds * rdr.fs)
+        for first in range(0, rdr.samplesread + 1, step):
+            yield rdr.readRecords(first, first + step, channels)
+
+    elif filepath.endswith(".easy") or filepath.endswith(".easy.gz"):
+        step = int(chunk_seconds * 500.)  # easyReader sampling rate
+        num_channels, acc_data = easyColumns(len(easyFirstRow(filepath)))
+        if num_channels is None:
+            print('There is an error with the .easy format.')
+            print('Number of columns mismatch with the expected for any of the devices')
+            return
+        starttime = None
+        rest = None
+        for table in easyTables(filepath, blocksize=max(2 ** 20, 64 * step)):
+            if starttime is None:
+                starttime = table[0, -1]  # unix time stamp of the first sample (ms)
+            if rest is not None:
+                table = np.concatenate([rest, table])
+            ends = range(step, len(table) + 1, step)
+            first = 0
+            for first in ends:
+                yield _easyChunk(table[first - step:first], num_channels, acc_data, starttime, channels)
+            rest = table[first:]
+        if rest is not None and len(rest):
+            yield _easyChunk(rest, num_channels, acc_data, starttime, channels)
+
+    else:
+        print("\033[91m ERROR @iterChunks: proposed file has wrong extension. Exiting. \033[0m")
+
+
+def _easyChunk(table, num_channels, acc_data, starttime, channels):
+    """ Reader arrays of a table of .easy rows, keeping the selected EEG channels."""
+    chunk = easyArrays(table, num_channels, acc_data, starttime)
+    if channels is not None:
+        chunk['np_eeg'] = chunk['np_eeg'][:, channels]
+    return chunk
@@ -11,10 +11,17 @@ Created on Tue Feb 14 2018 modified on Mon Sept 24 2018 (roser)
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 import numpy as np
+import gzip
+import mmap
 import os
 import time
 import datetime
+import warnings
+import zlib
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from nepy.readers.gzipIndex import gzipIndex
  
 
 class easyReader(object):
@@ -38,9 +45,23 @@ class easyReader(object):
         and its shape is (numsamples), e.g.,
 
             >>> c.np_markers.shape = 15000
+
+        With header_only=True just the .info file and the first and last rows of the .easy file are read: the
+        metadata (electrodes, num_channels, eegstartdate, samples) is set and the np_ arrays are left empty.
+        .easy.gz files are indexed on the first header_only opening (see gzipIndex, the index is saved next to the
+        file and reused), so that readWindow and readRecords inflate just the part of the stream they need, e.g.,
+
+            >>> c = easyReader("easydata/20180213122712_Patient01.easy.gz", header_only=True)
+            >>> window = c.readWindow(60, 90)
+            >>> window['np_eeg'].shape = (15000, 32)
+
+        Large uncompressed .easy files can be parsed with several processes (.easy.gz streams are always parsed in
+        the current process), e.g.,
+
+            >>> c = easyReader("easydata/20180213122712_Patient01.easy", workers=4)
         """
   
-    def __init__(self, filepath, author="anonymous", verbose=True):
+    def __init__(self, filepath, author="anonymous", verbose=True, header_only=False, workers=None):
 
         print("\033[1mInitializing in file path: \033[0m ", filepath)
 
@@ -80,16 +101,22 @@ class easyReader(object):
         self.electrodes = []
         self.num_channels = None
         self.eegstartdate = None
+        self.eegstartdate_unixtime = None
+        self.samples = 0
         self.np_time = []
         self.np_eeg = []
         self.np_stim = []
         self.np_acc = []
         self.np_markers = []
+        self.index = None
 
         # Try to read info file
         self.info_flag = self.__get_info(verbose=verbose)
         # then read data part, easy file
-        self.__get_l0_data(verbose=verbose)
+        if header_only:
+            self.__get_header_rows(verbose=verbose)
+        else:
+            self.__get_l0_data(verbose=verbose, workers=workers)
 
     def listAttributes(self):
         """Convenience function, prints list of attributes."""
@@ -122,19 +149,13 @@ class easyReader(object):
         except OSError:
             print("\033[93m Warning! .info file not found! Using standard values... \033[0m")
             print("Reading ", self.filepath, "to get numchannels....\n")
-            df = pd.read_csv(self.filepath, delim_whitespace=True, nrows=5)
-
-            cols = df.iloc[:, :].shape[1]
-            if (cols == 13) or (cols == 25) or (cols == 37):
-                numchannels = df.iloc[:, :].shape[1] - 5
-                self.acc_data = True
-            elif (cols == 10) or (cols == 22) or (cols == 34):
-                numchannels = df.iloc[:, :].shape[1] - 2
-            else:
+            numchannels, acc_data = easyColumns(len(easyFirstRow(self.filepath)))
+            if numchannels is None:
                 print('There is an error with the .easy format.')
                 print('Number of columns mismatch with the expected for any of the devices')
                 print('Exiting...')
                 return
+            self.acc_data = acc_data
             print("numchannels .......", numchannels)
             self.electrodes = ["Ch"+str(x) for x in range(1, 1+numchannels)]
             flag = 1
@@ -142,61 +163,336 @@ class easyReader(object):
             
         return flag
 
-    def __get_l0_data(self, verbose=True):
+    def __get_l0_data(self, verbose=True, workers=None):
         """
-        Method to grab easy data and set to uV. Data is stored in numpy arrays frame
+        Method to grab easy data and set to uV. Data is stored in numpy arrays frame (see easyParse)
+        :param workers: number of processes used to parse the file (None or 1: current process).
         """
         if verbose:
             print("_______________________________________________________________")
             print("\033[1mReading:", self.basename, '.', self.extension, '\n \033[0m')
-        df = pd.read_csv(self.filepath, delim_whitespace=True, header=None)
-        cols = df.iloc[:, :].shape[1]
-        if (cols == 13) or (cols == 25) or (cols == 37):
-            num_channels = df.iloc[:, :].shape[1] - 5
-            self.acc_data = True
-        elif (cols == 10) or (cols == 22) or (cols == 34):
-            num_channels = df.iloc[:, :].shape[1] - 2
-        else:
+        arrays, acc_data, timestamp = easyParse(self.filepath, workers=workers)
+        if arrays is None:
             print('There is an error with the .easy format.')
             print('Number of columns mismatch with the expected for any of the devices')
             print('Exiting...')
             return
+        num_channels = arrays['np_eeg'].shape[1]
+        self.acc_data = self.acc_data or acc_data
 
         if num_channels != self.num_channels:
             print("numchannels", num_channels)
             print("self.num_channels", self.num_channels)
             print("\033[93m Something is wrong with numchannels in infofile...\033[0m")
         
-        # grab first entry of last dataframe column (unix timestamp in ms)
-        timestamp = df[df.columns[-1]][0] 
+        # first entry of last column (unix timestamp in ms)
         value = datetime.datetime.fromtimestamp(timestamp/1000)
         eegstartdate = value.strftime('%Y-%m-%d %H:%M:%S')
 
-        # name dataframe columes using electrodes, etc
-        if self.acc_data:
-            df.columns = self.electrodes + ['ax', 'ay', 'az'] + ['markers', 'unix_time']
-        else:
-            df.columns = self.electrodes + ['markers', 'unix_time']
-        
-        df.iloc[:, 0:num_channels] = df.iloc[:, 0:num_channels]/1000  # now in uV
-
         if verbose:
             print("Number of channels detected:", num_channels)
             print("First sample recorded :", eegstartdate, "\n")
             print(" L0 raw data data in uV")
-            print(df.describe())
+            columns = self.electrodes if len(self.electrodes) == num_channels else None
+            print(pd.DataFrame(arrays['np_eeg'], columns=columns).describe())
         
         # assign attributes
         self.eegstartdate = eegstartdate
-        self.np_eeg = np.array(df, dtype="float32")[:, 0:num_channels]
-        # create a time column in seconds from beginning of file
-        df['t'] = (df['unix_time']-df['unix_time'][0])/1000.  # go to seconds
-        self.np_time = np.array(df['t'], dtype="float32")
+        self.eegstartdate_unixtime = int(timestamp)
+        self.samples = len(arrays['np_eeg'])
+        self.np_eeg = arrays['np_eeg']
+        self.np_time = arrays['np_time']  # seconds from beginning of file
         self.log.append("Got raw L0_data on " + time.strftime("%Y-%m-%d %H:%M"))
-        self.np_acc = np.array(df, dtype="float32")[:, num_channels:num_channels+3]
-        if self.acc_data:
-            self.np_markers = np.array(df, dtype="float32")[:, num_channels+3]
-        else:
-            self.np_markers = np.array(df, dtype="float32")[:, num_channels]
+        self.np_acc = arrays['np_acc']
+        self.np_markers = arrays['np_markers']
         
         return
+
+    def __get_header_rows(self, verbose=True):
+        """
+        Method to grab the metadata of the easy data without reading it: the first row gives the number of columns
+        and the start date, and the number of samples is the number of rows: from the index of .easy.gz files, or
+        else counted (the line ends of the file, without parsing it; a .easy.gz stream is inflated to count them).
+        """
+        if self.filepath.endswith(".gz") and gzipIndex.available:
+            try:
+                self.index = gzipIndex(self.filepath, verbose=verbose)
+            except IOError as error:
+                print("\033[93m Warning! The .easy.gz file could not be indexed:", error, "\033[0m")
+        first = easyFirstRow(self.filepath)
+        num_channels, acc_data = easyColumns(len(first))
+        if num_channels is None:
+            print('There is an error with the .easy format.')
+            print('Number of columns mismatch with the expected for any of the devices')
+            print('Exiting...')
+            return
+        if num_channels != self.num_channels:
+            print("\033[93m Something is wrong with numchannels in infofile...\033[0m")
+        self.acc_data = acc_data
+        self.eegstartdate_unixtime = first[-1]
+        self.eegstartdate = datetime.datetime.fromtimestamp(first[-1] / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        self.samples = self.index.rows if self.index is not None else easyCountRows(self.filepath)
+        if verbose:
+            print("Number of channels detected:", num_channels)
+            print("First sample recorded :", self.eegstartdate)
+            print("Number of samples:", self.samples, "\n")
+
+    def readWindow(self, start_s, stop_s, channels=None):
+        """
+        Reads the data between start_s and stop_s seconds from the beginning of the file. Indexed .easy.gz files (see
+        header_only) are inflated just from the access point before the window. Example of use:
+
+            >>> window = c.readWindow(60, 90, channels=['Cz', 'Pz'])
+            >>> window['np_eeg'].shape = (15000, 2)
+
+        :param start_s: first second of the window.
+        :param stop_s: last second of the window (not included). None reads until the end of the file.
+        :param channels: list of electrode names or channel indices. Default: all channels.
+        :return: dictionary with the np_eeg, np_stim (empty), np_acc, np_markers and np_time arrays of the window.
+        """
+        last = None if stop_s is None else int(stop_s * self.fs)
+        return self.readRecords(int(start_s * self.fs), last, channels)
+
+    def readRecords(self, first, last, channels=None):
+        """
+        Same as readWindow, but the window is given in rows (EEG samples): first..last-1 (None: until the end).
+        The rows are taken from the arrays if the file has been read, from the index of .easy.gz files, or else
+        parsed from the beginning of the file up to the end of the window.
+        """
+        if channels is not None:
+            channels = [self.electrodes.index(ch) if isinstance(ch, str) else ch for ch in channels]
+        first = max(first, 0)
+        if len(self.np_eeg):
+            window = {'np_eeg': self.np_eeg[first:last], 'np_stim': np.zeros(0, dtype="float32"),
+                      'np_acc': self.np_acc[first:last] if len(self.np_acc) else self.np_acc,
+                      'np_markers': self.np_markers[first:last], 'np_time': self.np_time[first:last]}
+        else:
+            cols = len(easyFirstRow(self.filepath))
+            num_channels, acc_data = easyColumns(cols)
+            if self.index is not None:
+                last = self.index.rows if last is None else last
+                table = easyParseText(self.index.readRows(first, last), cols)
+            else:
+                tables, rows = [], 0
+                for table in easyTables(self.filepath):
+                    if first < rows + len(table):
+                        tables.append(table[max(first - rows, 0):None if last is None else max(last - rows, 0)])
+                    rows += len(table)
+                    if last is not None and rows >= last:
+                        break
+                table = np.concatenate(tables) if tables else np.zeros((0, cols), dtype=np.int64)
+            window = easyArrays(table, num_channels, acc_data, self.eegstartdate_unixtime)
+        if channels is not None:
+            window['np_eeg'] = window['np_eeg'][:, channels]
+        return window
+
+
+def easyFirstRow(filepath):
+    """ Returns the first row of an .easy or .easy.gz file as a list of integers."""
+    with (gzip.open(filepath, 'rb') if filepath.endswith(".gz") else open(filepath, 'rb')) as fil:
+        return [int(float(v)) for v in fil.readline().split()]
+
+
+def easyTables(filepath, blocksize=2 ** 23):
+    """
+    Yields the rows of an .easy or .easy.gz file as int64 numpy tables (rows, columns), parsing blocks of about
+    'blocksize' bytes of text that end at a line end. Every value of the file must be an integer (nV for the EEG).
+    """
+    with (gzip.open(filepath, 'rb') if filepath.endswith(".gz") else open(filepath, 'rb')) as fil:
+        cols = len(fil.readline().split())
+        fil.seek(0)
+        rest = b''
+        while True:
+            data = fil.read(blocksize)
+            if not data:
+                break
+            data = rest + data
+            end = data.rfind(b'\n') + 1
+            rest = data[end:]
+            if end:
+                yield easyParseText(data[:end], cols)
+        if rest.strip():
+            yield easyParseText(rest, cols)
+
+
+def easyParseText(text, cols):
+    """
+    Parses whitespace separated integers (bytes) into an int64 table with 'cols' columns. Raises ValueError if any
+    value is not an integer (numpy stops parsing there with just a DeprecationWarning).
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            values = np.fromstring(text, dtype=np.int64, sep=' ')
+        except DeprecationWarning:
+            raise ValueError("The .easy rows have values that are not integers")
+    if values.size % cols:
+        raise ValueError("The .easy rows do not have {0} integer columns".format(cols))
+    return values.reshape(-1, cols)
+
+
+def easyCountRows(filepath, blocksize=2 ** 23):
+    """ Number of rows of an .easy or .easy.gz file (line ends, plus a last line without line end)."""
+    rows = 0
+    last = b'\n'
+    with (gzip.open(filepath, 'rb') if filepath.endswith(".gz") else open(filepath, 'rb')) as fil:
+        for data in iter(lambda: fil.read(blocksize), b''):
+            rows += data.count(b'\n')
+            last = data[-1:]
+    return rows + (last != b'\n')
+
+
+def easyEstimateRows(filepath, blocksize=2 ** 20):
+    """
+    Estimated number of rows of an .easy or .easy.gz file, reading just its first blocksize bytes: the rows per byte
+    of the first block (compressed bytes for .easy.gz) times the size of the file. Exact if the file is not larger.
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as fil:
+        head = fil.read(blocksize)
+    if filepath.endswith(".gz"):
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        text = inflater.decompress(head)
+        used = len(head) - len(inflater.unused_data)
+    else:
+        text, used = head, len(head)
+    rows = text.count(b'\n')
+    if len(head) >= size:
+        return rows + (text[-1:] not in (b'\n', b''))
+    return int(round(rows * size / float(used)))
+
+
+def easyParse(filepath, blocksize=2 ** 23, workers=None):
+    """
+    Parses a whole .easy or .easy.gz file into the reader arrays (see easyArrays), without pandas: the text is
+    parsed by blocks straight into int64 tables, that are scaled and written to the output float32 arrays. For .easy
+    files the output arrays are preallocated (the rows are counted first), .easy.gz blocks are joined at the end.
+    With workers > 1, .easy files are split in byte ranges at line ends that are parsed by a pool of processes (see
+    easyParseRanges).
+    :return: dictionary with the np_eeg, np_stim, np_acc, np_markers and np_time arrays, accelerometer flag and unix
+             time stamp of the first sample (ms). (None, None, None) if the number of columns does not match any
+             device.
+    """
+    first = easyFirstRow(filepath)
+    num_channels, acc_data = easyColumns(len(first))
+    if num_channels is None:
+        return None, None, None
+    if workers is not None and workers > 1 and not filepath.endswith(".gz"):
+        return easyParseRanges(filepath, num_channels, acc_data, first[-1], workers, blocksize), acc_data, first[-1]
+    rows = None if filepath.endswith(".gz") else easyCountRows(filepath, blocksize)
+
+    starttime = None
+    parts = []
+    arrays = None
+    row = 0
+    for table in easyTables(filepath, blocksize):
+        if starttime is None:
+            starttime = table[0, -1]
+        part = easyArrays(table, num_channels, acc_data, starttime)
+        if rows is None:
+            parts.append(part)
+            continue
+        if arrays is None:
+            arrays = {key: np.zeros((rows,) + values.shape[1:] if values.size else 0, dtype="float32")
+                      for key, values in part.items()}
+        for key, values in part.items():
+            if values.size:
+                arrays[key][row:row + len(values)] = values
+        row += len(table)
+
+    if rows is None:
+        arrays = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]} if parts else None
+    elif row != rows:
+        raise ValueError("{0} rows were parsed out of the {1} rows of {2}".format(row, rows, filepath))
+    if arrays is None:
+        return None, None, None
+    return arrays, acc_data, starttime
+
+
+def easyRanges(filepath, pieces):
+    """
+    Splits an uncompressed .easy file in (at most) 'pieces' byte ranges of similar size that start at the beginning
+    of a row and end after a line end (or at the end of the file).
+    :return: list of (start, stop) byte offsets, in file order.
+    """
+    size = os.path.getsize(filepath)
+    if size == 0:
+        return []
+    bounds = [0]
+    with open(filepath, 'rb') as fil, mmap.mmap(fil.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for piece in range(1, pieces):
+            end = buf.find(b'\n', max(size * piece // pieces, bounds[-1])) + 1
+            if end == 0 or end >= size:
+                break
+            if end > bounds[-1]:
+                bounds.append(end)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def easyParseRange(filepath, start, stop, num_channels, acc_data, starttime, blocksize=2 ** 23):
+    """
+    Parses the rows of the byte range [start, stop) of an uncompressed .easy file (see easyRanges), reading it
+    through a memory map by blocks of about 'blocksize' bytes. The time stamps are referred to 'starttime', the unix
+    time (ms) of the first row of the file.
+    :return: dictionary with the reader arrays of the rows of the range (see easyArrays).
+    """
+    cols = num_channels + (5 if acc_data else 2)
+    parts = []
+    with open(filepath, 'rb') as fil, mmap.mmap(fil.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        pos = start
+        while pos < stop:
+            end = buf.rfind(b'\n', pos, min(pos + blocksize, stop)) + 1
+            if end <= pos:  # rows longer than a block
+                end = buf.find(b'\n', pos, stop) + 1 or stop
+            parts.append(easyArrays(easyParseText(buf[pos:end], cols), num_channels, acc_data, starttime))
+            pos = end
+    if not parts:
+        return easyArrays(np.zeros((0, cols), dtype=np.int64), num_channels, acc_data, starttime)
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def easyParseRanges(filepath, num_channels, acc_data, starttime, workers, blocksize=2 ** 23):
+    """
+    Parses an uncompressed .easy file with a pool of 'workers' processes: the file is split in byte ranges at line
+    ends (see easyRanges), every process parses its ranges from a memory map of the file (see easyParseRange) and
+    the results are joined in file order, so the rows keep the order of the file.
+    :return: dictionary with the reader arrays of the whole file (see easyArrays).
+    """
+    ranges = easyRanges(filepath, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(easyParseRange, filepath, start, stop, num_channels, acc_data, starttime, blocksize)
+                   for start, stop in ranges]
+        parts = [future.result() for future in futures]
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def easyColumns(cols):
+    """
+    Layout of an .easy file given its number of columns: EEG channels, 3 accelerometer columns (optional),
+    markers and unix time (ms). Enobio and Starstim devices have 8, 20 or 32 channels.
+    :return: number of EEG channels and a flag saying if there is accelerometer data. (None, None) if the number of
+             columns does not match any device.
+    """
+    if cols in (13, 25, 37):
+        return cols - 5, True
+    elif cols in (10, 22, 34):
+        return cols - 2, False
+    return None, None
+
+
+def easyArrays(table, num_channels, acc_data, starttime):
+    """
+    Splits a table of .easy rows (numpy array, one column per .easy column) into the reader arrays, with the same
+    units and types as easyReader: np_eeg (uV), np_acc, np_markers and np_time (seconds from starttime, the unix time
+    of the first row of the file, in ms).
+    :return: dictionary with the np_eeg, np_stim (empty), np_acc (empty if there is no accelerometer data),
+             np_markers and np_time arrays.
+    """
+    return {
+        'np_eeg': np.array(table[:, :num_channels] / 1000, dtype="float32"),  # now in uV
+        'np_stim': np.zeros(0, dtype="float32"),
+        'np_acc': np.array(table[:, num_channels:num_channels + 3] if acc_data else [], dtype="float32"),
+        'np_markers': np.array(table[:, num_channels + 3 if acc_data else num_channels], dtype="float32"),
+        'np_time': np.array((table[:, -1] - starttime) / 1000., dtype="float32")  # go to seconds
+    }
@@ -0,0 +1,289 @@
+"""
+This is gzipIndex, a seekable index of gzip streams (".easy.gz" files), so that a few rows of a large compressed file
+can be read without inflating the whole stream. It follows the zran.c example of zlib (Mark Adler): while the stream
+is inflated once, an access point is saved every 'span' bytes of output, at the end of a deflate block. An access
+point is the position in the compressed file (byte and bit), the position in the uncompressed data, and the last
+32 KB of uncompressed data (the deflate window), which is all zlib needs to resume inflating from there. Every point
+also keeps the number of rows (line ends) before it, to find rows without counting them from the beginning.
+
+The index is saved in a sidecar file next to the gzip file (filepath + ".gzidx", a compressed numpy .npz file) and
+reused while the size and modification time of the gzip file do not change.
+
+Python's zlib module does not expose the block boundaries (Z_BLOCK) nor inflatePrime, so zlib is called through
+ctypes. If the zlib shared library cannot be found, gzipIndex.available is False and the readers fall back to
+inflating the stream from the beginning.
+
+2019 Neuroelectrics Barcelona
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import ctypes
+import ctypes.util
+import io
+import os
+
+import numpy as np
+
+WINSIZE = 32768  # deflate window (bytes)
+CHUNK = 2 ** 16  # compressed bytes read at a time
+VERSION = 1  # sidecar format
+
+
+class _zStream(ctypes.Structure):
+    """ zlib z_stream structure (zlib.h). """
+    _fields_ = [('next_in', ctypes.c_void_p), ('avail_in', ctypes.c_uint), ('total_in', ctypes.c_ulong),
+                ('next_out', ctypes.c_void_p), ('avail_out', ctypes.c_uint), ('total_out', ctypes.c_ulong),
+                ('msg', ctypes.c_char_p), ('state', ctypes.c_void_p),
+                ('zalloc', ctypes.c_void_p), ('zfree', ctypes.c_void_p), ('opaque', ctypes.c_void_p),
+                ('data_type', ctypes.c_int), ('adler', ctypes.c_ulong), ('reserved', ctypes.c_ulong)]
+
+
+def _loadZlib():
+    """ zlib shared library (ctypes), or None if it is not found. """
+    for name in [ctypes.util.find_library('z'), ctypes.util.find_library('zlib1'), 'libz.so.1', 'libz.dylib']:
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name)
+            stream = ctypes.POINTER(_zStream)
+            lib.zlibVersion.restype = ctypes.c_char_p
+            lib.inflateInit2_.argtypes = [stream, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+            lib.inflate.argtypes = [stream, ctypes.c_int]
+            lib.inflatePrime.argtypes = [stream, ctypes.c_int, ctypes.c_int]
+            lib.inflateSetDictionary.argtypes = [stream, ctypes.c_void_p, ctypes.c_uint]
+            lib.inflateEnd.argtypes = [stream]
+            for function in [lib.inflateInit2_, lib.inflate, lib.inflatePrime, lib.inflateSetDictionary,
+                             lib.inflateEnd]:
+                function.restype = ctypes.c_int
+            return lib
+        except (OSError, AttributeError):
+            continue
+    return None
+
+
+_zlib = _loadZlib()
+Z_OK, Z_STREAM_END, Z_BUF_ERROR, Z_NO_FLUSH, Z_BLOCK = 0, 1, -5, 0, 5
+
+
+class _inflater(object):
+    """ A zlib inflate stream. windowbits 47: gzip (or zlib) header, -15: raw deflate data."""
+    def __init__(self, windowbits):
+        self.strm = _zStream()
+        ret = _zlib.inflateInit2_(ctypes.byref(self.strm), windowbits, _zlib.zlibVersion(),
+                                  ctypes.sizeof(_zStream))
+        if ret != Z_OK:
+            raise IOError("zlib inflateInit2 error {0}".format(ret))
+
+    def feed(self, buf, nbytes):
+        self.strm.next_in = buf.ctypes.data
+        self.strm.avail_in = nbytes
+
+    def inflate(self, out, pos, flush=Z_NO_FLUSH):
+        """ Inflates into out[pos:], returns zlib's return code and the new output position."""
+        self.strm.next_out = out.ctypes.data + pos
+        self.strm.avail_out = len(out) - pos
+        ret = _zlib.inflate(ctypes.byref(self.strm), flush)
+        if ret not in (Z_OK, Z_STREAM_END, Z_BUF_ERROR):
+            raise IOError("zlib inflate error {0}: {1}".format(ret, self.strm.msg))
+        return ret, len(out) - self.strm.avail_out
+
+    def end(self):
+        _zlib.inflateEnd(ctypes.byref(self.strm))
+
+
+class gzipIndex(object):
+    """
+        Example of use:
+
+            >>> idx = gzipIndex("easydata/20180213122712_Patient01.easy.gz")
+            >>> text = idx.readRows(15000, 20000)  # bytes of the rows 15000 to 19999
+
+        The index is loaded from the sidecar file, or built (inflating the stream once) and saved. Attributes:
+            points:  number of access points
+            size:    length of the uncompressed data (bytes)
+            rows:    number of rows (lines) of the uncompressed data
+    """
+    available = _zlib is not None
+
+    def __init__(self, filepath, span=2 ** 22, verbose=True):
+        """
+        :param filepath: gzip file (single member, as .easy.gz files).
+        :param span: distance between access points in the uncompressed data (bytes). Smaller spans read less data
+                     to get to a row, but the sidecar grows by 32 KB (before compression) per point.
+        :param verbose: print when the index is built or the sidecar cannot be written.
+        """
+        if not gzipIndex.available:
+            raise IOError("The zlib library was not found, gzip files cannot be indexed")
+        self.filepath = filepath
+        self.sidecar = filepath + ".gzidx"
+        self.span = span
+        stat = os.stat(filepath)
+        self.key = np.array([VERSION, stat.st_size, stat.st_mtime_ns, span], dtype=np.int64)
+        if not self.__load():
+            if verbose:
+                print("Building the gzip index of", filepath)
+            self.__build()
+            self.__save(verbose)
+
+    def __load(self):
+        """ Loads the sidecar file if it matches the gzip file (size, modification time) and the span."""
+        try:
+            with np.load(self.sidecar) as npz:
+                if not np.array_equal(npz['key'], self.key):
+                    return False
+                self.outs, self.ins, self.bits = npz['outs'], npz['ins'], npz['bits']
+                self.lines, self.windows = npz['lines'], npz['windows']
+                self.size, self.rows = int(npz['totals'][0]), int(npz['totals'][1])
+        except (IOError, OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def __save(self, verbose):
+        """ Writes the sidecar file (first to a temporary file, that replaces the old sidecar when complete)."""
+        temppath = self.sidecar + ".tmp{0}".format(os.getpid())
+        try:
+            with open(temppath, 'wb') as fil:
+                np.savez_compressed(fil, key=self.key, outs=self.outs, ins=self.ins, bits=self.bits,
+                                    lines=self.lines, windows=self.windows,
+                                    totals=np.array([self.size, self.rows], dtype=np.int64))
+            os.replace(temppath, self.sidecar)
+        except (IOError, OSError) as error:
+            if verbose:
+                print("\033[93m Warning! The gzip index could not be saved ({0}), it is kept in memory. \033[0m".format(
+                    error))
+            if os.path.exists(temppath):
+                os.remove(temppath)
+
+    def __build(self):
+        """ Inflates the whole stream saving an access point at the first block boundary after every 'span' bytes."""
+        outs, ins, bits, lines, windows = [], [], [], [], []
+        window = np.zeros(WINSIZE, dtype=np.uint8)
+        inbuf = np.zeros(CHUNK, dtype=np.uint8)
+        inf = _inflater(47)
+        totin = totout = newlines = 0
+        last = -self.span
+        lastbyte = b'\n'
+        pos = WINSIZE
+        ret = Z_OK
+        try:
+            with open(self.filepath, 'rb') as fil:
+                while ret != Z_STREAM_END:
+                    nbytes = fil.readinto(inbuf)
+                    if nbytes == 0:
+                        raise IOError("Unexpected end of the gzip file " + self.filepath)
+                    inf.feed(inbuf, nbytes)
+                    while True:
+                        if pos == WINSIZE:
+                            pos = 0
+                        availin = inf.strm.avail_in
+                        ret, end = inf.inflate(window, pos, Z_BLOCK)
+                        totin += availin - inf.strm.avail_in
+                        if end > pos:
+                            data = window[pos:end].tobytes()
+                            newlines += data.count(b'\n')
+                            lastbyte = data[-1:]
+                        totout += end - pos
+                        pos = end
+                        if ret == Z_STREAM_END:
+                            break
+                        datatype = inf.strm.data_type
+                        if (datatype & 128) and not (datatype & 64) and totout - last >= self.span:
+                            outs.append(totout)
+                            ins.append(totin)
+                            bits.append(datatype & 7)
+                            lines.append(newlines)
+                            windows.append(np.concatenate([window[pos:], window[:pos]]))
+                            last = totout
+                        if inf.strm.avail_in == 0 and (ret == Z_BUF_ERROR or pos < WINSIZE):
+                            break
+                rest = inbuf[nbytes - inf.strm.avail_in:nbytes].tobytes() + fil.read(16)
+                if rest.strip(b'\x00'):
+                    raise IOError("Gzip files with several members are not indexed: " + self.filepath)
+        finally:
+            inf.end()
+        self.outs = np.array(outs, dtype=np.int64)
+        self.ins = np.array(ins, dtype=np.int64)
+        self.bits = np.array(bits, dtype=np.int8)
+        self.lines = np.array(lines, dtype=np.int64)
+        self.windows = np.array(windows, dtype=np.uint8).reshape(-1, WINSIZE)
+        self.size = totout
+        self.rows = newlines + (lastbyte != b'\n')
+
+    @property
+    def points(self):
+        return len(self.outs)
+
+    def iterInflate(self, point):
+        """
+        Yields the uncompressed data from the access point 'point' to the end of the stream, in chunks (bytes).
+        """
+        outbuf = np.zeros(4 * CHUNK, dtype=np.uint8)
+        inbuf = np.zeros(CHUNK, dtype=np.uint8)
+        inf = _inflater(-15)
+        try:
+            with open(self.filepath, 'rb') as fil:
+                bits = int(self.bits[point])
+                fil.seek(int(self.ins[point]) - (1 if bits else 0))
+                if bits:
+                    byte = ord(fil.read(1))
+                    _zlib.inflatePrime(ctypes.byref(inf.strm), bits, byte >> (8 - bits))
+                window = np.ascontiguousarray(self.windows[point])
+                _zlib.inflateSetDictionary(ctypes.byref(inf.strm), window.ctypes.data, WINSIZE)
+                ret = Z_OK
+                while ret != Z_STREAM_END:
+                    nbytes = fil.readinto(inbuf)
+                    inf.feed(inbuf, nbytes)
+                    while ret != Z_STREAM_END:
+                        ret, end = inf.inflate(outbuf, 0)
+                        if end:
+                            yield outbuf[:end].tobytes()
+                        if end < len(outbuf) and inf.strm.avail_in == 0:
+                            break  # more input needed
+                    if nbytes == 0:
+                        return  # truncated file
+        finally:
+            inf.end()
+
+    def read(self, offset, length):
+        """ Reads 'length' bytes of uncompressed data from 'offset', inflating from the previous access point."""
+        point = max(int(np.searchsorted(self.outs, offset, side='right')) - 1, 0)
+        skip = offset - int(self.outs[point])
+        out = io.BytesIO()
+        for data in self.iterInflate(point):
+            if skip >= len(data):
+                skip -= len(data)
+                continue
+            out.write(data[skip:skip + length - out.tell()])
+            skip = 0
+            if out.tell() >= length:
+                break
+        return out.getvalue()
+
+    def readRows(self, first, last):
+        """
+        Reads the rows first to last-1 (bytes, including their line ends), inflating from the last access point
+        before the beginning of row 'first'.
+        """
+        last = min(last, self.rows)
+        if first >= last:
+            return b''
+        point = max(int(np.searchsorted(self.lines, first, side='left')) - 1, 0)
+        skip = first - int(self.lines[point])  # line ends before the first row
+        wanted = last - first  # line ends after the first row
+        out = io.BytesIO()
+        for data in self.iterInflate(point):
+            start = 0
+            if skip > 0:
+                ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+                if len(ends) < skip:
+                    skip -= len(ends)
+                    continue
+                start = int(ends[skip - 1]) + 1
+                skip = 0
+            ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8)[start:] == 10)
+            if len(ends) >= wanted:
+                out.write(data[start:start + int(ends[wanted - 1]) + 1])
+                break
+            out.write(data[start:])
+            wanted -= len(ends)
+        return out.getvalue()
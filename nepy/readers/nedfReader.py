@@ -44,8 +44,16 @@ class nedfReader(object):
             >>> c.np_markers.shape = (15000)
 
         Metadata information from the nedf header is returned as a json using method __get_info.
+
+        With lazy=True the file is memory mapped instead of read, and np_eeg, np_stim, np_acc, np_markers and np_time
+        are nedfStream objects that decode only the samples and channels that are sliced (see nedfStream), e.g.,
+
+            >>> c = nedfReader("nedfdata/20180213122712_Patient01.nedf", lazy=True)
+            >>> c.np_eeg[5000:10000, :4]  # numpy array (uV) with 5000 samples of the first 4 channels
+
+        With header_only=True just the header is read: the metadata is set and the np_ arrays are left empty.
         """
-    def __init__(self, filepath, author="anonymous"):
+    def __init__(self, filepath, author="anonymous", lazy=False, header_only=False):
         self.filepath = filepath
         self.np_eeg = []  # will hold data in uV
         self.np_stim = []  # holds currents in uA
@@ -57,6 +65,7 @@ class nedfReader(object):
         self.num_channels = 0
         self.electrodes = []
         self.samplesread = 0
+        self.fs = 500  # records per second, read from the EEG settings of the header
         self.author = author
         enableINFO = False  # If True, prints array shapes and info.
 
@@ -100,11 +109,19 @@ class nedfReader(object):
         print("Reading file...")
         """ As we already started reading the file, next read will start from 10240 byte,
         and we will read the whole file at once and then close it. We store what we read
-        in a bytearray. This is done for efficiency matters. """
-        content2 = file.read()
-        file.close()
-        self.nedfbytes = bytearray(content2)
-        self.nedfbytessize = len(self.nedfbytes)
+        in a bytearray. This is done for efficiency matters. In lazy mode the data after the header
+        is memory mapped instead, so nothing is read until it is decoded. """
+        if header_only:
+            file.close()
+            self.nedfbytes = None
+        elif lazy and os.path.getsize(filepath) > 10240:
+            file.close()
+            self.nedfbytes = np.memmap(filepath, dtype="uint8", mode="r", offset=10240)
+        else:
+            content2 = file.read()
+            file.close()
+            self.nedfbytes = bytearray(content2)
+        self.nedfbytessize = max(os.path.getsize(filepath) - 10240, 0) if header_only else len(self.nedfbytes)
         """ We initialize the object variables with header values"""
         if xmldict['NEDFversion'] == '1.4':
             try:
@@ -132,14 +149,6 @@ class nedfReader(object):
                     self.stimtotaltime = int(xmldict['STIMSettings']['StimulationDuration'])+int(xmldict['STIMSettings']['RampDownDuration'])+int(xmldict['STIMSettings']['RampUpDuration'])+int(xmldict['STIMSettings']['ShamRampDuration'])
                     if self.samples == 0: # No EEG in the file
                         self.samples = int(xmldict['STIMSettings']['NumberOfRecordsOfStimulation']) // 2
-                if self.iseegon:
-                    self.np_eeg = (np.zeros(shape=(self.samples, self.num_channels), dtype="float32"))
-                if self.isstimon:
-                    self.np_stim = (np.zeros(shape=(self.samples*2, self.num_channels), dtype="float32"))
-                if self.isaccon:
-                    self.np_acc = (np.zeros(shape=(self.samples//5, self.num_channels), dtype="float32"))
-                self.np_markers = (np.zeros(shape=(1), dtype="int32"))
-                self.np_time = (np.zeros(shape=(1), dtype="uint64"))
             except Exception as e:
                 print("NEDF Header is missing some required fields: " + str(e))
                 return
@@ -147,6 +156,7 @@ class nedfReader(object):
             try:
                 self.isaccon = 'OFF'
                 self.isstimon = 'STIMSettings' in xmldict
+                self.iseegon = True
                 self.num_channels = int(xmldict['TotalNumberOfChannels'])
                 self.eegstartdate_unixtime = int(xmldict['StartDateEEG'])
                 # want this in calendar format
@@ -162,11 +172,6 @@ class nedfReader(object):
                 self.samples = int(xmldict['NumberOfRecordsOfEEG'])
                 if self.isstimon:
                     print('Not implemented. Contact to support@neuroelectrics.com')
-                self.np_eeg = (np.zeros(shape=(self.samples, self.num_channels), dtype="float32"))
-                if self.isaccon:
-                    self.np_acc = (np.zeros(shape=(self.samples // 5, self.num_channels), dtype="float32"))
-                self.np_markers = (np.zeros(shape=(1), dtype="int32"))
-                self.np_time = (np.zeros(shape=(1), dtype="uint64"))
             except Exception as e:
                 print("NEDF Header is missing some required fields: " + str(e))
                 return
@@ -177,19 +182,17 @@ class nedfReader(object):
         Accelerometer sampling rate is 100 samples per second.
         EEG sampling rate is 500 samples per second.
         Stimulation sampling rate is 1000 samples per second.
-        Based on that, we iterate taking EEG as reference. """
-        supereeg, superstim, superacc, supermarkers, supertime = self.__processBytes()
-        """Finally we create the numpy arrays from python lists"""
-
-        self.np_acc = np.array(superacc, dtype="float32")
-        self.np_eeg = np.array(supereeg, dtype="float32")/1000.  # uV (originally in nV)
-        self.np_stim = np.array(superstim, dtype="float32")
-        self.np_markers = np.array(supermarkers, dtype="float32")
-                
-        # create a time column in seconds from beginning of file
-        np_time = np.array(supertime)/1000.  # go to seconds
-        self.np_time = np.array(np_time, dtype="float32")
-            
+        Based on that, every record holds one EEG sample (plus one accelerometer sample every 5th record),
+        so the whole payload is decoded as an array of records, taking EEG as reference. """
+        self.layout = nedfLayout(self.num_channels, self.isaccon, self.iseegon, self.isstimon)
+        if header_only:
+            self.__checkSamples()
+            return
+        if lazy:
+            self.np_eeg, self.np_stim, self.np_acc, self.np_markers, self.np_time = self.__mapBytes()
+        else:
+            self.np_eeg, self.np_stim, self.np_acc, self.np_markers, self.np_time = self.__processBytes()
+
         print("Finished processing")
         if enableINFO:
             print()
@@ -216,80 +219,83 @@ class nedfReader(object):
             print("  > self.electrodes", "Keys:", list(electrodesDict.keys()))
             print("  > self.author", self.author)
 
+    def __checkSamples(self):
+        """ Number of complete records in self.nedfbytes, that should be the number of samples of the header."""
+        samples = self.layout.availableSamples(self.nedfbytessize)
+        if samples < self.samples:
+            print("[Error] Not enough bytes while reading records: {0} of {1} samples found".format(samples,
+                                                                                                   self.samples))
+        else:
+            samples = self.samples
+        self.samplesread = samples - 1
+        self.bytesread = self.layout.sampleOffset(samples) - 1
+        return samples
+
     def __processBytes(self):
-        self.bytesread = -1
-        counteracc = 5
-        supereeg = []
-        superacc = []
-        superstim = []
-        supermarkers = []
-        supertime = []
-        for i in range(self.samples):
-            supertime.append(i*2)
-            if self.isaccon:
-                if counteracc == 5:
-                    counteracc = 1
-                    accsample = []
-                    for j in range(3):
-                        if self.nedfbytessize - self.bytesread < 2:
-                            print("[Error] Not enough bytes while reading Accelerometer")
-                            return supereeg, superstim, superacc, supermarkers, supertime
-                        byte1 = self.__getByte()
-                        byte2 = self.__getByte()
-                        accvar = byte1*256+byte2
-                        if byte1 >= 128:
-                            accvar = accvar - 65536 
-                        accsample.append(accvar)
-                    if len(accsample):
-                        superacc.append(accsample)
-                else:
-                    counteracc += 1
-            if self.iseegon:
-                eegsample = []
-                for j in range(self.num_channels):
-                    if self.nedfbytessize - self.bytesread < 3:
-                        print("  > [Error] Not enough bytes while reading EEG")
-                        return supereeg, superstim, superacc, supermarkers, supertime
-                    byte1 = self.__getByte()
-                    byte2 = self.__getByte()
-                    byte3 = self.__getByte()
-                    eegvar = byte1 * 65536 + byte2 * 256 + byte3
-                    if byte1 >= 128:
-                        eegvar = (16777216 * 255) + eegvar - (16777216 * 256)
-                    eegvar = (eegvar * 2.4 * 1000000000) / 6.0 / 8388607.0
-                    eegsample.append(eegvar)
-                supereeg.append(eegsample)  
-            if self.isstimon:
-                for s in range(2):
-                    stimsample = []
-                    for j in range(self.num_channels):
-                        if self.nedfbytessize - self.bytesread < 3:
-                            print("[Error] Not enough bytes while reading Stimulation")
-                            return supereeg, superstim, superacc, supermarkers, supertime
-                        byte1 = self.__getByte()
-                        byte2 = self.__getByte()
-                        byte3 = self.__getByte()
-                        stimvar = byte1 * 65536 + byte2 * 256 + byte3
-                        if byte1 >= 128:
-                            stimvar = (16777216 * 255) + stimvar - (16777216 * 256)
-                        stimsample.append(stimvar)
-                    superstim.append(stimsample)
-
-            if self.nedfbytessize - self.bytesread < 4:
-                print("[Error] Not enough bytes while reading markers")
-                return supereeg, superstim, superacc, supermarkers, supertime
-            byte1 = self.__getByte()
-            byte2 = self.__getByte()
-            byte3 = self.__getByte()
-            byte4 = self.__getByte()
-            marker = byte1 * 16777216 + byte2 * 65536 + byte3 * 256 + byte4
-            supermarkers.append(marker)
-            self.samplesread = i
-        return supereeg, superstim, superacc, supermarkers, supertime
-
-    def __getByte(self):
-        self.bytesread += 1
-        return self.nedfbytes[self.bytesread]
+        """ Decodes all the records of self.nedfbytes at once using the record layout (see nedfLayout).
+        Returns eeg (uV), stim (uA), acc (mm/s^2), markers and time (s) as float32 numpy arrays."""
+        samples = self.__checkSamples()
+        eeg, stim, acc, markers = self.layout.decode(self.nedfbytes, samples)
+        # create a time column in seconds from beginning of file
+        np_time = np.arange(samples) * 2 / 1000.  # go to seconds
+        return eeg, stim, acc, markers, np.array(np_time, dtype="float32")
+
+    def __mapBytes(self):
+        """ Lazy counterpart of __processBytes: returns nedfStream objects on top of the memory mapped records.
+        Streams that are off are returned as empty arrays, as in __processBytes."""
+        samples = self.__checkSamples()
+        streams = self.layout.streams() + ['time']
+        return [nedfStream(self.layout, self.nedfbytes, stream, samples) if stream in streams
+                else np.zeros(0, dtype="float32") for stream in ['eeg', 'stim', 'acc', 'markers', 'time']]
+
+    def readWindow(self, start_s, stop_s, channels=None):
+        """
+        Reads the data between start_s and stop_s seconds from the beginning of the file, seeking directly to the
+        records needed instead of decoding the whole file. Example of use:
+
+            >>> window = c.readWindow(60, 90, channels=['Cz', 'Pz'])
+            >>> window['np_eeg'].shape = (15000, 2)
+
+        :param start_s: first second of the window.
+        :param stop_s: last second of the window (not included). None reads until the end of the file.
+        :param channels: list of electrode names or channel indices. Default: all channels.
+        :return: dictionary with the np_eeg, np_stim, np_acc, np_markers and np_time arrays of the window.
+        """
+        last = self.samplesread + 1 if stop_s is None else int(stop_s * self.fs)
+        return self.readRecords(int(start_s * self.fs), last, channels)
+
+    def readRecords(self, first, last, channels=None):
+        """
+        Same as readWindow, but the window is given in records (EEG samples): first..last-1.
+        The accelerometer rows returned are the ones of the records in the window (one every 5th record).
+        """
+        samples = self.samplesread + 1
+        first = min(max(first, 0), samples)
+        last = min(max(last, first), samples)
+        if channels is None:
+            channels = slice(None)
+        else:
+            channels = [self.electrodes.index(ch) if isinstance(ch, str) else ch for ch in channels]
+
+        # Blocks are the units that can be decoded by themselves (see nedfLayout), so we read whole blocks.
+        bs = self.layout.blocksamples
+        firstblock, lastblock = first // bs, -(-last // bs)
+        bufsamples = min(lastblock * bs, samples) - firstblock * bs
+        with open(self.filenameroot + '.nedf', 'rb') as file:
+            file.seek(10240 + firstblock * self.layout.blockbytes)
+            buf = file.read(self.layout.sampleOffset(bufsamples))
+
+        window = {'np_eeg': np.zeros(0, dtype="float32"), 'np_stim': np.zeros(0, dtype="float32"),
+                  'np_acc': np.zeros(0, dtype="float32"),
+                  'np_time': np.array(np.arange(first, last) * 2 / 1000., dtype="float32")}
+        first, last = first - firstblock * bs, last - firstblock * bs  # now relative to buf
+        for stream in self.layout.streams():
+            values = self.layout.decodeStream(buf, stream, first, last, bufsamples,
+                                              slice(None) if stream in ['acc', 'markers'] else channels)
+            if stream == 'acc':  # just the accelerometer samples that precede a record of the window
+                values = values[-(-first // bs):-(-last // bs)]
+            window['np_' + stream] = values
+        return window
 
     def __get_info(self):
         """ returns a json with NEDF header information. The information of the json can be
@@ -313,6 +319,229 @@ class nedfReader(object):
         return json.dumps(self.header)
 
 
+class nedfLayout(object):
+    """
+    Byte layout of the data records of a .nedf file, computed from the header values. Example of use:
+
+        >>> layout = nedfLayout(num_channels=8, isaccon=True, iseegon=True, isstimon=False)
+        >>> eeg, stim, acc, markers = layout.decode(nedfbytes, samples)
+
+    Every record (one per EEG sample) holds, in this order:
+        - the EEG, 3 bytes (24 bit big endian two's complement) per channel, if iseegon.
+        - two stimulation samples, 3 bytes per channel each, if isstimon.
+        - the marker, 4 bytes (32 bit big endian unsigned).
+    If isaccon, one accelerometer sample (3 x 16 bit big endian two's complement) precedes every 5th record, starting
+    with the first one. So the data is a sequence of fixed size blocks: accelerometer + 5 records, that can be described
+    as a numpy structured dtype and decoded in a few array operations.
+    """
+    def __init__(self, num_channels, isaccon, iseegon, isstimon):
+        self.num_channels = num_channels
+        self.isaccon = bool(isaccon)
+        self.iseegon = bool(iseegon)
+        self.isstimon = bool(isstimon)
+        fields = []
+        if self.iseegon:
+            fields.append(('eeg', 'u1', (num_channels, 3)))
+        if self.isstimon:
+            fields.append(('stim', 'u1', (2, num_channels, 3)))
+        fields.append(('marker', '>u4'))
+        self.recorddtype = np.dtype(fields)
+        self.recordbytes = self.recorddtype.itemsize
+        self.accbytes = 6 if self.isaccon else 0
+        self.blocksamples = 5 if self.isaccon else 1  # records per accelerometer sample
+        self.blockbytes = self.accbytes + self.blocksamples * self.recordbytes
+
+    def blockDtype(self, records=None):
+        """ Structured dtype of a block (accelerometer sample + records), by default with self.blocksamples records."""
+        if records is None:
+            records = self.blocksamples
+        if self.isaccon:
+            return np.dtype([('acc', '>i2', (3,)), ('records', self.recorddtype, (records,))])
+        return np.dtype([('records', self.recorddtype, (records,))])
+
+    def sampleOffset(self, sample):
+        """ Byte offset (from the end of the header) of the first byte that does not belong to the first 'sample'
+        records, i.e., where record 'sample' starts (including its accelerometer sample, if any)."""
+        blocks, rest = divmod(sample, self.blocksamples)
+        return blocks * self.blockbytes + (self.accbytes + rest * self.recordbytes if rest else 0)
+
+    def availableSamples(self, nbytes):
+        """ Number of complete records found in nbytes of data."""
+        blocks, rest = divmod(nbytes, self.blockbytes)
+        extra = max(rest - self.accbytes, 0) // self.recordbytes
+        return blocks * self.blocksamples + min(extra, self.blocksamples - 1)
+
+    def iterBlocks(self, buf, first, last, samples, chunk=65536):
+        """
+        Yields views of the blocks holding the records first..last-1 of buf, in chunks of about 'chunk' records.
+        Every item is (firstblock, blocks): the index of the first block and a structured array of blocks. The first
+        block starts at or before record 'first' and the last one may end after record 'last'.
+        :param samples: total number of records in buf, to know whether the last block is incomplete.
+        """
+        bs = self.blocksamples
+        fullblocks = samples // bs
+        step = max(chunk // bs, 1)
+        for b in range(first // bs, -(-last // bs), step):
+            nblocks = min(step, -(-last // bs) - b)
+            nfull = max(min(nblocks, fullblocks - b), 0)
+            if nfull:
+                yield b, np.frombuffer(buf, dtype=self.blockDtype(), count=nfull, offset=b * self.blockbytes)
+            if nfull < nblocks:  # the last block of the file, with less than blocksamples records
+                yield fullblocks, np.frombuffer(buf, dtype=self.blockDtype(samples % bs), count=1,
+                                                offset=fullblocks * self.blockbytes)
+
+    def convert(self, stream, blocks, channels=slice(None)):
+        """
+        Converts the 'stream' ('eeg', 'stim', 'acc' or 'markers') of a structured array of blocks to float32 rows in
+        output units: eeg in uV, stim in uA, acc in mm/s^2. Only the selected channels (a slice or a list of indices)
+        are converted.
+        """
+        if stream == 'acc':
+            return blocks['acc'][:, channels].astype("float32")
+        records = blocks['records']
+        if stream == 'markers':
+            return records['marker'].reshape(-1).astype("float32")
+        if stream == 'eeg':
+            # Same operations (and order) as the original per byte reader: nV in float64, then uV in float32
+            nv = int24(records['eeg'][:, :, channels]) * 2.4 * 1000000000 / 6.0 / 8388607.0
+            values = nv.astype("float32") / np.float32(1000.)
+        else:
+            values = int24(records['stim'][:, :, :, channels]).astype("float32")
+        return values.reshape(-1, values.shape[-1])
+
+    def decode(self, buf, samples, chunk=65536):
+        """
+        Decodes the first 'samples' records of buf, that must start at the beginning of a block.
+        Records are decoded in chunks of 'chunk' records to keep intermediate arrays small.
+        :return: eeg (uV), stim, acc and markers as float32 numpy arrays. Streams that are off are returned as empty
+                 arrays.
+        """
+        out = {'eeg': np.zeros((samples, self.num_channels) if self.iseegon else 0, dtype="float32"),
+               'stim': np.zeros((2 * samples, self.num_channels) if self.isstimon else 0, dtype="float32"),
+               'acc': np.zeros((-(-samples // self.blocksamples), 3) if self.isaccon else 0, dtype="float32"),
+               'markers': np.zeros(samples, dtype="float32")}
+        for firstblock, blocks in self.iterBlocks(buf, 0, samples, samples, chunk):
+            first = firstblock * self.blocksamples
+            for stream in self.streams():
+                values = self.convert(stream, blocks)
+                row = firstblock if stream == 'acc' else first * self.rowsPerSample(stream)
+                out[stream][row:row + len(values)] = values
+        return out['eeg'], out['stim'], out['acc'], out['markers']
+
+    def decodeStream(self, buf, stream, first, last, samples, channels=slice(None)):
+        """
+        Decodes a single stream of the records first..last-1 of buf (a file payload with 'samples' records),
+        for the selected channels only. Returns the float32 rows of the stream for those records: one per record for
+        eeg and markers, two per record for stim and one per accelerometer sample (every 5th record) for acc.
+        """
+        parts = [self.convert(stream, blocks, channels)
+                 for _, blocks in self.iterBlocks(buf, first, max(last, first), samples)]
+        if not parts:
+            if stream == 'markers':
+                return np.zeros(0, dtype="float32")
+            return np.zeros((0, 3 if stream == 'acc' else self.num_channels), dtype="float32")[:, channels]
+        values = np.concatenate(parts)
+        if stream == 'acc':
+            return values
+        ratio = self.rowsPerSample(stream)
+        lead = first % self.blocksamples * ratio
+        return values[lead:lead + (last - first) * ratio]
+
+    def streams(self):
+        """ List of the streams stored in the records."""
+        return [stream for stream, on in [('eeg', self.iseegon), ('stim', self.isstimon), ('acc', self.isaccon),
+                                          ('markers', True)] if on]
+
+    def rowsPerSample(self, stream):
+        """ Rows of a stream per record (acc rows are one every blocksamples records, see decodeStream)."""
+        return 2 if stream == 'stim' else 1
+
+
+class nedfStream(object):
+    """
+    Lazy and read-only stream ('eeg', 'stim', 'acc', 'markers' or 'time') of a memory mapped .nedf file, as used by
+    nedfReader with lazy=True. It behaves as the numpy array it stands for regarding shape, len and slicing, but it
+    only decodes the samples and channels that are sliced, e.g.,
+
+        >>> c = nedfReader("nedfdata/20180213122712_Patient01.nedf", lazy=True)
+        >>> c.np_eeg.shape = (1800000, 32)
+        >>> window = c.np_eeg[5000:10000, [0, 3]]  # decodes 5000 records, just 2 channels
+
+    Slices return numpy arrays. np.asarray(stream) decodes the whole stream.
+    """
+    def __init__(self, layout, buf, stream, samples):
+        self.layout = layout
+        self.buf = buf
+        self.stream = stream
+        self.samples = samples
+        self.dtype = np.dtype("float32")
+        if stream in ['markers', 'time']:
+            self.shape = (samples,)
+        elif stream == 'acc':
+            self.shape = (-(-samples // layout.blocksamples), 3)
+        else:
+            self.shape = (layout.rowsPerSample(stream) * samples, layout.num_channels)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > self.ndim:
+            raise IndexError("too many indices for nedfStream of {0} dimensions".format(self.ndim))
+        rows = key[0]
+        channels = key[1] if len(key) > 1 else slice(None)
+
+        # The decoded rows are always a contiguous range first..last-1, which is then indexed with 'local'.
+        if isinstance(rows, slice):
+            indices = range(*rows.indices(len(self)))
+            first, last = (min(indices[0], indices[-1]), max(indices[0], indices[-1]) + 1) if indices else (0, 0)
+            local = slice(None, None, rows.step)
+        elif np.ndim(rows) == 0:
+            row = int(rows) + len(self) if int(rows) < 0 else int(rows)
+            if not 0 <= row < len(self):
+                raise IndexError("index {0} is out of bounds for axis 0 with size {1}".format(rows, len(self)))
+            first, last, local = row, row + 1, 0
+        else:
+            indices = np.asarray(rows)
+            indices = np.flatnonzero(indices) if indices.dtype == bool else np.where(indices < 0, indices + len(self),
+                                                                                     indices)
+            first, last = (int(indices.min()), int(indices.max()) + 1) if indices.size else (0, 0)
+            local = indices - first
+
+        single = self.ndim > 1 and np.ndim(channels) == 0 and not isinstance(channels, slice)
+        values = self.readRows(first, last, [channels] if single else channels)[local]
+        return values[..., 0] if single else values
+
+    def readRows(self, first, last, channels):
+        """ Decodes the rows first..last-1 of the stream (all the slicing of the stream is done through readRows)."""
+        if self.stream == 'time':
+            return np.array(np.arange(first, last) * 2 / 1000., dtype="float32")
+        if self.stream == 'acc':
+            bs = self.layout.blocksamples
+            return self.layout.decodeStream(self.buf, 'acc', first * bs, min(last * bs, self.samples), self.samples,
+                                            channels)
+        ratio = self.layout.rowsPerSample(self.stream)
+        values = self.layout.decodeStream(self.buf, self.stream, first // ratio, -(-last // ratio), self.samples,
+                                          channels)
+        return values[first % ratio:first % ratio + last - first]
+
+
+def int24(raw):
+    """ Converts an array of big endian 24 bit two's complement values, shape (..., 3) and dtype uint8, to int32."""
+    raw = raw.astype(np.int32)
+    return ((raw[..., 0] << 24) | (raw[..., 1] << 16) | (raw[..., 2] << 8)) >> 8
+
+
 class XmlDictConfig(dict):
     """
     http://code.activestate.com/recipes/410469-xml-as-dictionary/
@@ -0,0 +1,146 @@
+"""
+Synthetic recordings for the nepy tests and benchmarks.
+The ground truth files of test_data.py live in a shared folder that is not always reachable, so these functions write
+small .nedf, .easy and .info files with known content that can be created on the fly (e.g. in a pytest tmp_path).
+
+The files follow the Neuroelectrics formats (see http://wiki.neuroelectrics.com/index.php/Files_%26_Formats):
+    - .nedf: xml header padded to 10240 bytes, followed by the binary records. Every record holds the EEG (24 bits
+      per channel), two stimulation samples (24 bits per channel) and a 4 byte marker. One accelerometer sample
+      (3 x 16 bits) precedes every 5th record.
+    - .easy: one tab separated row per EEG sample with the EEG in nV, the accelerometer (if any), the marker and the
+      unix time stamp in ms.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import gzip
+
+import numpy as np
+
+startdate = 1544774518507  # unix time (ms) used as first time stamp of the synthetic files
+
+
+def elist(n):
+    """ Electrode names used in the synthetic files: [Ch1, Ch2, ...] """
+    return ['Ch{0}'.format(i) for i in range(1, n + 1)]
+
+
+def randomRecording(num_channels, samples, seed=0):
+    """
+    Random raw data in the units stored in the files (EEG/stim in device counts, acc in mm/s^2).
+    :return: dictionary with 'eeg' (samples, num_channels), 'stim' (2*samples, num_channels),
+             'acc' (ceil(samples/5), 3) and 'markers' (samples) integer arrays.
+    """
+    rng = np.random.RandomState(seed)
+    return {
+        'eeg': rng.randint(-2 ** 23, 2 ** 23, size=(samples, num_channels)),
+        'stim': rng.randint(-2 ** 23, 2 ** 23, size=(2 * samples, num_channels)),
+        'acc': rng.randint(-2 ** 15, 2 ** 15, size=((samples + 4) // 5, 3)),
+        'markers': rng.randint(0, 2 ** 31, size=samples) * (rng.rand(samples) < 0.01)
+    }
+
+
+def _int24bytes(values):
+    """ Big endian 24 bit two's complement bytes of an integer array, shape (..., 3). """
+    v = np.asarray(values, dtype=np.int64) & 0xFFFFFF
+    return np.stack([(v >> 16) & 0xFF, (v >> 8) & 0xFF, v & 0xFF], axis=-1).astype(np.uint8)
+
+
+def nedfHeader(num_channels, samples, version='1.4', eeg=True, acc=True, stim=False, fs=500):
+    """ Xml header of a .nedf file. """
+    montage = ''.join('<Channel{0}>{1}</Channel{0}>'.format(i + 1, name) for i, name in enumerate(elist(num_channels)))
+    if version == '1.2':
+        return ('<Header><NEDFversion>1.2</NEDFversion><TotalNumberOfChannels>{nc}</TotalNumberOfChannels>'
+                '<StartDateEEG>{sd}</StartDateEEG><NumberOfRecordsOfEEG>{ns}</NumberOfRecordsOfEEG>'
+                '<EEGSamplingRate>{fs}</EEGSamplingRate><EEGMontage>{mt}</EEGMontage></Header>'
+                ).format(nc=num_channels, sd=startdate, ns=samples, fs=fs, mt=montage)
+    xml = '<Header><NEDFversion>1.4</NEDFversion><AccelerometerData>{0}</AccelerometerData>'.format(
+        'ON' if acc else 'OFF')
+    if eeg:
+        xml += ('<EEGSettings><TotalNumberOfChannels>{nc}</TotalNumberOfChannels><EEGSamplingRate>{fs}'
+                '</EEGSamplingRate><NumberOfRecordsOfEEG>{ns}</NumberOfRecordsOfEEG><EEGRecordingDuration>{dur}'
+                '</EEGRecordingDuration><EEGMontage>{mt}</EEGMontage></EEGSettings>'
+                ).format(nc=num_channels, fs=fs, ns=samples, dur=samples // fs, mt=montage)
+    if stim:
+        xml += ('<STIMSettings><TotalNumberOfChannels>{nc}</TotalNumberOfChannels><StimulationDuration>{dur}'
+                '</StimulationDuration><RampDownDuration>0</RampDownDuration><RampUpDuration>0</RampUpDuration>'
+                '<ShamRampDuration>0</ShamRampDuration><NumberOfRecordsOfStimulation>{ns}'
+                '</NumberOfRecordsOfStimulation></STIMSettings>').format(nc=num_channels, dur=samples // fs,
+                                                                       ns=2 * samples)
+    xml += '<StepDetails><StartDate_firstEEGTimestamp>{sd}</StartDate_firstEEGTimestamp></StepDetails></Header>'.format(
+        sd=startdate)
+    return xml
+
+
+def writeNedf(filepath, num_channels=8, samples=5000, version='1.4', eeg=True, acc=True, stim=False, seed=0):
+    """
+    Writes a synthetic .nedf file and returns the raw data written (see randomRecording).
+    Version '1.2' files always contain EEG and accelerometer records, as read by nedfReader.
+    """
+    if version == '1.2':
+        eeg, acc = True, True
+    data = randomRecording(num_channels, samples, seed)
+    header = nedfHeader(num_channels, samples, version=version, eeg=eeg, acc=acc, stim=stim).encode('utf-8')
+
+    eegbytes = _int24bytes(data['eeg']).reshape(samples, -1)
+    stimbytes = _int24bytes(data['stim']).reshape(samples, -1)
+    markerbytes = data['markers'].astype('>u4').view(np.uint8).reshape(samples, 4)
+    accbytes = data['acc'].astype('>i2').view(np.uint8).reshape(-1, 6)
+    with open(filepath, 'wb') as fil:
+        fil.write(header + b'\x00' * (10240 - len(header)))
+        for i in range(samples):
+            if acc and i % 5 == 0:
+                fil.write(accbytes[i // 5].tobytes())
+            if eeg:
+                fil.write(eegbytes[i].tobytes())
+            if stim:
+                fil.write(stimbytes[i].tobytes())
+            fil.write(markerbytes[i].tobytes())
+    return data
+
+
+def writeInfo(filepath, num_channels=8, acc=True):
+    """ Writes a minimal .info file with the electrode names of the synthetic files. """
+    with open(filepath, 'w') as fil:
+        fil.write('Number of EEG channels: {0}\n'.format(num_channels))
+        for i, name in enumerate(elist(num_channels)):
+            fil.write('Channel {0}: {1}\n'.format(i + 1, name))
+        if acc:
+            fil.write('Accelerometer data: 3 channels\n')
+
+
+def writeEasy(filepath, num_channels=8, samples=5000, acc=True, info=True, seed=0, dropped=None):
+    """
+    Writes a synthetic .easy (or .easy.gz, from the extension) file and returns the integer table written,
+    shape (samples, columns). If info is True, the companion .info file is also written. The rows of the samples in
+    the list dropped are not written (gaps in the time stamps, as samples lost by the device).
+    """
+    rng = np.random.RandomState(seed)
+    eeg = rng.randint(-10 ** 6, 10 ** 6, size=(samples, num_channels))
+    accs = rng.randint(-10 ** 4, 10 ** 4, size=(samples, 3))
+    markers = rng.randint(0, 10, size=(samples, 1)) * (rng.rand(samples, 1) < 0.01)
+    times = startdate + 2 * np.arange(samples).reshape(-1, 1)
+    table = np.hstack([eeg, accs, markers, times] if acc else [eeg, markers, times]).astype(np.int64)
+    if dropped is not None:
+        table = np.delete(table, dropped, axis=0)
+
+    text = '\n'.join('\t'.join(str(v) for v in row) for row in table.tolist()) + '\n'
+    if filepath.endswith('.gz'):
+        with gzip.open(filepath, 'wt') as fil:
+            fil.write(text)
+    else:
+        with open(filepath, 'w') as fil:
+            fil.write(text)
+    if info:
+        root = filepath[:-8] if filepath.endswith('.easy.gz') else filepath[:-5]
+        writeInfo(root + '.info', num_channels, acc)
+    return table
+
+
+def syntheticEEG(samples=30000, channels=8, seed=0):
+    """ float32 EEG-like data (uV) with offsets, drifts, 10 Hz and 50 Hz components."""
+    rng = np.random.RandomState(seed)
+    t = np.arange(samples) / 500.
+    eeg = rng.uniform(-1e4, 1e4, size=channels) + np.cumsum(rng.normal(0, 1, size=(samples, channels)), axis=0)
+    eeg += 10 * np.sin(2 * np.pi * 10 * t)[:, None] + 5 * np.sin(2 * np.pi * 50 * t)[:, None]
+    return eeg.astype("float32")
@@ -27,7 +27,7 @@ def test_batch():
     :return: it should return a green tick! It works ;)
     """
     if os.path.isdir(testpath) is False:
-        pytest.exit('The the -testfiles- folder path of your computer does not match with the one written '
+        pytest.skip('The the -testfiles- folder path of your computer does not match with the one written '
                     'in test_data.py (testpath) ')
 
     processed, skipped = processDirectory(testpath, plotit=False)
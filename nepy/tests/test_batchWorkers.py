@@ -0,0 +1,152 @@
+"""
+Test to the batch processor of nepy (see batch.py), on synthetic files (see synthetic_data.py),
+that do not need the test data of test_data.py.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import os
+import time
+
+import pytest
+
+import nepy.frida.batch as batch
+from nepy.frida.batch import processDirectory
+from nepy.frida.frida import defaultParameters
+from nepy.frida.manifest import Manifest
+from nepy.tests.synthetic_data import writeEasy, writeNedf
+
+
+@pytest.fixture
+def datapath(tmp_path):
+    """ Data directory with synthetic recordings and a file that can not be read."""
+    writeNedf(str(tmp_path / 'rec1.nedf'), num_channels=8, samples=15000)
+    writeEasy(str(tmp_path / 'rec2.easy'), num_channels=8, samples=12000)
+    with open(str(tmp_path / 'rec3.nedf'), 'w') as fil:
+        fil.write('not a nedf file')
+    writeNedf(str(tmp_path / 'rec4.nedf'), num_channels=8, samples=12000)
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_batch_workers(datapath, workers, capsys):
+    """ The same processed and skipped files, in the order of the files, with or without worker processes."""
+    processed, skipped = processDirectory(datapath, plotit=False, workers=workers)
+    assert processed == [datapath + "/" + fil for fil in ['rec1.nedf', 'rec2.easy', 'rec4.nedf']]
+    assert skipped == [datapath + "/rec3.nedf"]
+    assert 'Traceback (most recent call last)' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_batch_short_file(tmp_path, workers):
+    """ A recording too short to be checked by epochs is processed, without a number of bad epochs."""
+    filepath = str(tmp_path / 'short.nedf')
+    writeNedf(filepath, num_channels=8, samples=7500)
+    assert batch.processFile(filepath, plotit=False)['bad_epochs'] is None
+    assert processDirectory(str(tmp_path), plotit=False, workers=workers) == ([filepath], [])
+
+
+def test_batch_timeout(datapath, monkeypatch):
+    """ The worker of a file that takes longer than the timeout is killed, and the file skipped."""
+    def slowFile(filepath, **options):
+        if filepath.endswith('rec2.easy'):
+            time.sleep(60)
+        return {}
+    monkeypatch.setattr(batch, 'processFile', slowFile)
+    start = time.time()
+    processed, skipped = processDirectory(datapath, plotit=False, workers=2, timeout=2)
+    assert time.time() - start < 30
+    assert skipped == [datapath + "/rec2.easy"] and len(processed) == 3
+
+
+def test_batch_prefetch(datapath, monkeypatch):
+    """ Reading the files ahead: the same results, and never more than 'ahead' files read before they are used."""
+    processed, skipped = processDirectory(datapath, plotit=False, prefetch=2)
+    assert len(processed) == 3 and skipped == [datapath + "/rec3.nedf"]
+
+    started = []
+    monkeypatch.setattr(batch, 'Capsule', lambda filepath, *args, **kwargs: started.append(filepath) or filepath)
+    filepaths = [datapath + "/rec{0}.nedf".format(ix) for ix in range(10)]
+    for used, (filepath, capsule) in enumerate(batch.prefetchCapsules(filepaths, ahead=2)):
+        assert capsule.result() == filepath == filepaths[used]
+        assert len(started) <= used + 3
+    assert started == filepaths
+
+
+def test_batch_manifest(datapath, tmp_path, monkeypatch):
+    """ A rerun with a manifest processes just the new, changed and failed files, and the ones of a new config."""
+    outpath = str(tmp_path / 'out')
+    processed, skipped = processDirectory(datapath, plotit=False, outpath=outpath)
+    manifest = Manifest(outpath)
+    assert [row['status'] for row in manifest.query()] == ['done', 'done', 'failed', 'done']
+    row = manifest.get('rec1.nedf')
+    assert row['qc']['samples'] == 15000 and row['seconds'] > 0 and len(row['hash']) == 64
+    assert 'Traceback' in manifest.get('rec3.nedf')['error']
+    assert manifest.query(order_by="status DESC, filename")[0]['filename'] == 'rec3.nedf'
+    with pytest.raises(ValueError):
+        manifest.query(order_by="filename; DELETE FROM recordings")
+
+    calls = []
+    monkeypatch.setattr(batch, 'processFile', lambda filepath, **options: calls.append(filepath) or {})
+    os.utime(datapath + '/rec1.nedf', ns=(0, 10 ** 9))  # touched: same content
+    with open(datapath + '/rec4.nedf', 'ab') as fil:  # changed content
+        fil.write(b'\0' * 10)
+    writeNedf(datapath + '/rec5.nedf')  # new file
+    rerun = processDirectory(datapath, plotit=False, outpath=outpath)
+    assert calls == [datapath + "/" + fil for fil in ['rec3.nedf', 'rec4.nedf', 'rec5.nedf']]
+    assert rerun == ([datapath + "/" + fil for fil in ['rec1.nedf', 'rec2.easy', 'rec3.nedf', 'rec4.nedf',
+                                                       'rec5.nedf']], [])
+
+    calls.clear()
+    processDirectory(datapath, plotit=False, outpath=outpath)
+    assert calls == []
+    parameters = defaultParameters()
+    parameters['line_freq'] = 60.
+    processDirectory(datapath, plotit=False, outpath=outpath, parameters=parameters)
+    assert len(calls) == 5
+
+
+def test_batch_memory(datapath, tmp_path, monkeypatch):
+    """ The largest files are started first, and never more at a time than what fits in the memory budget."""
+    header = {'num_channels': 8, 'samples': 10000, 'stim_data': False}
+    small = batch.estimateMemory(header, pipeline=['detrend'])
+    assert batch.estimateMemory(header) > small
+    assert batch.estimateMemory(dict(header, num_channels=32)) > batch.estimateMemory(header)
+    assert batch.estimateMemory(dict(header, stim_data=True)) > batch.estimateMemory(header)
+    assert batch.estimateMemory(None) == 0
+
+    log = str(tmp_path / 'log.txt')
+
+    def loggedFile(filepath, **options):
+        with open(log, 'a') as fil:
+            fil.write("start " + os.path.basename(filepath) + "\n")
+        time.sleep(0.5)
+        with open(log, 'a') as fil:
+            fil.write("end " + os.path.basename(filepath) + "\n")
+        return {}
+    monkeypatch.setattr(batch, 'processFile', loggedFile)
+    budget = batch.estimateMemory(batch.readHeader(datapath + '/rec1.nedf')) + 2 ** 20
+    processed, skipped = processDirectory(datapath, plotit=False, workers=3, memory_budget=budget)
+    assert processed == [datapath + "/" + fil for fil in ['rec1.nedf', 'rec2.easy', 'rec3.nedf', 'rec4.nedf']]
+    with open(log) as fil:
+        events = [line.split() for line in fil if 'rec3' not in line]  # rec3 has no header: no estimate
+    assert events == [['start', 'rec1.nedf'], ['end', 'rec1.nedf'], ['start', 'rec2.easy'], ['end', 'rec2.easy'],
+                      ['start', 'rec4.nedf'], ['end', 'rec4.nedf']]
+
+
+def test_schedule_header(tmp_path):
+    """ The headers used to schedule the workers are read from the start of the files, without indexing .easy.gz."""
+    for filename, samples in [('rec.easy', 30000), ('rec.easy.gz', 30000), ('rec.nedf', 15000)]:
+        filepath = str(tmp_path / filename)
+        if filename.endswith('.nedf'):
+            writeNedf(filepath, num_channels=8, samples=samples, stim=True)
+        else:
+            writeEasy(filepath, num_channels=32, samples=samples, info=False)
+        header = batch.scheduleHeader(filepath)
+        assert header['num_channels'] == (8 if filename.endswith('.nedf') else 32)
+        assert abs(header['samples'] - samples) < samples / 100.
+        assert header['stim_data'] == filename.endswith('.nedf')
+    assert not os.path.exists(str(tmp_path / 'rec.easy.gz.gzidx'))
+    with open(str(tmp_path / 'bad.easy'), 'w') as fil:
+        fil.write('not an easy file')
+    assert batch.scheduleHeader(str(tmp_path / 'bad.easy')) is None
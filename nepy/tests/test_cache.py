@@ -0,0 +1,86 @@
+"""
+Test to the CapsuleCache class of nepy, on synthetic files (see synthetic_data.py).
+
+2019 Neuroelectrics Barcelona
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from nepy.capsule.cache import CapsuleCache
+from nepy.capsule.capsule import Capsule
+from nepy.tests.synthetic_data import writeEasy, writeNedf
+
+
+@pytest.mark.parametrize('filename', ['synthetic.nedf', 'synthetic.easy', 'synthetic.easy.gz'])
+def test_warm_open(tmp_path, filename):
+    """ The second opening is loaded from the cache, with the same arrays and metadata."""
+    filepath = str(tmp_path / filename)
+    if filename.endswith('.nedf'):
+        writeNedf(filepath, num_channels=8, samples=3000, stim=True)
+    else:
+        writeEasy(filepath, num_channels=8, samples=3000)
+    cache = CapsuleCache(str(tmp_path / 'cache'))
+
+    cold = Capsule(filepath, cache=cache)
+    warm = Capsule(filepath, cache=cache)
+    assert not cold.cached and warm.cached
+    assert isinstance(warm.np_eeg, np.memmap)
+    for name in ['np_eeg', 'np_acc', 'np_markers', 'np_stim', 'np_time']:
+        assert np.array_equal(np.asarray(getattr(cold, name), dtype="float32"), getattr(warm, name))
+    for name in ['eegstartdate', 'basename', 'fs', 'num_channels', 'electrodes', 'filenameroot', 'filepath']:
+        assert getattr(cold, name) == getattr(warm, name)
+    assert not Capsule(filepath, cache=False).cached
+
+
+@pytest.mark.parametrize('error', [PermissionError, FileNotFoundError])
+def test_last_use_errors(tmp_path, monkeypatch, error):
+    """ The cached data is used when the last use of the entry can not be written (read-only or evicted entry)."""
+    filepath = str(tmp_path / 'synthetic.easy')
+    writeEasy(filepath, num_channels=8, samples=3000)
+    cache = CapsuleCache(str(tmp_path / 'cache'))
+    Capsule(filepath, cache=cache)
+
+    def utime(path, *args, **kwargs):
+        raise error(path)
+    monkeypatch.setattr(os, 'utime', utime)
+    warm = Capsule(filepath, cache=cache)
+    assert warm.good_init and warm.cached and warm.np_eeg.shape == (3000, 8)
+
+
+def test_stale_entries(tmp_path):
+    """ Entries of modified files are not used, and entries can be removed explicitly."""
+    filepath = str(tmp_path / 'synthetic.easy')
+    writeEasy(filepath, num_channels=8, samples=3000)
+    cache = CapsuleCache(str(tmp_path / 'cache'))
+    Capsule(filepath, cache=cache)
+
+    writeEasy(filepath, num_channels=8, samples=3500, seed=1)
+    c = Capsule(filepath, cache=cache)
+    assert not c.cached and len(c.np_eeg) == 3500
+    assert Capsule(filepath, cache=cache).cached
+
+    cache.invalidate(filepath)
+    assert cache.get(filepath) is None and cache.size() == 0
+
+
+def test_lru_eviction(tmp_path):
+    """ The least recently used entries are removed to keep the cache under max_bytes."""
+    filepaths = [str(tmp_path / 'synthetic{0}.easy'.format(i)) for i in range(3)]
+    for i, filepath in enumerate(filepaths):
+        writeEasy(filepath, num_channels=8, samples=3000, seed=i)
+    cache = CapsuleCache(str(tmp_path / 'cache'))
+    Capsule(filepaths[0], cache=cache)
+    entry = cache.size()
+
+    cache.max_bytes = 2 * entry
+    Capsule(filepaths[1], cache=cache)
+    for age, (_, _, entrydir) in enumerate(cache.entries()):  # entries of filepaths[0] and [1], 10 s apart
+        os.utime(os.path.join(entrydir, 'meta.json'), (1e9 + 10 * age, 1e9 + 10 * age))
+    assert cache.get(filepaths[0]) is not None  # filepaths[1] is now the least recently used
+    Capsule(filepaths[2], cache=cache)
+    assert cache.size() <= 2 * entry
+    assert cache.get(filepaths[1]) is None
+    assert cache.get(filepaths[0]) is not None and cache.get(filepaths[2]) is not None
@@ -30,7 +30,7 @@ def capsules():
     Generating two different capsules to test: one from an .easy file and the other from nedf files.
     """
     if os.path.isdir(testpath) is False:
-        pytest.exit('The the -testfiles- folder path of your computer does not match with the one written '
+        pytest.skip('The the -testfiles- folder path of your computer does not match with the one written '
                     'in test_data.py (testpath) ')
     easy_filepath = os.path.join(testpath, str(easyTestData[list(easyTestData.keys())[0]]['filename']) + '.easy')
     nedf_filepath = os.path.join(testpath, str(nedfTestData[list(nedfTestData.keys())[0]]['filename']) + '.nedf')
@@ -0,0 +1,56 @@
+"""
+Test to the on-demand Capsules of nepy, on synthetic files (see synthetic_data.py),
+that do not need the test data of test_data.py.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import numpy as np
+import pytest
+
+from nepy.capsule.capsule import Capsule
+from nepy.frida.frida import Frida
+from nepy.tests.synthetic_data import writeEasy, writeNedf
+
+
+@pytest.mark.parametrize('filename', ['synthetic.nedf', 'synthetic.easy', 'synthetic.easy.gz'])
+def test_on_demand(tmp_path, filename):
+    """ On-demand Capsules decode the streams on their first access, with the same arrays as the eager ones."""
+    filepath = str(tmp_path / filename)
+    if filename.endswith('.nedf'):
+        writeNedf(filepath, num_channels=8, samples=3000, stim=True)
+    else:
+        writeEasy(filepath, num_channels=8, samples=3000)
+    eager = Capsule(filepath, cache=False)
+    c = Capsule(filepath, cache=False, on_demand=True)
+    assert c.on_demand and not eager.on_demand
+    for name in ['eegstartdate', 'fs', 'num_channels', 'electrodes', 'basename', 'filenameroot']:
+        assert getattr(c, name) == getattr(eager, name)
+    assert 'np_eeg' not in vars(c) and 'np_stim' not in vars(c)
+
+    assert np.array_equal(c.np_eeg, eager.np_eeg)
+    if filename.endswith('.nedf'):  # just the EEG has been decoded
+        assert 'np_stim' not in vars(c) and 'np_time' not in vars(c)
+    for name in ['np_eeg', 'np_acc', 'np_markers', 'np_stim', 'np_time']:
+        assert np.array_equal(getattr(c, name), np.asarray(getattr(eager, name), dtype="float32")), name
+
+    c.release('np_eeg')
+    assert 'np_eeg' not in vars(c) and 'np_time' in vars(c)
+    assert np.array_equal(c.np_eeg, eager.np_eeg)
+    c.release()
+    assert not any(name.startswith('np_') for name in vars(c))
+    with pytest.raises(AttributeError):
+        c.PSD
+
+
+def test_on_demand_frida(tmp_path):
+    """ Frida on an on-demand Capsule decodes just the EEG, and the other streams of the span when they are used."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=15000, stim=True)
+    c = Capsule(filepath, cache=False, on_demand=True)
+    f = Frida(filepath, capsule=c)
+    assert f.eeg.shape == (15000, 8) and 'np_stim' not in vars(c)
+
+    f = Frida(filepath, capsule=Capsule(filepath, cache=False, on_demand=True), time_span=[10, 20])
+    assert f.eeg.shape == (5000, 8) and 'np_time' not in vars(f.c)
+    assert f.time.shape == (5000,) and f.stim.shape == (10000, 8) and f.c.np_time.shape == (15000,)
@@ -0,0 +1,81 @@
+"""
+Test to the header-only reads and the Catalog class of nepy.
+It uses synthetic files (see synthetic_data.py), so that the metadata of the headers can be compared with the one of
+the readers for the whole file.
+In case you have modified the catalog module, then you might need to modify these test functions too.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import os
+import time
+
+import pytest
+
+from nepy.capsule.capsule import Capsule
+from nepy.readers.catalog import Catalog, readHeader
+from nepy.tests.synthetic_data import writeEasy, writeNedf
+
+
+@pytest.fixture
+def datapath(tmp_path):
+    """ Data directory with an .easy, an .easy.gz (without .info file) and a .nedf synthetic file."""
+    writeEasy(str(tmp_path / 'rec1.easy'), num_channels=8, samples=3000)
+    writeEasy(str(tmp_path / 'rec2.easy.gz'), num_channels=20, samples=2000, acc=False, info=False)
+    writeNedf(str(tmp_path / 'rec3.nedf'), num_channels=32, samples=2500, stim=True)
+    return str(tmp_path)
+
+
+def test_read_header(datapath):
+    """ The metadata obtained from the headers must be the one of the capsules."""
+    for fil in ['rec1.easy', 'rec2.easy.gz', 'rec3.nedf']:
+        header = readHeader(os.path.join(datapath, fil))
+        c = Capsule(os.path.join(datapath, fil))
+        assert header['num_channels'] == c.num_channels
+        assert header['electrodes'] == c.electrodes
+        assert header['fs'] == c.fs
+        assert header['samples'] == len(c.np_eeg)
+        assert header['eegstartdate'] == c.eegstartdate
+    assert readHeader(os.path.join(datapath, 'rec1.info')) is None
+
+
+@pytest.mark.parametrize('filename', ['gaps.easy', 'gaps.easy.gz'])
+def test_read_header_gaps(tmp_path, filename):
+    """ With samples lost (gaps in the time stamps), the samples and duration are the rows of the file."""
+    filepath = str(tmp_path / filename)
+    writeEasy(filepath, num_channels=8, samples=5196, dropped=range(1000, 1196))
+    header = readHeader(filepath)
+    assert header['samples'] == len(Capsule(filepath, cache=False).np_eeg) == 5000
+    assert header['duration'] == 10.
+
+
+def test_catalog(datapath):
+    """ The catalog is stored in the data directory and refreshed when files change."""
+    cat = Catalog(datapath)
+    assert os.path.isfile(os.path.join(datapath, 'nepy_catalog.sqlite'))
+    assert len(cat) == 3
+    assert [rec['filename'] for rec in cat.query("num_channels >= ?", (20,))] == ['rec2.easy.gz', 'rec3.nedf']
+    assert cat.query("filename = 'rec3.nedf'")[0]['stim_data'] is True
+
+    # Nothing changed, nothing is read:
+    assert Catalog(datapath, refresh=False).refresh() == ([], [])
+
+    # A modified file and a removed file:
+    time.sleep(0.01)
+    writeNedf(os.path.join(datapath, 'rec3.nedf'), num_channels=32, samples=5000)
+    os.remove(os.path.join(datapath, 'rec1.easy'))
+    assert cat.refresh() == (['rec3.nedf'], ['rec1.easy'])
+    assert cat.query("filename = 'rec3.nedf'")[0]['samples'] == 5000
+    assert len(cat) == 2
+
+
+def test_catalog_order_by(datapath):
+    """ The results are sorted by catalog fields, and anything else is refused."""
+    cat = Catalog(datapath, verbose=False)
+    assert [rec['filename'] for rec in cat.query(order_by="num_channels DESC")] == ['rec3.nedf', 'rec2.easy.gz',
+                                                                                   'rec1.easy']
+    assert [rec['filename'] for rec in cat.query(order_by="acc_data, filename")][0] == 'rec2.easy.gz'
+    for order_by in ["filename; DROP TABLE recordings", "(SELECT 1)", "filename DESC LIMIT 1", "size,"]:
+        with pytest.raises(ValueError):
+            cat.query(order_by=order_by)
+    assert len(cat) == 3
@@ -0,0 +1,46 @@
+"""
+Test to the ChannelStats class of nepy.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import numpy as np
+import pytest
+
+from nepy.frida.channelStats import ChannelStats
+from nepy.readers.chunkReader import iterChunks
+from nepy.readers.nedfReader import nedfReader
+from nepy.tests.synthetic_data import writeNedf
+
+
+@pytest.mark.parametrize('chunk', [7, 1000, 2 ** 16])
+def test_statistics(chunk):
+    """ Same statistics as numpy, whatever the chunk size, also with large offsets."""
+    rng = np.random.RandomState(0)
+    data = (rng.uniform(-1e5, 1e5, size=16) + rng.normal(0, 20, size=(5003, 16))).astype("float32")
+    stats = ChannelStats(data, chunk=chunk)
+    reference = data.astype(np.float64)
+    assert stats.count == 5003
+    assert np.allclose(stats.mean, reference.mean(axis=0), rtol=1e-12, atol=0)
+    assert np.allclose(stats.std, reference.std(axis=0), rtol=1e-9, atol=0)
+    assert np.array_equal(stats.min, data.min(axis=0)) and np.array_equal(stats.max, data.max(axis=0))
+    assert np.array_equal(stats.ptp, data.max(axis=0).astype(np.float64) - data.min(axis=0))
+
+
+def test_merge_and_stream(tmp_path):
+    """ Statistics of parts of a recording can be merged, and computed from the chunks of a file."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=7003)
+    eeg = nedfReader(filepath).np_eeg
+    whole = ChannelStats(eeg)
+
+    merged = ChannelStats(eeg[:3000]).merge(ChannelStats(eeg[3000:])).merge(ChannelStats())
+    streamed = ChannelStats()
+    for chunk in iterChunks(filepath, chunk_seconds=3):
+        streamed.update(chunk['np_eeg'])
+    for stats in [merged, streamed]:
+        assert stats.count == whole.count
+        for name in ['mean', 'std', 'min', 'max', 'ptp']:
+            assert np.allclose(getattr(stats, name), getattr(whole, name), rtol=1e-10, atol=1e-9)
+    summary = whole.summary(['Ch{0}'.format(i) for i in range(1, 9)])
+    assert summary['samples'] == 7003 and len(summary['std']) == 8 and summary['channels'][0] == 'Ch1'
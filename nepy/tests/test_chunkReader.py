@@ -0,0 +1,44 @@
+"""
+Test to the iterChunks generator of nepy.
+It uses synthetic files (see synthetic_data.py) and checks that the chunks put together are the arrays obtained by the
+readers for the whole file.
+In case you have modified the chunkReader module, then you might need to modify these test functions too.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import numpy as np
+import pytest
+
+from nepy.readers.chunkReader import iterChunks
+from nepy.readers.easyReader import easyReader
+from nepy.readers.nedfReader import nedfReader
+from nepy.tests.synthetic_data import writeEasy, writeNedf
+
+
+@pytest.mark.parametrize("filename", ['synthetic.easy', 'synthetic.easy.gz', 'synthetic.nedf'])
+def test_chunks(tmp_path, filename):
+    """ The chunks must be consecutive and have the same values as the reader arrays."""
+    filepath = str(tmp_path / filename)
+    if filename.endswith('.nedf'):
+        writeNedf(filepath, num_channels=8, samples=7003, stim=True)
+        rdr = nedfReader(filepath)
+    else:
+        writeEasy(filepath, num_channels=8, samples=7003)
+        rdr = easyReader(filepath)
+
+    chunks = list(iterChunks(filepath, chunk_seconds=4))
+    assert len(chunks) == 4
+    assert [len(chunk['np_eeg']) for chunk in chunks] == [2000, 2000, 2000, 1003]
+    for stream in ['np_eeg', 'np_acc', 'np_markers', 'np_time', 'np_stim']:
+        if len(getattr(rdr, stream)) > 0:
+            assert np.array_equal(getattr(rdr, stream), np.concatenate([chunk[stream] for chunk in chunks]))
+
+
+def test_chunk_channels(tmp_path):
+    """ Just the selected channels are returned."""
+    filepath = str(tmp_path / 'synthetic.easy')
+    writeEasy(filepath, num_channels=8, samples=3000)
+    rdr = easyReader(filepath)
+    chunks = list(iterChunks(filepath, chunk_seconds=2, channels=[3, 1]))
+    assert np.array_equal(rdr.np_eeg[:, [3, 1]], np.concatenate([chunk['np_eeg'] for chunk in chunks]))
@@ -0,0 +1,29 @@
+"""
+Test to the piecewise linear detrend of Frida (nepy.frida.detrending): the same result as scipy.signal.detrend with
+breakpoints.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import numpy as np
+import pytest
+from scipy.signal import detrend
+
+from nepy.frida.detrending import piecewiseDetrend
+
+
+@pytest.mark.parametrize('samples, step', [(30000, 5000), (32345, 5000), (4000, 5000), (32345, 1166.65)])
+def test_piecewise_detrend(samples, step):
+    """ Whole segments, a shorter last segment, a single segment and irregular breakpoints."""
+    rng = np.random.RandomState(0)
+    data = rng.uniform(-1e4, 1e4, size=6) + np.cumsum(rng.normal(0, 1, size=(samples, 6)), axis=0)
+    breakpoints = np.arange(0, samples, step, dtype="int32")
+    expected = detrend(data, axis=0, bp=breakpoints)
+    assert np.allclose(piecewiseDetrend(data, breakpoints, batch=2), expected, rtol=0, atol=1e-8)
+
+    data32 = data.astype("float32")
+    detrended = piecewiseDetrend(data32, breakpoints)
+    assert detrended.dtype == np.float32
+    assert np.max(np.abs(detrended - detrend(data32.astype(np.float64), axis=0, bp=breakpoints))) < 1e-5
+    piecewiseDetrend(data32, breakpoints, out=data32)
+    assert np.array_equal(data32, detrended)
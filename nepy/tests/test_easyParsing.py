@@ -0,0 +1,111 @@
+"""
+Test to the easyReader class of nepy, on synthetic files (see synthetic_data.py),
+that do not need the test data of test_data.py.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import gzip
+
+import numpy as np
+import pytest
+
+from nepy.readers.easyReader import easyReader, easyParse, easyRanges
+from nepy.tests.synthetic_data import writeEasy, startdate
+
+
+@pytest.mark.parametrize('filename, acc, info', [('synthetic.easy', True, True), ('synthetic.easy.gz', True, True),
+                                                 ('noacc.easy', False, True), ('noinfo.easy', True, False)])
+def test_parse_rows(tmp_path, filename, acc, info):
+    """ The parsed arrays hold the synthetic table in the reader units, also when read by several blocks of text."""
+    filepath = str(tmp_path / filename)
+    table = writeEasy(filepath, num_channels=8, samples=3001, acc=acc, info=info)
+    rdr = easyReader(filepath)
+
+    assert rdr.num_channels == 8 and bool(rdr.acc_data) == acc
+    assert rdr.samples == 3001 and rdr.eegstartdate_unixtime == startdate
+    assert np.array_equal(rdr.np_eeg, np.float32(table[:, :8] / 1000.))
+    assert np.array_equal(rdr.np_markers, np.float32(table[:, -2]))
+    assert np.array_equal(rdr.np_time, np.float32((table[:, -1] - startdate) / 1000.))
+    if acc:
+        assert np.array_equal(rdr.np_acc, np.float32(table[:, 8:11]))
+    else:
+        assert rdr.np_acc.size == 0
+
+    arrays, acc_data, timestamp = easyParse(filepath, blocksize=1000)
+    assert timestamp == startdate
+    for stream in ['np_eeg', 'np_acc', 'np_markers', 'np_time']:
+        assert np.array_equal(getattr(rdr, stream), arrays[stream])
+
+
+@pytest.mark.parametrize('filename', ['synthetic.easy', 'synthetic.easy.gz'])
+def test_parse_corrupt_row(tmp_path, filename):
+    """ A value that is not an integer raises ValueError, instead of leaving the rest of the rows empty."""
+    filepath = str(tmp_path / 'clean.easy')
+    writeEasy(filepath, num_channels=8, samples=1000)
+    with open(filepath, 'rb') as fil:
+        lines = fil.read().split(b'\n')
+    lines[500] = b'x' + lines[500][1:]
+    corrupt = str(tmp_path / filename)
+    with (gzip.open(corrupt, 'wb') if filename.endswith('.gz') else open(corrupt, 'wb')) as fil:
+        fil.write(b'\n'.join(lines))
+    with pytest.raises(ValueError):
+        easyParse(corrupt)
+    with pytest.raises(ValueError):
+        easyReader(corrupt, verbose=False)
+    if filename.endswith('.gz'):
+        rdr = easyReader(corrupt, verbose=False, header_only=True)  # windows read from the index, or parsed
+        with pytest.raises(ValueError):
+            rdr.readRecords(400, 600)
+    else:
+        with pytest.raises(ValueError):
+            easyParse(corrupt, workers=2)
+
+
+def test_parallel_parse(tmp_path):
+    """ Parsing with a pool of processes gives the same arrays, in the same row order, as the current process."""
+    filepath = str(tmp_path / 'synthetic.easy')
+    writeEasy(filepath, num_channels=8, samples=3001)
+    with open(filepath, 'rb') as fil:
+        text = fil.read()
+    ranges = easyRanges(filepath, 4)
+    assert len(ranges) == 4 and ranges[0][0] == 0 and ranges[-1][1] == len(text)
+    assert all(text[start - 1:start] == b'\n' for start, stop in ranges[1:])
+
+    rdr = easyReader(filepath)
+    arrays, acc_data, timestamp = easyParse(filepath, blocksize=1000, workers=4)
+    assert timestamp == startdate and acc_data
+    for stream in ['np_eeg', 'np_acc', 'np_markers', 'np_time']:
+        assert np.array_equal(getattr(rdr, stream), arrays[stream])
+    assert np.array_equal(rdr.np_eeg, easyReader(filepath, workers=2).np_eeg)
+
+
+@pytest.mark.parametrize('filename, header_only', [('synthetic.easy.gz', True), ('synthetic.easy', True),
+                                                   ('synthetic.easy', False)])
+def test_read_window(tmp_path, filename, header_only):
+    """ Windows read from the index, parsed from the beginning, or sliced from the arrays are the same."""
+    filepath = str(tmp_path / filename)
+    writeEasy(filepath, num_channels=8, samples=6001)
+    full = easyReader(filepath)
+    rdr = easyReader(filepath, header_only=header_only)
+    if filename.endswith('.gz') and header_only:
+        assert rdr.index is not None and rdr.index.rows == 6001
+    assert rdr.samples == 6001
+
+    window = rdr.readWindow(3.5, 7.25, channels=['Ch3', 0])
+    assert np.array_equal(window['np_eeg'], full.np_eeg[1750:3625, [2, 0]])
+    for stream in ['np_acc', 'np_markers', 'np_time']:
+        assert np.array_equal(window[stream], getattr(full, stream)[1750:3625])
+    tail = rdr.readRecords(5000, None)
+    assert np.array_equal(tail['np_eeg'], full.np_eeg[5000:])
+
+
+def test_header_dropped_samples(tmp_path):
+    """ With samples lost (gaps in the time stamps), the indexed .easy.gz files count the rows of the file."""
+    filepath = str(tmp_path / 'synthetic.easy.gz')
+    writeEasy(filepath, num_channels=8, samples=5196, dropped=range(1000, 1196))
+    rdr = easyReader(filepath, header_only=True)
+    if rdr.index is None:
+        pytest.skip('zlib library not found')
+    assert rdr.samples == 5000
+    assert len(rdr.readRecords(0, None)['np_eeg']) == 5000
@@ -0,0 +1,40 @@
+"""
+Test to the filtering engine of Frida (nepy.frida.filters): same output as the per channel filtfilt(b, a) of the
+previous versions, within the documented tolerance.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import numpy as np
+from scipy.signal import butter, filtfilt, iirnotch
+
+from nepy.frida.filters import bandpassSOS, notchSOS, zeroPhase
+from nepy.frida.frida import Frida
+from nepy.tests.synthetic_data import syntheticEEG, writeNedf
+
+
+def test_tolerance():
+    """ Notch and bandpass filters of all channels at once compared to filtfilt(b, a) channel by channel."""
+    eeg = syntheticEEG()
+    b, a = butter(5, [2. / 250., 45. / 250.], btype='bandpass')
+    reference = np.stack([filtfilt(b, a, eeg[:, ch]) for ch in range(eeg.shape[1])], axis=1).astype("float32")
+    filtered = zeroPhase(bandpassSOS(2., 45., 500., 5), eeg)
+    assert filtered.dtype == np.float32 and filtered.shape == eeg.shape
+    assert np.max(np.abs(filtered - reference)) < 1e-4 * np.max(np.abs(eeg))
+
+    b, a = iirnotch(50., 30., 500.)
+    reference = np.stack([filtfilt(b, a, eeg[:, ch]) for ch in range(eeg.shape[1])], axis=1).astype("float32")
+    assert np.max(np.abs(zeroPhase(notchSOS(50., 30., 500.), eeg) - reference)) < 1e-4 * np.max(np.abs(eeg))
+
+
+def test_fused_filters(tmp_path):
+    """ The fused notch and bandpass pass equals the two passes, but at the edges of the recording (first and last 5 s)."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=5000)
+    f = Frida(filepath)
+    f.eeg_original = syntheticEEG()
+    f.preprocess(['reset', 'remove_line_freq', 'bandpassfilter'])
+    separate = f.eeg.copy()
+    f.preprocess(['reset', 'remove_line_freq', 'bandpassfilter'], fuse_filters=True)
+    assert len(f.log) == 2 * 3 + 1
+    assert np.max(np.abs(f.eeg - separate)[2500:-2500]) < 1e-3
@@ -28,7 +28,7 @@ def fobj():
     so we make sure we have at leasst one file to test!
     """
     if os.path.isdir(testpath) is False:
-        pytest.exit('The the -testfiles- folder path of your computer does not match with the one written '
+        pytest.skip('The the -testfiles- folder path of your computer does not match with the one written '
                     'in test_data.py (testpath) ')
     filepath = os.path.join(testpath, str(easyTestData[list(easyTestData.keys())[0]]['filename']) + '.easy')
 
@@ -88,6 +88,9 @@ def test_fridainit(input_span, eeg_vals):
     For more informaiton check the test_data.py
     :return:
     """
+    if os.path.isdir(testpath) is False:
+        pytest.skip('The the -testfiles- folder path of your computer does not match with the one written '
+                    'in test_data.py (testpath) ')
     filepath = os.path.join(testpath, 'fake_easy.easy')
 
     # Test the input span is correct:
@@ -0,0 +1,198 @@
+"""
+Test to the Frida class of nepy, on synthetic files (see synthetic_data.py),
+that do not need the test data of test_data.py.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import numpy as np
+import pytest
+
+from nepy.capsule.capsule import Capsule
+from nepy.frida.frida import Frida, defaultParameters
+from nepy.tests.synthetic_data import writeEasy, writeNedf
+
+
+def test_nedf_time_span(tmp_path):
+    """
+    With a time_span, .nedf files are read just for the records of the span. The result must be the same as the one
+    obtained slicing the whole file.
+    """
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=15000, stim=True)
+    f_all = Frida(filepath)
+    f_span = Frida(filepath, time_span=[4, 26])
+
+    assert np.array_equal(f_all.eeg[2000:13000, :], f_span.eeg)
+    assert np.array_equal(f_all.time[2000:13000], f_span.time)
+    assert np.array_equal(f_all.markers[2000:13000], f_span.markers)
+    assert np.array_equal(f_all.stim[4000:26000, :], f_span.stim)
+
+
+def test_easygz_time_span(tmp_path):
+    """ With a time_span, .easy.gz files are read from their index. The result must be the same as slicing."""
+    filepath = str(tmp_path / 'synthetic.easy.gz')
+    writeEasy(filepath, num_channels=8, samples=15000)
+    f_all = Frida(filepath)
+    f_span = Frida(filepath, time_span=[4, 26])
+
+    assert f_span.c.reader.index is not None
+    assert np.array_equal(f_all.eeg[2000:13000, :], f_span.eeg)
+    assert np.array_equal(f_all.time[2000:13000], f_span.time)
+    assert np.array_equal(f_all.markers[2000:13000], f_span.markers)
+
+
+def test_lazy_capsule_whole(tmp_path):
+    """ Without time_span, Frida on a lazy .easy.gz Capsule (empty np_ arrays) reads the whole file."""
+    filepath = str(tmp_path / 'synthetic.easy.gz')
+    writeEasy(filepath, num_channels=8, samples=15000)
+    f_all = Frida(filepath)
+    c = Capsule(filepath, lazy=True, cache=False)
+    assert len(c.np_eeg) == 0 and c.reader is not None
+    f_lazy = Frida(filepath, capsule=c)
+    assert f_lazy.good_init and np.array_equal(f_all.eeg, f_lazy.eeg)
+    assert np.array_equal(f_all.time, f_lazy.time) and np.array_equal(f_all.markers, f_lazy.markers)
+
+
+@pytest.mark.parametrize('epoch_length', [10., 2.3333])
+def test_QC_epochs(tmp_path, epoch_length):
+    """ The bad channel-epochs found at once are the same as checking every channel-epoch independently."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=5000)
+    f = Frida(filepath)
+    rng = np.random.RandomState(0)
+    f.eeg = (rng.uniform(-1e4, 1e4, size=8) + rng.normal(0, 1, size=(60000, 8)) * np.linspace(5, 40, 8)).astype(
+        "float32")
+    f.eeg[10000:10300, 2] += 100
+    f.param['epoch_length'] = epoch_length
+    f.QC(plotit=False)
+
+    fs = f.c.fs
+    max_epochs = int((np.floor(f.eeg.shape[0] / fs) - epoch_length) / epoch_length)
+    expected = []
+    for timeskip in range(max_epochs):
+        for channel in range(8):
+            segment = np.array(np.arange(timeskip * epoch_length * fs, timeskip * epoch_length * fs +
+                                         epoch_length * fs), dtype="int32")
+            fl, maxAmp, STD = f._Frida__check_badepochs(f.eeg[segment, channel].flatten())
+            if fl:
+                expected.append([channel, timeskip, maxAmp, STD])
+    assert 0 < len(expected) < 8 * max_epochs
+    assert f.bad_records == expected
+
+
+def test_lazy_PSD(tmp_path, monkeypatch):
+    """ The PSDs are computed once per change of eeg, and they are the same as the Welch PSDs of every channel."""
+    from scipy.signal import welch
+    import nepy.frida.frida as frida_module
+    calls = []
+    monkeypatch.setattr(frida_module, 'welch', lambda *args, **kwargs: calls.append(1) or welch(*args, **kwargs))
+
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=15000)
+    f = Frida(filepath)
+    f.preprocess()
+    assert len(calls) == 0
+    PSD = f.PSD
+    assert f.PSD is PSD and len(calls) == 1
+
+    for ch in range(8):
+        freqs, Pxx = welch(f.eeg[:, ch], fs=f.c.fs, window='hann', nperseg=5000, noverlap=2500)
+        assert np.array_equal(freqs, PSD['frequencies'])
+        assert np.allclose(Pxx, PSD['PSDs'][ch], rtol=1e-4, atol=1e-6 * np.max(Pxx))
+
+    f.preprocess(['reset'])
+    assert f.PSD is not PSD and len(calls) == 2
+
+
+@pytest.mark.parametrize('pipeline', [['reset', 'rereference', 'detrend', 'remove_line_freq', 'bandpassfilter'],
+                                      ['reset', 'bandpassfilter', 'detrend']])
+def test_preprocess_blocks(tmp_path, pipeline):
+    """ Preprocessing by blocks into a memory map gives the same eeg as preprocessing in memory."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=5000)
+    f = Frida(filepath)
+    rng = np.random.RandomState(0)
+    t = np.arange(90000) / f.c.fs
+    f.eeg_original = (rng.uniform(-1e4, 1e4, size=8) + np.cumsum(rng.normal(0, 1, size=(90000, 8)), axis=0) +
+                      10 * np.sin(2 * np.pi * 50 * t)[:, None]).astype("float32")
+    f.param['detrend_time'] = 7.
+    f.preprocess(pipeline)
+    expected, log = f.eeg.copy(), list(f.log)
+
+    f.preprocess(pipeline, out=str(tmp_path / 'preprocessed.npy'), block_seconds=20.)
+    assert isinstance(f.eeg, np.memmap) and f.eeg.dtype == expected.dtype
+    assert [entry[:12] for entry in f.log[len(log):]] == [entry[:12] for entry in log[1:]]
+    assert np.max(np.abs(f.eeg - expected)) < 1e-4
+    assert np.array_equal(np.load(str(tmp_path / 'preprocessed.npy')), f.eeg)
+
+
+def test_precision_report(tmp_path):
+    """ The float32 pipeline keeps float32 in every step and deviates from the float64 path within 1e-5 (relative)."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=15000)
+    f = Frida(filepath)
+    f.preprocess()
+    assert f.dtype == np.float32 and f.eeg.dtype == np.float32
+    processed = f.eeg
+
+    report = f.precisionReport()
+    assert [entry['step'] for entry in report] == ['reset', 'rereference', 'detrend', 'remove_line_freq',
+                                                   'bandpassfilter']
+    assert all(entry['relative_deviation'] < 1e-5 for entry in report)
+    assert f.eeg is processed
+
+    f64 = Frida(filepath, dtype='float64')
+    f64.preprocess()
+    assert f64.eeg.dtype == np.float64
+    assert np.max(np.abs(processed - f64.eeg)) == report[-1]['max_deviation']
+
+
+def test_copy_on_read(tmp_path):
+    """ Frida works on views of the Capsule eeg until a step writes a new array, or eeg is read from outside."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=15000, stim=True)
+    f = Frida(filepath)
+    assert np.shares_memory(f.eeg_original, f.c.np_eeg)
+    f.QC(plotit=False)
+    f.preprocess(pipeline=['rereference'])
+    assert not np.shares_memory(f.eeg, f.c.np_eeg)
+    f.preprocess(pipeline=['reset'])
+    eeg = f.eeg  # read from outside: a private, writable copy
+    assert eeg.flags.writeable and not np.shares_memory(eeg, f.c.np_eeg)
+    eeg[:, 0] = 0.
+    assert f.eeg is eeg and np.any(f.eeg_original[:, 0] != 0.)
+
+    c = f.c
+    f = Frida(filepath, capsule=c, time_span=[4, 26])
+    assert np.shares_memory(f.eeg_original, c.np_eeg)
+    f.releaseRaw()
+    assert f.eeg_original.shape == (11000, 8) and f.c is not c and f.c.electrodes == c.electrodes
+    assert c.np_eeg.shape == (15000, 8) and c.np_stim.shape == (30000, 8)  # the Capsule is not modified
+    for values in [f.eeg_original, f.time, f.markers, f.stim]:
+        assert not np.shares_memory(values, c.np_eeg) and (values.base is None or values.base.size == values.size)
+    assert not any(name.startswith('np_') for name in vars(f.c)) and f.c.reader is None
+    assert np.array_equal(f.eeg, c.np_eeg[2000:13000]) and np.array_equal(f.stim, c.np_stim[4000:26000])
+
+
+def test_shared_capsule_spans(tmp_path):
+    """ Frida objects of different time spans on the same Capsule: every one has the streams of its span."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=15000, stim=True)
+    f_all = Frida(filepath)
+    f_wide = Frida(filepath, capsule=f_all.c, time_span=[4, 26])
+    f_narrow = Frida(filepath, capsule=f_all.c, time_span=[10, 20])
+    assert f_all.c.np_time.shape == (15000,)
+    for f, (first, last) in [(f_wide, (2000, 13000)), (f_narrow, (5000, 10000))]:
+        assert np.array_equal(f.eeg, f_all.eeg[first:last])
+        assert f.time[0] == first / 500. and np.array_equal(f.time, f_all.c.np_time[first:last])
+        assert np.array_equal(f.markers, f_all.c.np_markers[first:last])
+        assert np.array_equal(f.stim, f_all.c.np_stim[2 * first:2 * last])
+
+    parameters = defaultParameters()
+    parameters['reference_electrodes'] = ['Ch2', 'Ch3']
+    f_other = Frida(filepath, capsule=f_all.c, parameters=parameters)
+    f_all.preprocess(pipeline=['rereference'])
+    f_other.preprocess(pipeline=['rereference'])
+    assert f_all.reference_electrodes == ['Cz'] and f_other.reference_electrodes == ['Ch2', 'Ch3']
+    assert not hasattr(f_all.c, 'reference_electrodes')
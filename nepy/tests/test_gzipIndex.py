@@ -0,0 +1,50 @@
+"""
+Test to the gzipIndex class of nepy, on synthetic .easy.gz files (see synthetic_data.py).
+
+2019 Neuroelectrics Barcelona
+"""
+
+import gzip
+import os
+
+import numpy as np
+import pytest
+
+from nepy.readers.gzipIndex import gzipIndex
+from nepy.tests.synthetic_data import writeEasy
+
+pytestmark = pytest.mark.skipif(not gzipIndex.available, reason='zlib library not found')
+
+
+def test_read_rows(tmp_path):
+    """ Rows and byte ranges read from the access points are the same as inflating the whole stream."""
+    filepath = str(tmp_path / 'synthetic.easy.gz')
+    writeEasy(filepath, num_channels=32, samples=20000, info=False)
+    with gzip.open(filepath, 'rb') as fil:
+        text = fil.read()
+    lines = text.splitlines(True)
+
+    idx = gzipIndex(filepath, span=2 ** 18, verbose=False)
+    assert idx.points > 5 and idx.size == len(text) and idx.rows == 20000
+    rng = np.random.RandomState(0)
+    for first in list(rng.randint(0, 20000, size=20)) + [0, 19999]:
+        last = first + rng.randint(0, 3000)
+        assert idx.readRows(first, last) == b''.join(lines[first:last])
+        offset = rng.randint(0, len(text))
+        assert idx.read(offset, 100000) == text[offset:offset + 100000]
+
+
+def test_sidecar(tmp_path):
+    """ The index is saved next to the file, reused, and built again when the file changes."""
+    filepath = str(tmp_path / 'synthetic.easy.gz')
+    writeEasy(filepath, num_channels=8, samples=5000, info=False)
+    idx = gzipIndex(filepath, span=2 ** 16, verbose=False)
+    assert os.path.isfile(filepath + '.gzidx')
+
+    mtime = os.path.getmtime(filepath + '.gzidx')
+    assert gzipIndex(filepath, span=2 ** 16, verbose=False).rows == idx.rows
+    assert os.path.getmtime(filepath + '.gzidx') == mtime
+
+    writeEasy(filepath, num_channels=8, samples=6000, info=False, seed=1)
+    os.utime(filepath, ns=(0, os.stat(filepath).st_mtime_ns + 10 ** 9))
+    assert gzipIndex(filepath, span=2 ** 16, verbose=False).rows == 6000
@@ -0,0 +1,90 @@
+"""
+Test to the nedfReader class of nepy, on synthetic files (see synthetic_data.py),
+that do not need the test data of test_data.py.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from nepy.readers.nedfReader import nedfReader
+from nepy.tests.synthetic_data import writeNedf
+
+
+@pytest.mark.parametrize("settings", [
+    {'version': '1.4', 'acc': True, 'stim': False, 'samples': 5003},
+    {'version': '1.4', 'acc': False, 'stim': False, 'samples': 2000},
+    {'version': '1.4', 'acc': True, 'stim': True, 'samples': 4001},
+    {'version': '1.4', 'acc': False, 'stim': True, 'eeg': False, 'samples': 3000},
+    {'version': '1.2', 'samples': 2502},
+])
+def test_decode_records(tmp_path, settings):
+    """ Test the record decoder with synthetic files (see synthetic_data.py), whose raw content is known."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    raw = writeNedf(filepath, num_channels=8, **settings)
+    rdr = nedfReader(filepath)
+    samples = settings['samples']
+
+    assert len(rdr.np_markers) == samples
+    assert np.array_equal(raw['markers'].astype("float32"), rdr.np_markers)
+    assert np.array_equal(np.float32(np.arange(samples) * 2 / 1000.), rdr.np_time)
+    if settings.get('eeg', True):
+        eeg = np.float32(raw['eeg'] * 2.4 * 1000000000 / 6.0 / 8388607.0) / np.float32(1000.)
+        assert np.array_equal(eeg, rdr.np_eeg)
+    else:
+        assert len(rdr.np_eeg) == 0
+    if settings.get('stim', False):
+        assert np.array_equal(raw['stim'].astype("float32"), rdr.np_stim)
+    if settings.get('acc', True):
+        assert np.array_equal(raw['acc'].astype("float32"), rdr.np_acc)
+    else:
+        assert len(rdr.np_acc) == 0
+
+
+def test_truncated_file(tmp_path):
+    """ A file with an incomplete last record is read up to the last complete record."""
+    filepath = str(tmp_path / 'truncated.nedf')
+    raw = writeNedf(filepath, num_channels=8, samples=1000, stim=True)
+    with open(filepath, 'rb+') as fil:
+        fil.truncate(os.path.getsize(filepath) - 10)
+    rdr = nedfReader(filepath)
+    assert len(rdr.np_eeg) == len(rdr.np_markers) == len(rdr.np_time) == 999
+    assert len(rdr.np_stim) == 2 * 999
+    assert np.array_equal(raw['markers'][:999].astype("float32"), rdr.np_markers)
+
+
+def test_lazy_reader(tmp_path):
+    """ The memory mapped streams of lazy mode must give the same values as the arrays of the default mode."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=2003, stim=True)
+    rdr = nedfReader(filepath)
+    lazy = nedfReader(filepath, lazy=True)
+    for stream in ['np_eeg', 'np_stim', 'np_acc', 'np_markers', 'np_time']:
+        eager, mapped = getattr(rdr, stream), getattr(lazy, stream)
+        assert eager.shape == mapped.shape
+        assert np.array_equal(eager, np.asarray(mapped))
+        for rows in [slice(7, 1234), slice(-11, None), slice(None, None, -3), 42, [5, 3, 400]]:
+            assert np.array_equal(eager[rows], mapped[rows])
+            if eager.ndim == 2:
+                assert np.array_equal(eager[rows, 1], mapped[rows, 1])
+                assert np.array_equal(eager[rows, 2:5], mapped[rows, 2:5])
+
+
+def test_read_window(tmp_path):
+    """ Windows read from the file must match the same slice of the fully decoded arrays."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=3004, stim=True)
+    rdr = nedfReader(filepath)
+    for first, last in [(0, 3004), (1, 2), (7, 1503), (2000, 3004), (3001, 5000)]:
+        window = rdr.readRecords(first, last)
+        assert np.array_equal(rdr.np_eeg[first:last], window['np_eeg'])
+        assert np.array_equal(rdr.np_stim[2 * first:2 * last], window['np_stim'])
+        assert np.array_equal(rdr.np_acc[-(-first // 5):-(-last // 5)], window['np_acc'])
+        assert np.array_equal(rdr.np_markers[first:last], window['np_markers'])
+        assert np.array_equal(rdr.np_time[first:last], window['np_time'])
+
+    window = rdr.readWindow(2., 4., channels=['Ch3', 0])
+    assert np.array_equal(rdr.np_eeg[1000:2000, [2, 0]], window['np_eeg'])
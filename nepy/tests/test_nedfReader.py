@@ -27,7 +27,7 @@ def get_nedf_readers(dataSet):
     :return: a list of the readers for all files.
     """
     if os.path.isdir(testpath) is False:
-        pytest.exit('The the -testfiles- folder path of your computer does not match with the one written '
+        pytest.skip('The the -testfiles- folder path of your computer does not match with the one written '
                     'in test_data.py (testpath) ')
     rdrs = {}  # Dictionary containing a reader per test file.
     for file in dataSet:
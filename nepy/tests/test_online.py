@@ -0,0 +1,49 @@
+"""
+Test to FridaOnline (nepy.frida.online): pushing a recording by blocks gives the same result as processing it at once.
+
+2019 Neuroelectrics Barcelona
+"""
+
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi
+
+from nepy.frida.channelStats import ChannelStats
+from nepy.frida.filters import bandpassSOS, notchSOS
+from nepy.frida.frida import defaultParameters
+from nepy.frida.online import FridaOnline
+
+electrodes = ['P7', 'P4', 'Cz', 'Pz', 'P3', 'P8', 'O1', 'O2']
+
+
+def test_push_blocks():
+    """ Blocks of any length, filter state carried between blocks: the same as filtering the whole recording."""
+    rng = np.random.RandomState(0)
+    eeg = (rng.uniform(-1e4, 1e4, size=8) + np.cumsum(rng.normal(0, 1, size=(20000, 8)), axis=0)).astype("float32")
+
+    online = FridaOnline(electrodes, fs=500.)
+    ends = np.cumsum(rng.randint(1, 200, size=200))
+    ends = np.concatenate([[0], ends[ends < len(eeg)], [len(eeg)]])
+    processed = np.concatenate([online.push(eeg[first:last]) for first, last in zip(ends[:-1], ends[1:])])
+
+    referenced = eeg - eeg[:, [2]]
+    sos = np.vstack([notchSOS(50., 30., 500.), bandpassSOS(2., 45., 500., 5)])
+    expected = sosfilt(sos, referenced, axis=0, zi=sosfilt_zi(sos)[:, :, None] * referenced[0][None, None, :])[0]
+    assert processed.dtype == np.float32 and processed.shape == eeg.shape
+    assert np.allclose(processed, expected, rtol=0, atol=1e-3)
+
+    stats = ChannelStats(eeg)
+    assert online.samples == len(eeg) and online.max_latency >= online.latency > 0
+    assert np.allclose(online.sigmas, stats.std) and np.allclose(online.offsets, stats.mean / 1000)
+    assert list(online.bad_chan['sigma']) == [0. if std > 15. else 1. for std in stats.std]
+
+    online.reset()
+    assert online.samples == 0 and online.offsets == [] and online.bad_chan == {}
+
+
+def test_average_reference():
+    """ Unknown reference electrodes ('ave'): average reference, as in Frida."""
+    parameters = defaultParameters()
+    parameters['reference_electrodes'] = ['ave']
+    online = FridaOnline(electrodes, parameters=parameters, pipeline=['rereference'])
+    block = np.arange(80, dtype="float32").reshape(10, 8)
+    assert np.array_equal(online.push(block), block - np.mean(block, axis=1)[:, None])
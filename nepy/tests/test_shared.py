@@ -0,0 +1,95 @@
+"""
+Test to the shared memory Capsules of nepy (see shared.py), on synthetic files (see synthetic_data.py).
+
+2019 Neuroelectrics Barcelona
+"""
+
+import gc
+import multiprocessing
+import pickle
+
+import numpy as np
+import pytest
+
+from nepy.capsule.capsule import Capsule
+from nepy.tests.synthetic_data import writeEasy, writeNedf
+
+
+def channelSums(capsule, queue):
+    """ Worker: sums of the channels of a Capsule, and whether its EEG is a view of a shared block."""
+    queue.put((capsule.np_eeg.sum(axis=0), capsule.shared is not None and not capsule.np_eeg.flags.writeable))
+
+
+@pytest.mark.parametrize('filename', ['synthetic.nedf', 'synthetic.easy'])
+def test_shared_capsule(tmp_path, filename):
+    """ Attached Capsules have the same arrays and metadata, as read-only views of the owner's block."""
+    filepath = str(tmp_path / filename)
+    if filename.endswith('.nedf'):
+        writeNedf(filepath, num_channels=8, samples=3000, stim=True)
+    else:
+        writeEasy(filepath, num_channels=8, samples=3000)
+    c = Capsule(filepath, cache=False)
+    original = {name: np.array(getattr(c, name)) for name in ['np_eeg', 'np_acc', 'np_markers', 'np_stim', 'np_time']}
+
+    name = c.to_shared()
+    assert c.to_shared() == name
+    w = Capsule.attach(name)
+    for field in original:
+        assert np.array_equal(getattr(c, field), original[field])
+        assert np.array_equal(getattr(w, field), original[field])
+    for field in ['eegstartdate', 'basename', 'fs', 'num_channels', 'electrodes', 'filenameroot', 'filepath']:
+        assert getattr(w, field) == getattr(c, field)
+    assert w.good_init and not w.np_eeg.flags.writeable
+    with pytest.raises(ValueError):
+        w.np_eeg[0, 0] = 0.
+
+    c.np_eeg[0, 0] = 1234.  # the same memory
+    assert w.np_eeg[0, 0] == 1234.
+    w.detach()
+    assert w.np_eeg is None and w.shared is None
+
+    c.detach(keep=True)
+    assert c.shared is None and c.np_eeg[0, 0] == 1234.
+    with pytest.raises(FileNotFoundError):
+        Capsule.attach(name)
+
+
+def test_shared_pickle(tmp_path):
+    """ Shared Capsules are pickled as the name of their block, and worker processes attach to it."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=30000)
+    c = Capsule(filepath, cache=False)
+    full = len(pickle.dumps(c))
+    c.to_shared()
+    assert len(pickle.dumps(c)) < 4096 < full
+    assert np.array_equal(pickle.loads(pickle.dumps(c)).np_eeg, c.np_eeg)
+
+    for method in ['fork', 'spawn']:
+        context = multiprocessing.get_context(method)
+        queue = context.Queue()
+        process = context.Process(target=channelSums, args=(c, queue))
+        process.start()
+        sums, shared = queue.get(timeout=60)
+        process.join()
+        assert np.allclose(sums, c.np_eeg.sum(axis=0)) and shared == (method == 'spawn')
+    assert np.array_equal(Capsule.attach(c.shared.name).np_eeg, c.np_eeg)  # the workers did not free the block
+
+    name = c.shared.name
+    del c  # the owner frees the block when it is deleted
+    with pytest.raises(FileNotFoundError):
+        Capsule.attach(name)
+
+
+def test_shared_views_outlive_capsule(tmp_path):
+    """ Arrays kept after detach, or after the Capsule is deleted, keep the mapping of the block open."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=3000)
+    c = Capsule(filepath, cache=False)
+    expected = c.np_eeg.sum(axis=0)
+    c.to_shared()
+    w = Capsule.attach(c.shared.name)
+    kept, owned = w.np_eeg, c.np_eeg
+    w.detach()
+    del c
+    gc.collect()
+    assert np.array_equal(kept.sum(axis=0), expected) and np.array_equal(owned.sum(axis=0), expected)
@@ -0,0 +1,125 @@
+"""
+Test to the NEPy stores (see store.py), on synthetic files (see synthetic_data.py).
+
+2019 Neuroelectrics Barcelona
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from nepy.capsule.capsule import Capsule
+from nepy.capsule.store import convertDirectory, storeReader
+from nepy.frida.frida import Frida
+from nepy.readers.easyReader import easyReader
+from nepy.readers.gzipIndex import gzipIndex
+from nepy.tests.synthetic_data import writeEasy, writeNedf
+
+streams = ['np_eeg', 'np_acc', 'np_markers', 'np_stim', 'np_time']
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+@pytest.mark.parametrize('filename', ['synthetic.nedf', 'synthetic.easy', 'synthetic.easy.gz'])
+def test_store_roundtrip(tmp_path, filename, compression):
+    """ A store has the same streams and metadata as the Capsule it was saved from, and slices like them."""
+    filepath = str(tmp_path / filename)
+    if filename.endswith('.nedf'):
+        writeNedf(filepath, num_channels=8, samples=12345, stim=True)
+    else:
+        writeEasy(filepath, num_channels=8, samples=12345)
+    c = Capsule(filepath, cache=False)
+    storepath = c.save_store(str(tmp_path / 'synthetic.nestore'), chunk_seconds=2., compression=compression)
+    s = Capsule.open_store(storepath)
+    assert s.good_init and s.reader is not None and s.filepath == storepath
+    for name in ['eegstartdate', 'basename', 'fs', 'num_channels', 'electrodes']:
+        assert getattr(s, name) == getattr(c, name)
+    for name in streams:
+        original = np.asarray(getattr(c, name), dtype="float32")
+        assert getattr(s, name).shape == original.shape
+        assert np.array_equal(np.asarray(getattr(s, name)), original), name
+
+    eeg = np.asarray(c.np_eeg)
+    assert np.array_equal(s.np_eeg[1234:5678, [1, 6]], eeg[1234:5678, [1, 6]])
+    assert np.array_equal(s.np_eeg[999:3001:7, 3], eeg[999:3001:7, 3])
+    assert np.array_equal(s.np_eeg[-1], eeg[-1])
+    window = s.reader.readWindow(3, 7, channels=['Ch2', 'Ch5'])
+    assert np.array_equal(window['np_eeg'], eeg[1500:3500, [1, 4]])
+    assert np.array_equal(window['np_time'], np.asarray(c.np_time)[1500:3500])
+    if filename.endswith('.nedf'):
+        assert np.array_equal(window['np_stim'], np.asarray(c.np_stim)[3000:7000, [1, 4]])
+        assert np.array_equal(window['np_acc'], np.asarray(c.np_acc)[300:700])
+
+
+@pytest.mark.parametrize('indexed', [True, False])
+def test_store_lazy_easy(tmp_path, monkeypatch, indexed):
+    """ Lazy .easy.gz Capsules, whose np_ arrays are empty, are saved with the streams of the file."""
+    filepath = str(tmp_path / 'synthetic.easy.gz')
+    writeEasy(filepath, num_channels=8, samples=12345)
+    full = Capsule(filepath, cache=False)
+    monkeypatch.setattr(gzipIndex, 'available', indexed and gzipIndex.available)
+    c = Capsule(filepath, cache=False, lazy=True)
+    assert len(c.np_eeg) == 0 and c.reader is not None
+    reads = []
+    readRecords = easyReader.readRecords
+    monkeypatch.setattr(easyReader, 'readRecords', lambda self, *args: reads.append(args) or readRecords(self, *args))
+    s = Capsule.open_store(c.save_store(str(tmp_path / 'synthetic.nestore'), chunk_seconds=2., compression='zlib'))
+    assert s.reader.samples == 12345
+    for name in streams:
+        assert np.array_equal(np.asarray(getattr(s, name)), np.asarray(getattr(full, name), dtype="float32")), name
+    assert len(reads) == (1 + 13 if c.reader.index is not None else 1)  # the first row, and every chunk once
+
+
+def test_store_window_reads(tmp_path, monkeypatch):
+    """ A window of a compressed store inflates just the blocks (chunks and channels) of the window."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=15000)
+    storepath = Capsule(filepath, cache=False).save_store(str(tmp_path / 'synthetic.nestore'), chunk_seconds=2.,
+                                                          compression='zlib')
+    s = Capsule.open_store(storepath)
+    blocks = []
+    readBlock = storeReader.readBlock
+    monkeypatch.setattr(storeReader, 'readBlock', lambda self, *args: blocks.append(args) or readBlock(self, *args))
+    s.np_eeg[2500:4500, [0, 3]]  # samples of the chunks 2 to 4 (1000 samples per chunk)
+    assert sorted(blocks) == [('np_eeg', chunk, column) for chunk in [2, 3, 4] for column in [0, 3]]
+
+
+def test_store_frida(tmp_path):
+    """ Frida on a store gives the same results as on the recording, with or without a time span."""
+    filepath = str(tmp_path / 'synthetic.nedf')
+    writeNedf(filepath, num_channels=8, samples=15000, stim=True)
+    storepath = Capsule(filepath, cache=False).save_store(str(tmp_path / 'synthetic.nestore'), compression='zlib')
+
+    f_file, f_store = Frida(filepath), Frida(storepath)
+    assert np.array_equal(f_file.eeg, f_store.eeg)
+    f_file.preprocess()
+    f_store.preprocess()
+    assert np.array_equal(f_file.eeg, f_store.eeg)
+
+    f_span = Frida(storepath, time_span=[4, 26])
+    assert np.array_equal(f_file.eeg_original[2000:13000], f_span.eeg)
+    assert np.array_equal(f_file.stim[4000:26000], f_span.stim)
+
+
+def test_convert_directory(tmp_path):
+    """ All the recordings of a directory are converted, the ones up to date are not converted again."""
+    datapath = tmp_path / 'data'
+    datapath.mkdir()
+    writeNedf(str(datapath / 'rec1.nedf'), num_channels=8, samples=6000)
+    writeEasy(str(datapath / 'rec2.easy.gz'), num_channels=8, samples=6000)
+    with open(str(datapath / 'rec3.nedf'), 'w') as fil:
+        fil.write('not a nedf file')
+    storepath = str(tmp_path / 'stores')
+
+    converted, skipped = convertDirectory(str(datapath), storepath, compression='zlib')
+    assert converted == [os.path.join(storepath, name) for name in ['rec1.nestore', 'rec2.nestore']]
+    assert skipped == [str(datapath / 'rec3.nedf')] and sorted(os.listdir(storepath)) == ['rec1.nestore',
+                                                                                          'rec2.nestore']
+    assert np.array_equal(Capsule.open_store(converted[1]).np_eeg[:],
+                          Capsule(str(datapath / 'rec2.easy.gz'), cache=False).np_eeg)
+
+    mtime = os.path.getmtime(converted[0])
+    assert convertDirectory(str(datapath), storepath)[0] == converted
+    assert os.path.getmtime(converted[0]) == mtime
+    convertDirectory(str(datapath), storepath, overwrite=True)
+    assert os.path.getmtime(converted[0]) >= mtime